@@ -0,0 +1,87 @@
+"""Loss/jitter driven rate control for the UDP sender.
+
+AdaptiveRateController is pure logic: feed it the loss fraction and jitter
+from each RTCP receiver report and it tells you when to move to a cheaper
+or a richer encoding level. Levels form a ladder from the best setting
+(largest resolution, highest fps, best quality) down to the cheapest one:
+JPEG quality is lowered first, then the frame rate, then the resolution,
+because that is roughly the order in which viewers notice the loss least.
+
+Hysteresis: stepping down needs ``degrade_after`` consecutive bad reports,
+stepping up needs ``upgrade_after`` consecutive good ones, and the
+thresholds for "bad" and "good" are apart, so a link sitting near a
+threshold does not make the stream oscillate.
+"""
+import time
+
+
+class RateLevel:
+    __slots__ = ("width", "height", "fps", "quality")
+
+    def __init__(self, width, height, fps, quality):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.quality = quality
+
+    def __eq__(self, other):
+        return isinstance(other, RateLevel) and (self.width, self.height, self.fps, self.quality) == (
+            other.width, other.height, other.fps, other.quality)
+
+    def __repr__(self):
+        return f"{self.width}x{self.height}@{self.fps} q={self.quality}"
+
+
+def build_ladder(resolutions, min_fps, max_fps, min_quality, max_quality, quality_step=10, fps_step=5):
+    """Levels from best to cheapest; ``resolutions`` is ordered largest first."""
+    width, height = resolutions[0]
+    qualities = list(range(max_quality, min_quality, -quality_step)) + [min_quality]
+    framerates = list(range(max_fps, min_fps, -fps_step)) + [min_fps]
+
+    ladder = [RateLevel(width, height, max_fps, q) for q in qualities]
+    ladder += [RateLevel(width, height, fps, min_quality) for fps in framerates[1:]]
+    ladder += [RateLevel(w, h, min_fps, min_quality) for w, h in resolutions[1:]]
+    return ladder
+
+
+class AdaptiveRateController:
+    def __init__(self, ladder, loss_high=0.05, loss_low=0.01, jitter_high=0.030, jitter_low=0.010,
+                 degrade_after=2, upgrade_after=5, min_interval=2.0):
+        self.ladder = ladder
+        self.loss_high = loss_high
+        self.loss_low = loss_low
+        self.jitter_high = jitter_high
+        self.jitter_low = jitter_low
+        self.degrade_after = degrade_after
+        self.upgrade_after = upgrade_after
+        self.min_interval = min_interval
+        self.index = 0
+        self._bad = 0
+        self._good = 0
+        self._last_change = 0.0
+
+    @property
+    def level(self):
+        return self.ladder[self.index]
+
+    def update(self, loss_fraction, jitter, now=None):
+        """Account for one receiver report; returns (new_level, reason) on a change, else None."""
+        now = time.monotonic() if now is None else now
+        bad = loss_fraction > self.loss_high or jitter > self.jitter_high
+        good = loss_fraction < self.loss_low and jitter < self.jitter_low
+        self._bad = self._bad + 1 if bad else 0
+        self._good = self._good + 1 if good else 0
+
+        if now - self._last_change < self.min_interval:
+            return None
+        if self._bad >= self.degrade_after and self.index < len(self.ladder) - 1:
+            self.index += 1
+            reason = f"loss {loss_fraction:.1%}, jitter {jitter * 1000:.1f} ms"
+        elif self._good >= self.upgrade_after and self.index > 0:
+            self.index -= 1
+            reason = f"link clean for {self._good} reports"
+        else:
+            return None
+        self._bad = self._good = 0
+        self._last_change = now
+        return self.level, reason
@@ -0,0 +1,307 @@
+"""Headless glass-to-glass benchmark for the UDP streaming path.
+
+Runs the sender pipeline with videotestsrc in place of v4l2src and the
+receive pipeline used by receiver.py/layout.py in two separate processes over
+loopback UDP, with no display. Every frame carries its capture time through
+the stream_metrics timestamp beacon, so the receiver can report end-to-end
+latency percentiles next to the per-stage numbers.
+
+    python benchmark.py --width 1280 --height 720 --fps 30 --quality 70 --duration 30
+    python benchmark.py --codec h264 --bitrate 1500 --keyframe-interval 30
+
+The report (stdout, and --json) covers latency p50/p95/p99 per stage,
+sustained displayed fps, frames dropped on the way, and CPU / RSS per process.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from frame_mailbox import LatestFrameMailbox
+from pipelines import CODECS, EncoderSettings, get_codec, udp_receiver, udp_sender
+from stream_metrics import (
+    CaptureProbe, MetricsRegistry, StageProbe, TimestampBeaconReceiver, TimestampBeaconSender, record_display,
+)
+
+SENDER_DELAY = 1.0  # seconds the receiver starts before the sender, so the first frames are not lost
+
+
+def sender_pipeline(args):
+    source = (
+        f"videotestsrc is-live=true pattern={args.pattern} name=camera ! "
+        f"video/x-raw,width={args.width},height={args.height},framerate={args.fps}/1 ! "
+        "videoconvert ! video/x-raw,format=I420"
+    )
+    settings = EncoderSettings(args.bitrate, args.keyframe_interval, args.quality)
+    return udp_sender(get_codec(args.codec), settings, "127.0.0.1", args.port, source) + " sync=false"
+
+
+def receiver_pipeline(args):
+    return (
+        f"{udp_receiver(get_codec(args.codec), args.port)} ! videoconvert ! videoscale ! "
+        f"video/x-raw,format=RGBx,width={args.display_width},height={args.display_height} ! "
+        "appsink name=sink emit-signals=true max-buffers=1 drop=true sync=false"
+    )
+
+
+def run_pipeline(pipeline, metrics, args, result_file, on_stop=None):
+    """Play ``pipeline`` for warm-up + duration, then write the metrics summary to ``result_file``."""
+    pipeline.set_state(Gst.State.PLAYING)
+    bus = pipeline.get_bus()
+    warmup_end = time.monotonic() + args.warmup
+    end = warmup_end + args.duration + args.linger
+    warmed_up = False
+    error = None
+    while time.monotonic() < end:
+        msg = bus.timed_pop_filtered(100 * Gst.MSECOND, Gst.MessageType.ERROR | Gst.MessageType.EOS)
+        if msg and msg.type == Gst.MessageType.ERROR:
+            error = str(msg.parse_error()[0])
+            break
+        if msg:
+            break
+        if not warmed_up and time.monotonic() >= warmup_end:
+            metrics.reset()
+            warmed_up = True
+            measure_start = time.monotonic()
+    elapsed = time.monotonic() - measure_start if warmed_up else 0.0
+    if on_stop:
+        on_stop()
+    pipeline.set_state(Gst.State.NULL)
+
+    summary = metrics.summary()
+    summary["elapsed"] = elapsed
+    summary["error"] = error
+    with open(result_file, "w") as f:
+        json.dump(summary, f)
+
+
+def run_sender(args):
+    Gst.init(None)
+    args.linger = 0.0
+    pipeline = Gst.parse_launch(sender_pipeline(args))
+    metrics = MetricsRegistry("sender", window=args.warmup + args.duration + 5)
+    CaptureProbe(pipeline.get_by_name("camera"), metrics)
+    StageProbe(pipeline.get_by_name("encoder"), "encode", metrics)
+    StageProbe(pipeline.get_by_name("pay"), "payload", metrics)
+    TimestampBeaconSender(pipeline.get_by_name("pay"), "127.0.0.1", args.port + 2)
+    run_pipeline(pipeline, metrics, args, args.result_file)
+
+
+def run_receiver(args):
+    Gst.init(None)
+    # Started SENDER_DELAY before the sender: warm up that much longer so both ends measure
+    # the same window, then linger so the last frames in flight still arrive
+    args.warmup += SENDER_DELAY
+    args.linger = 1.0
+    pipeline = Gst.parse_launch(receiver_pipeline(args))
+    metrics = MetricsRegistry("receiver", window=args.warmup + args.duration + 5)
+    StageProbe(pipeline.get_by_name("depay"), "depayload", metrics)
+    StageProbe(pipeline.get_by_name("decoder"), "decode", metrics)
+    beacons = TimestampBeaconReceiver(metrics, port=args.port + 2)
+    beacons.attach(pipeline.get_by_name("depay"))
+
+    # Same handoff as the GUI: the streaming thread publishes, a "render" thread
+    # takes the newest frame once per tick and maps it as the blit would
+    mailbox = LatestFrameMailbox()
+    stopping = threading.Event()
+
+    def on_new_sample(sink):
+        sample = sink.emit("pull-sample")
+        if sample:
+            mailbox.publish((sample, time.monotonic()))
+        return Gst.FlowReturn.OK
+
+    def render_loop():
+        while not stopping.wait(args.render_interval):
+            item = mailbox.take()
+            if item is None:
+                continue
+            sample, arrived = item
+            buf = sample.get_buffer()
+            success, map_info = buf.map(Gst.MapFlags.READ)
+            if success:
+                buf.unmap(map_info)
+            record_display(metrics, sample, arrived, beacons)
+            metrics.set_gauge("frames_dropped_display", mailbox.dropped)
+
+    pipeline.get_by_name("sink").connect("new-sample", on_new_sample)
+    render_thread = threading.Thread(target=render_loop, daemon=True)
+    render_thread.start()
+
+    def stop():
+        stopping.set()
+        render_thread.join()
+        beacons.close()
+
+    run_pipeline(pipeline, metrics, args, args.result_file, stop)
+
+
+def child_command(args, role, result_file):
+    command = [sys.executable, os.path.abspath(__file__), "--role", role, "--result-file", result_file]
+    for name in ("codec", "bitrate", "keyframe_interval",
+                 "width", "height", "fps", "quality", "pattern", "port", "duration", "warmup",
+                 "display_width", "display_height", "render_interval"):
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    return command
+
+
+def sample_cpu(processes, stop, samples):
+    """Sample CPU% and RSS of each child once a second until ``stop`` is set."""
+    try:
+        import psutil
+    except ImportError:
+        print("psutil not installed; CPU and memory will not be reported")
+        return
+    handles = {role: psutil.Process(p.pid) for role, p in processes.items()}
+    for handle in handles.values():
+        handle.cpu_percent(None)
+    while not stop.wait(1.0):
+        for role, handle in handles.items():
+            try:
+                samples[role].append((handle.cpu_percent(None), handle.memory_info().rss))
+            except psutil.NoSuchProcess:
+                pass
+
+
+def latency_ms(summary, stage, field):
+    value = summary.get("latency", {}).get(stage, {}).get(field)
+    return None if value is None else value * 1000
+
+
+def report(args, results, cpu):
+    sender, receiver = results["sender"], results["receiver"]
+    counters = receiver.get("counter", {})
+    displayed = counters.get("frames_displayed", {}).get("total", 0)
+    captured = sender.get("counter", {}).get("frames_captured", {}).get("total", 0)
+    # Both ends measure from the end of the sender's warm-up (the receiver starts
+    # SENDER_DELAY earlier and warms up that much longer); the receiver's linger only
+    # catches frames that were already in flight
+    elapsed = args.duration
+
+    stages = []
+    for role, summary in (("sender", sender), ("receiver", receiver)):
+        for stage in summary.get("latency", {}):
+            stages.append({
+                "process": role,
+                "stage": stage,
+                **{q: latency_ms(summary, stage, q) for q in ("p50", "p95", "p99")},
+                "count": summary["latency"][stage].get("count"),
+            })
+
+    result = {
+        "config": {k: getattr(args, k) for k in ("codec", "bitrate", "keyframe_interval",
+                                                  "width", "height", "fps", "quality", "duration")},
+        "stages_ms": stages,
+        "fps_sent": captured / elapsed if elapsed else 0.0,
+        "fps_displayed": displayed / elapsed if elapsed else 0.0,
+        "frames_captured": captured,
+        "frames_displayed": displayed,
+        "frames_dropped": max(0, captured - displayed),
+        "frames_dropped_display": receiver.get("gauge", {}).get("frames_dropped_display", {}).get("value", 0),
+        "rtp_packets_lost": counters.get("rtp_packets_lost", {}).get("total", 0),
+        "cpu": {},
+        "errors": {role: r.get("error") for role, r in results.items() if r.get("error")},
+    }
+    for role, samples in cpu.items():
+        if samples:
+            result["cpu"][role] = {
+                "cpu_percent_avg": sum(c for c, _ in samples) / len(samples),
+                "cpu_percent_max": max(c for c, _ in samples),
+                "rss_mb_max": max(r for _, r in samples) / 1e6,
+            }
+
+    def fmt(value):
+        return "    -" if value is None else f"{value:7.2f}"
+
+    if args.codec == "mjpeg":
+        encoder = f"MJPEG q={args.quality}"
+    else:
+        encoder = f"{args.codec.upper()} {args.bitrate} kbit/s gop={args.keyframe_interval}"
+    print(f"\n{args.width}x{args.height}@{args.fps} {encoder}, {args.duration}s")
+    print(f"{'process':10} {'stage':12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in stages:
+        print(f"{row['process']:10} {row['stage']:12} {fmt(row['p50'])} {fmt(row['p95'])} {fmt(row['p99'])}")
+    print(f"fps sent {result['fps_sent']:.2f}, displayed {result['fps_displayed']:.2f}; "
+          f"dropped {result['frames_dropped']} frames ({result['frames_dropped_display']} at display), "
+          f"{result['rtp_packets_lost']} RTP packets lost")
+    for role, usage in result["cpu"].items():
+        print(f"{role:10} cpu avg {usage['cpu_percent_avg']:.1f}% max {usage['cpu_percent_max']:.1f}%, "
+              f"rss {usage['rss_mb_max']:.1f} MB")
+    for role, error in result["errors"].items():
+        print(f"{role} error: {error}")
+    return result
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        result_files = {role: os.path.join(tmp, f"{role}.json") for role in ("receiver", "sender")}
+        processes = {}
+        # Receiver first so the first frames are not lost to a closed port
+        processes["receiver"] = subprocess.Popen(child_command(args, "receiver", result_files["receiver"]))
+        time.sleep(SENDER_DELAY)
+        processes["sender"] = subprocess.Popen(child_command(args, "sender", result_files["sender"]))
+
+        # CPU is only sampled after the warm-up, like the latency numbers
+        time.sleep(args.warmup)
+        stop = threading.Event()
+        cpu = {role: [] for role in processes}
+        sampler = threading.Thread(target=sample_cpu, args=(processes, stop, cpu), daemon=True)
+        sampler.start()
+        for process in processes.values():
+            process.wait()
+        stop.set()
+        sampler.join()
+
+        results = {}
+        for role, path in result_files.items():
+            try:
+                with open(path) as f:
+                    results[role] = json.load(f)
+            except (OSError, ValueError):
+                results[role] = {"error": f"{role} produced no result"}
+
+    result = report(args, results, cpu)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0 if not result["errors"] else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mjpeg")
+    parser.add_argument("--bitrate", type=int, default=2000, help="kbit/s (H.264/H.265)")
+    parser.add_argument("--keyframe-interval", type=int, default=30, help="frames (H.264/H.265)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality (MJPEG)")
+    parser.add_argument("--pattern", default="ball", help="videotestsrc pattern")
+    parser.add_argument("--port", type=int, default=5600, help="RTP port; port+2 carries the timestamp beacon")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds discarded before measuring")
+    parser.add_argument("--display-width", type=int, default=960)
+    parser.add_argument("--display-height", type=int, default=540)
+    parser.add_argument("--render-interval", type=float, default=0.016, help="GUI tick being emulated, seconds")
+    parser.add_argument("--json", help="also write the report here")
+    parser.add_argument("--role", choices=("sender", "receiver"), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.role == "sender":
+        run_sender(args)
+    elif args.role == "receiver":
+        run_receiver(args)
+    else:
+        sys.exit(main(args))
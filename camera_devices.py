@@ -0,0 +1,264 @@
+"""Capture device discovery shared by the GUI and the RTSP server.
+
+CameraRegistry keeps a cached list of capture devices and the modes
+(format, resolution, frame rates) each one offers. A background thread
+follows Gst.DeviceMonitor hotplug messages, or rescans /dev every couple of
+seconds when no monitor is available, so lookups from the GUI never block
+on device I/O. ``version`` goes up on every change; callers poll it.
+
+capture_source() uses the same modes to pick the capture stage for the
+senders: a camera that offers MJPEG at the wanted size is streamed with its
+own JPEG frames, without decoding and re-encoding them.
+"""
+import fcntl
+import glob
+import os
+import re
+import struct
+import threading
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from pipelines import camera_source, mjpeg_camera_source
+
+VIDIOC_QUERYCAP = 0x80685600       # _IOR('V', 0, struct v4l2_capability)
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+_FRAMERATE = re.compile(r"framerate=\(fraction\)(\{[^}]*\}|\[[^\]]*\]|\d+/\d+)")
+
+
+def is_capture_node(path):
+    """True when the V4L2 node can capture video (metadata nodes such as video1 cannot)."""
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    try:
+        info = fcntl.ioctl(fd, VIDIOC_QUERYCAP, bytes(104))
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+    capabilities, device_caps = struct.unpack_from("<II", info, 84)
+    if capabilities & V4L2_CAP_DEVICE_CAPS:
+        capabilities = device_caps
+    return bool(capabilities & V4L2_CAP_VIDEO_CAPTURE)
+
+
+def _node_number(path):
+    return int(re.sub(r"\D", "", path) or 0)
+
+
+def list_camera_devices():
+    """Capture device nodes, e.g. ['/dev/video0', '/dev/video2']; empty when there are none."""
+    nodes = sorted(glob.glob("/dev/video*"), key=_node_number)
+    return [path for path in nodes if is_capture_node(path)]
+
+
+class CameraMode:
+    __slots__ = ("media", "format", "width", "height", "framerates")
+
+    def __init__(self, media, format, width, height, framerates):
+        self.media = media            # "video/x-raw" or "image/jpeg"
+        self.format = format          # e.g. "YUY2", "NV12", "MJPG"
+        self.width = width
+        self.height = height
+        self.framerates = framerates  # sorted fps values, highest first
+
+    def __repr__(self):
+        rates = "/".join(f"{fps:g}" for fps in self.framerates) or "?"
+        return f"{self.format} {self.width}x{self.height}@{rates}"
+
+
+def parse_modes(caps):
+    """Fixed-size modes out of device caps; ranges (e.g. from test sources) are skipped."""
+    modes = []
+    for i in range(caps.get_size() if caps else 0):
+        structure = caps.get_structure(i)
+        ok_w, width = structure.get_int("width")
+        ok_h, height = structure.get_int("height")
+        if not (ok_w and ok_h):
+            continue
+        media = structure.get_name()
+        format = "MJPG" if media == "image/jpeg" else structure.get_string("format") or media
+        rates = set()
+        match = _FRAMERATE.search(structure.to_string())
+        if match:
+            for num, den in re.findall(r"(\d+)/(\d+)", match.group(1)):
+                if int(den) and int(num):
+                    rates.add(int(num) / int(den))
+        modes.append(CameraMode(media, format, width, height, sorted(rates, reverse=True)))
+    return modes
+
+
+class CameraInfo:
+    __slots__ = ("path", "name", "modes")
+
+    def __init__(self, path, name, modes=()):
+        self.path = path
+        self.name = name
+        self.modes = list(modes)
+
+    def resolutions(self):
+        return sorted({(m.width, m.height) for m in self.modes}, reverse=True)
+
+    def summary(self):
+        return "\n".join(repr(mode) for mode in self.modes) or "capabilities unknown"
+
+    def offers(self, media, width, height):
+        return any(m.media == media and (m.width, m.height) == (width, height) for m in self.modes)
+
+
+def _device_path(device):
+    props = device.get_properties()
+    if props is None:
+        return None
+    for key in ("device.path", "api.v4l2.path"):
+        path = props.get_string(key)
+        if path and path.startswith("/dev/video"):
+            return path
+    return None
+
+
+class CameraRegistry:
+    def __init__(self, rescan_interval=2.0):
+        self.rescan_interval = rescan_interval
+        self.version = 0
+        self._cameras = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._monitor = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="camera-registry", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        if self._monitor:
+            self._monitor.stop()
+
+    def cameras(self):
+        """Snapshot of the known cameras, ordered by device path."""
+        with self._lock:
+            return [self._cameras[path] for path in sorted(self._cameras, key=_node_number)]
+
+    def get(self, path):
+        with self._lock:
+            return self._cameras.get(path)
+
+    def device_paths(self):
+        return [camera.path for camera in self.cameras()]
+
+    def _set(self, path, camera):
+        with self._lock:
+            if camera is None:
+                if self._cameras.pop(path, None) is None:
+                    return
+            else:
+                self._cameras[path] = camera
+            self.version += 1
+
+    def _add_device(self, device):
+        path = _device_path(device)
+        if path and is_capture_node(path):
+            self._set(path, CameraInfo(path, device.get_display_name(), parse_modes(device.get_caps())))
+
+    def _run(self):
+        Gst.init(None)
+        monitor = Gst.DeviceMonitor()
+        monitor.add_filter("Video/Source", None)
+        if not monitor.start():
+            print("Camera registry: no device monitor, rescanning /dev instead")
+            self._poll_nodes()
+            return
+        self._monitor = monitor
+        for device in monitor.get_devices():
+            self._add_device(device)
+
+        bus = monitor.get_bus()
+        wanted = Gst.MessageType.DEVICE_ADDED | Gst.MessageType.DEVICE_REMOVED
+        while not self._stop.is_set():
+            msg = bus.timed_pop_filtered(int(0.5 * Gst.SECOND), wanted)
+            if msg is None:
+                continue
+            if msg.type == Gst.MessageType.DEVICE_ADDED:
+                self._add_device(msg.parse_device_added())
+            else:
+                path = _device_path(msg.parse_device_removed())
+                if path:
+                    self._set(path, None)
+
+    def _poll_nodes(self):
+        while not self._stop.is_set():
+            current = set(list_camera_devices())
+            known = set(self.device_paths())
+            for path in current - known:
+                self._set(path, CameraInfo(path, os.path.basename(path)))
+            for path in known - current:
+                self._set(path, None)
+            self._stop.wait(self.rescan_interval)
+
+
+def probe_camera(path):
+    """CameraInfo for one device, looked up once (for scripts that do not run a registry)."""
+    Gst.init(None)
+    monitor = Gst.DeviceMonitor()
+    monitor.add_filter("Video/Source", None)
+    if monitor.start():
+        try:
+            for device in monitor.get_devices():
+                if _device_path(device) == path:
+                    return CameraInfo(path, device.get_display_name(), parse_modes(device.get_caps()))
+        finally:
+            monitor.stop()
+    # No monitor (or it missed the node): ask v4l2src for the caps it can produce
+    source = Gst.ElementFactory.make("v4l2src", None)
+    if source is None:
+        return None
+    source.set_property("device", path)
+    try:
+        if source.set_state(Gst.State.READY) == Gst.StateChangeReturn.FAILURE:
+            return None
+        return CameraInfo(path, os.path.basename(path), parse_modes(source.get_static_pad("src").query_caps(None)))
+    finally:
+        source.set_state(Gst.State.NULL)
+
+
+def capture_source(codec, device="/dev/video0", width=640, height=480, test_source=None, passthrough="auto",
+                   camera=None):
+    """(launch, passthrough): the capture stage for ``codec``, and whether it already delivers encoded frames.
+
+    ``passthrough`` is "auto" (when the camera offers MJPEG at width x height),
+    "always" or "never". ``test_source`` "raw" or "mjpeg" replaces the camera
+    with videotestsrc, optionally behind jpegenc to fake an MJPEG camera.
+    ``camera`` is the device's CameraInfo if the caller already has it.
+    """
+    if codec.name != "mjpeg" or passthrough == "never":
+        use = False
+    elif passthrough == "always":
+        use = True
+    elif test_source:
+        use = test_source == "mjpeg"
+    else:
+        camera = camera or probe_camera(device)
+        use = bool(camera and camera.offers("image/jpeg", width, height))
+        if not use:
+            print(f"{device}: no MJPEG at {width}x{height}, encoding raw frames")
+    if use:
+        print(f"{'test source' if test_source else device}: passing camera MJPEG through without re-encoding")
+        return mjpeg_camera_source(device, width, height, bool(test_source)), True
+    return camera_source(device, width, height, bool(test_source)), False
+
+
+def get_available_cameras(registry=None):
+    """Camera paths for the input dropdown, from ``registry``'s cache when one is given."""
+    cameras = registry.device_paths() if registry else list_camera_devices()
+    return cameras or ["No Camera Found"]
@@ -0,0 +1,327 @@
+"""Binary detection log with a background writer, rotation and a query tool.
+
+A recording directory holds:
+
+* ``detections-<time>-<n>.bin``: a 16-byte header followed by fixed-size
+  RECORD_DTYPE records (DETECTION_DTYPE plus a camera id), appended one
+  chunk per flush. Files can be memory-mapped as a NumPy array.
+* ``detections-<time>-<n>.idx``: one CHUNK_ENTRY per chunk (first record,
+  record count, min and max timestamp), written after the chunk itself, so
+  a chunk that was cut short by a crash is never referenced.
+* ``cameras.json``: camera name -> id and the label list of each camera,
+  which is what class ids index. The list is only ever appended to; class
+  ids from each connection are remapped to it by name before writing.
+
+DetectionRecorder.record() only queues; a writer thread batches records
+into chunks, fsyncs at most every ``fsync_interval`` seconds and starts a
+new file when the current one exceeds ``max_file_bytes`` or
+``max_file_age``. query() reads the chunk indexes first and memory-maps
+only the chunks whose time range overlaps the query.
+
+    python detection_recorder.py recordings/ --start 2026-10-18T09:00 --camera stub/a.hef --class person
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from detection_records import DETECTION_DTYPE, Detections, LabelTable
+
+FILE_MAGIC = b"EDDL"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH8x")  # magic, version, record size
+CHUNK_ENTRY = struct.Struct("<QIdd")     # first record, count, min timestamp, max timestamp
+RECORD_DTYPE = np.dtype(DETECTION_DTYPE.descr + [("camera", "<u2")])
+CAMERAS_FILE = "cameras.json"
+
+
+class DetectionRecorder:
+    def __init__(self, directory, max_file_bytes=64 << 20, max_file_age=3600.0, flush_interval=0.5,
+                 fsync_interval=2.0, queue_size=4096):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_file_age = max_file_age
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(queue_size)
+        self.cameras = {}
+        self.records_written = 0
+        self.dropped = 0
+        self.files = 0
+        self._data = self._index = None
+        os.makedirs(directory, exist_ok=True)
+        self._load_cameras()
+        self._thread = threading.Thread(target=self._run, name="detection-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, source, detections):
+        """Queue one Detections message; never blocks, drops when the writer falls behind."""
+        if not len(detections.records):
+            return
+        try:
+            self.queue.put_nowait((source, detections))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def _load_cameras(self):
+        try:
+            with open(os.path.join(self.directory, CAMERAS_FILE)) as f:
+                self.cameras = json.load(f)
+        except (OSError, ValueError):
+            self.cameras = {}
+
+    def _camera_records(self, source, detections):
+        """RECORD_DTYPE copy of ``detections`` with class ids remapped to the camera's stored label list.
+
+        Each connection numbers its classes in its own LabelTable, so ids are
+        translated by name; the stored list only ever grows, and ids already
+        on disk keep their meaning.
+        """
+        camera = self.cameras.get(source)
+        changed = camera is None
+        if camera is None:
+            camera = self.cameras[source] = {"id": len(self.cameras), "labels": []}
+        stored = camera["labels"]
+        records = detections.records
+        class_ids = np.unique(records["class_id"])
+        remap = {}
+        for class_id in class_ids.tolist():
+            name = detections.labels.name_for(class_id)
+            if name not in stored:
+                stored.append(name)
+                changed = True
+            remap[class_id] = stored.index(name)
+        if changed:
+            self._save_cameras()
+        out = _with_camera(records, camera["id"])
+        if any(class_id != new_id for class_id, new_id in remap.items()):
+            out["class_id"] = [remap[class_id] for class_id in records["class_id"].tolist()]
+        return out
+
+    def _save_cameras(self):
+        path = os.path.join(self.directory, CAMERAS_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.cameras, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def _open_file(self):
+        self._close_file()
+        name = "detections-" + time.strftime("%Y%m%d-%H%M%S")
+        suffix = 0
+        while os.path.exists(os.path.join(self.directory, f"{name}-{suffix:03d}.bin")):
+            suffix += 1
+        base = os.path.join(self.directory, f"{name}-{suffix:03d}")  # names sort in recording order
+        self._data = open(base + ".bin", "wb")
+        self._index = open(base + ".idx", "wb")
+        self._data.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, RECORD_DTYPE.itemsize))
+        self._opened = time.monotonic()
+        self._file_records = 0
+        self.files += 1
+
+    def _close_file(self):
+        if self._data:
+            self._sync()
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def _sync(self):
+        self._data.flush()
+        self._index.flush()
+        os.fsync(self._data.fileno())
+        os.fsync(self._index.fileno())
+        self._last_sync = time.monotonic()
+
+    def _write_chunk(self, batch):
+        chunk = np.concatenate([self._camera_records(source, detections) for source, detections in batch])
+        if self._data is None or self._data.tell() >= self.max_file_bytes \
+                or time.monotonic() - self._opened >= self.max_file_age:
+            self._open_file()
+        self._data.write(chunk.tobytes())
+        # The index entry follows its data, so readers never see a chunk that is not there
+        self._data.flush()
+        timestamps = chunk["timestamp"]
+        self._index.write(CHUNK_ENTRY.pack(self._file_records, len(chunk), timestamps.min(), timestamps.max()))
+        self._file_records += len(chunk)
+        self.records_written += len(chunk)
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _run(self):
+        self._last_sync = time.monotonic()
+        batch = []
+        deadline = None
+        running = True
+        while running:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                running = False
+            elif item:
+                batch.append(item)
+                deadline = deadline or time.monotonic() + self.flush_interval
+            if batch and (not running or time.monotonic() >= deadline):
+                try:
+                    self._write_chunk(batch)
+                except OSError as e:
+                    print("Detection recorder write failed:", e)
+                    self.dropped += len(batch)
+                batch = []
+                deadline = None
+        self._close_file()
+
+
+def _with_camera(records, camera_id):
+    out = np.empty(len(records), RECORD_DTYPE)
+    for name in DETECTION_DTYPE.names:
+        out[name] = records[name]
+    out["camera"] = camera_id
+    return out
+
+
+def load_cameras(directory):
+    with open(os.path.join(directory, CAMERAS_FILE)) as f:
+        return json.load(f)
+
+
+def read_chunks(path):
+    """Chunk index entries of one .bin file."""
+    with open(path[:-4] + ".idx", "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % CHUNK_ENTRY.size
+    return list(CHUNK_ENTRY.iter_unpack(data[:usable]))
+
+
+def open_records(path):
+    """Memory-map the records of one .bin file."""
+    with open(path, "rb") as f:
+        magic, version, record_size = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != FILE_MAGIC or version != FILE_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a version {FILE_VERSION} detection log")
+    count = (os.path.getsize(path) - FILE_HEADER.size) // RECORD_DTYPE.itemsize  # ignores a torn last record
+    if count <= 0:
+        return np.empty(0, RECORD_DTYPE)
+    return np.memmap(path, RECORD_DTYPE, mode="r", offset=FILE_HEADER.size, shape=(count,))
+
+
+def query(directory, start=None, end=None, camera=None, class_name=None):
+    """Yield record arrays (RECORD_DTYPE) matching the filters, file by file, chunk by chunk."""
+    cameras = load_cameras(directory)
+    camera_id = None
+    if camera is not None:
+        if camera not in cameras:
+            return
+        camera_id = cameras[camera]["id"]
+    # Class names map to different ids per camera
+    class_ids = {}
+    if class_name is not None:
+        for info in cameras.values():
+            if class_name in info["labels"]:
+                class_ids[info["id"]] = info["labels"].index(class_name)
+
+    for path in sorted(glob.glob(os.path.join(directory, "detections-*.bin"))):
+        chunks = [c for c in read_chunks(path)
+                  if (start is None or c[3] >= start) and (end is None or c[2] <= end)]
+        if not chunks:
+            continue
+        records = open_records(path)
+        for first, count, _, _ in chunks:
+            chunk = records[first:first + count]
+            mask = np.ones(len(chunk), bool)
+            if start is not None:
+                mask &= chunk["timestamp"] >= start
+            if end is not None:
+                mask &= chunk["timestamp"] <= end
+            if camera_id is not None:
+                mask &= chunk["camera"] == camera_id
+            if class_name is not None:
+                wanted = np.zeros(len(chunk), bool)
+                for cam, class_id in class_ids.items():
+                    wanted |= (chunk["camera"] == cam) & (chunk["class_id"] == class_id)
+                mask &= wanted
+            if mask.any():
+                yield np.asarray(chunk[mask])
+
+
+class DetectionTimeline:
+    """One camera's recorded detections, looked up by seconds since ``start`` (for replay).
+
+    ``start`` is the wall-clock time of the video's first frame. Without it
+    offsets count from the first detection, which is only right if the
+    video starts with one.
+    """
+
+    def __init__(self, directory, camera=None, tolerance=0.02, start=None):
+        cameras = load_cameras(directory)
+        if camera is None:
+            if len(cameras) != 1:
+                raise ValueError(f"recording has cameras {', '.join(cameras)}; pick one")
+            camera = next(iter(cameras))
+        chunks = list(query(directory, camera=camera))
+        records = np.concatenate(chunks) if chunks else np.empty(0, RECORD_DTYPE)
+        self.records = records[np.argsort(records["timestamp"], kind="stable")]
+        self.labels = LabelTable(cameras[camera]["labels"])
+        if start is None:
+            start = float(self.records["timestamp"][0]) if len(self.records) else 0.0
+        self.start = start
+        self.times = self.records["timestamp"] - self.start
+        self.tolerance = tolerance
+
+    def at(self, seconds):
+        """[Detections] recorded closest to ``seconds`` into the recording, or [] if none is near."""
+        i = int(np.searchsorted(self.times, seconds))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.times)]
+        if not candidates:
+            return []
+        best = min(candidates, key=lambda j: abs(self.times[j] - seconds))
+        if abs(self.times[best] - seconds) > self.tolerance:
+            return []
+        lo = np.searchsorted(self.times, self.times[best], "left")
+        hi = np.searchsorted(self.times, self.times[best], "right")
+        return [Detections(self.records[lo:hi], self.labels)]
+
+
+def parse_time(text):
+    """Seconds since the epoch, or an ISO date/time in local time."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query a detection recording")
+    parser.add_argument("directory")
+    parser.add_argument("--start", type=parse_time, help="epoch seconds or ISO time")
+    parser.add_argument("--end", type=parse_time, help="epoch seconds or ISO time")
+    parser.add_argument("--camera", help="source name as shown in the launcher")
+    parser.add_argument("--class", dest="class_name", help="label name")
+    parser.add_argument("--limit", type=int, default=20, help="rows to print, 0 for a count only")
+    args = parser.parse_args()
+
+    names = {info["id"]: (camera, info["labels"]) for camera, info in load_cameras(args.directory).items()}
+    total = 0
+    for records in query(args.directory, args.start, args.end, args.camera, args.class_name):
+        for r in records[:max(args.limit - total, 0)]:
+            camera, labels = names.get(int(r["camera"]), ("?", []))
+            class_id = int(r["class_id"])
+            label = labels[class_id] if class_id < len(labels) else str(class_id)
+            when = datetime.datetime.fromtimestamp(r["timestamp"]).isoformat(timespec="milliseconds")
+            print(f"{when} {camera} frame {r['frame_id']} {label} {r['confidence']:.2f} "
+                  f"[{r['x1']:.0f}, {r['y1']:.0f}, {r['x2']:.0f}, {r['y2']:.0f}]")
+        total += len(records)
+    print(f"{total} detections")
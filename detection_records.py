@@ -0,0 +1,212 @@
+"""Compact detection records shared by the detector, the metadata server and the GUI.
+
+In memory, detections are a NumPy structured array of DETECTION_DTYPE, one
+fixed-size record per box. On the wire, binary version 1 is simply those
+records back to back (little-endian), framed by metadata_protocol. Older
+detectors that only speak JSON ({"boxex": [...], "confidence": ..., "label":
+...}) are converted into the same records on arrival, so everything
+downstream of the server only sees one format.
+
+A frame the detector processed without finding anything is sent as one
+record with class id NO_DETECTIONS (JSON: {"frame_id": ..., "timestamp":
+..., "empty": true}). It carries the frame id and timestamp only: the server
+strips it and keeps them as Detections.frame_id / timestamp, so the
+overlay can match the empty frame instead of waiting for it.
+"""
+import socket
+import time
+
+import numpy as np
+
+from metadata_protocol import METADATA_PORT, MessageDecoder, encode_binary, encode_message
+
+RECORD_VERSION = 1
+FORMAT_BINARY = f"binary/{RECORD_VERSION}"
+FORMAT_JSON = "json"
+SUPPORTED_FORMATS = (FORMAT_BINARY, FORMAT_JSON)  # server preference order
+NO_DETECTIONS = 0xFFFF  # class id of the record that marks a frame with no detections
+
+DETECTION_DTYPE = np.dtype([
+    ("frame_id", "<u8"),
+    ("timestamp", "<f8"),  # capture time, seconds since the epoch
+    ("class_id", "<u2"),
+    ("confidence", "<f4"),
+    ("x1", "<f4"),
+    ("y1", "<f4"),
+    ("x2", "<f4"),
+    ("y2", "<f4"),
+])
+
+
+class LabelTable:
+    """Maps class ids to label names for one source; grows as new JSON labels appear."""
+
+    def __init__(self, names=()):
+        self.names = [str(name) for name in names]
+        self._ids = {name: i for i, name in enumerate(self.names)}
+
+    def id_for(self, name):
+        name = str(name)
+        class_id = self._ids.get(name)
+        if class_id is None:
+            class_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return class_id
+
+    def name_for(self, class_id):
+        if 0 <= class_id < len(self.names):
+            return self.names[class_id]
+        return str(class_id)
+
+
+class Detections:
+    """One message worth of detections: records plus the label table their class ids index.
+
+    ``frame_id`` and ``timestamp`` are the message's first frame, known even
+    when it has no records; None if the detector did not say.
+    """
+
+    __slots__ = ("records", "labels", "frame_id", "timestamp")
+
+    def __init__(self, records, labels, frame_id=None, timestamp=None):
+        self.records = records
+        self.labels = labels
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_message(cls, records, labels):
+        """Detections for a received message, with NO_DETECTIONS markers turned into frame_id / timestamp."""
+        frame_id = timestamp = None
+        if len(records):
+            frame_id, timestamp = int(records["frame_id"][0]), float(records["timestamp"][0])
+            markers = records["class_id"] == NO_DETECTIONS
+            if markers.any():
+                records = records[~markers]
+        return cls(records, labels, frame_id, timestamp)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def encode_records(records):
+    """Encode a DETECTION_DTYPE array as a binary metadata frame."""
+    records = np.ascontiguousarray(records, dtype=DETECTION_DTYPE)
+    return encode_binary(RECORD_VERSION, records.tobytes())
+
+
+def decode_records(payload):
+    """Decode a version 1 payload; raises ValueError on a truncated payload."""
+    if len(payload) % DETECTION_DTYPE.itemsize:
+        raise ValueError("payload is not a whole number of detection records")
+    # The payload is a fresh bytearray slice, so the array can own it without a copy
+    return np.frombuffer(payload, dtype=DETECTION_DTYPE)
+
+
+def _box_coordinates(boxes):
+    """Accept [x1, y1, x2, y2] or [[x1, y1, x2, y2], ...] (first box wins)."""
+    if isinstance(boxes, (list, tuple)) and boxes and isinstance(boxes[0], (list, tuple)):
+        boxes = boxes[0]
+    if isinstance(boxes, (list, tuple)) and len(boxes) >= 4:
+        return [float(v) for v in boxes[:4]]
+    return [0.0, 0.0, 0.0, 0.0]
+
+
+def records_from_json(message, labels, timestamp=None):
+    """Convert a legacy JSON detection message (object or list of objects) into records."""
+    objects = message if isinstance(message, list) else [message]
+    objects = [obj for obj in objects if isinstance(obj, dict)]
+    if timestamp is None:
+        timestamp = time.time()
+
+    records = np.zeros(len(objects), dtype=DETECTION_DTYPE)
+    for i, obj in enumerate(objects):
+        records[i] = (
+            int(obj.get("frame_id", 0)),
+            float(obj.get("timestamp", timestamp)),
+            NO_DETECTIONS if obj.get("empty") else labels.id_for(obj.get("label", "unknown")),
+            float(obj.get("confidence", 0.0)),
+            *_box_coordinates(obj.get("boxex", [])),
+        )
+    return records
+
+
+def format_detections(detections, limit=5):
+    """Human readable one-line summary for the metadata panel."""
+    records = detections.records
+    parts = []
+    for record in records[:limit]:
+        label = detections.labels.name_for(int(record["class_id"]))
+        parts.append(
+            f"{label} {record['confidence']:.2f} "
+            f"[{record['x1']:.0f},{record['y1']:.0f},{record['x2']:.0f},{record['y2']:.0f}]"
+        )
+    if len(records) > limit:
+        parts.append(f"... +{len(records) - limit}")
+    return f"{len(records)} det: " + "; ".join(parts) if parts else "0 det"
+
+
+def make_decoder():
+    """MessageDecoder that understands every binary record version we support."""
+    return MessageDecoder(binary_decoders={RECORD_VERSION: decode_records})
+
+
+class MetadataClient:
+    """Detector-side sender: negotiates binary records and falls back to JSON.
+
+    Usage from a detector process:
+
+        client = MetadataClient(source="cam0/yolov8", labels=class_names)
+        client.send(records)  # DETECTION_DTYPE array
+    """
+
+    def __init__(self, host="127.0.0.1", port=METADATA_PORT, source=None, labels=(), timeout=2.0):
+        self.labels = LabelTable(labels)
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        hello = {"formats": list(SUPPORTED_FORMATS), "labels": self.labels.names}
+        if source:
+            hello["source"] = source
+        self.sock.sendall(encode_message({"hello": hello}))
+        self.format = self._read_reply()
+        self.sock.settimeout(None)
+
+    def _read_reply(self):
+        decoder = MessageDecoder()
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                for reply in decoder.feed(data):
+                    if isinstance(reply, dict) and reply.get("format") in SUPPORTED_FORMATS:
+                        return reply["format"]
+        except socket.timeout:
+            pass  # a server that predates negotiation never replies
+        return FORMAT_JSON
+
+    def send(self, records, frame_id=None, timestamp=None):
+        """Send one frame's records; with no records, ``frame_id`` and ``timestamp`` still tell the GUI."""
+        if not len(records) and frame_id is not None:
+            timestamp = time.time() if timestamp is None else timestamp
+            if self.format != FORMAT_BINARY:
+                self.sock.sendall(encode_message([{"frame_id": int(frame_id), "timestamp": float(timestamp),
+                                                   "empty": True}]))
+                return
+            records = np.zeros(1, dtype=DETECTION_DTYPE)
+            records[0]["frame_id"], records[0]["timestamp"], records[0]["class_id"] = frame_id, timestamp, NO_DETECTIONS
+        if self.format == FORMAT_BINARY:
+            self.sock.sendall(encode_records(records))
+            return
+        self.sock.sendall(encode_message([
+            {
+                "frame_id": int(r["frame_id"]),
+                "timestamp": float(r["timestamp"]),
+                "label": self.labels.name_for(int(r["class_id"])),
+                "confidence": float(r["confidence"]),
+                "boxex": [float(r["x1"]), float(r["y1"]), float(r["x2"]), float(r["y2"])],
+            }
+            for r in records
+        ]))
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,498 @@
+"""Headless engine: everything the viewers do that is not drawing.
+
+Engine owns the receive (or replay) pipeline, the metadata server, the
+metrics registry and endpoint, the detection recorder, the ingest process
+and the inference worker connection. It has no Qt dependency: the launcher
+and the USB viewer are thin clients of it, and ``python engine.py`` runs it
+as a service with no display at all.
+
+Clients talk to it in two directions:
+
+* commands (start_detection(), stop_detection(), set_display_size(), ...)
+  may be called from any thread;
+* events are published to subscribe()d callbacks as ``callback(name, *args)``
+  on the thread that produced them (the metadata server loop, the worker
+  command thread or the caller of take_frame()). A client that has to
+  handle them on a thread of its own re-queues them: engine_qt re-emits
+  them as a queued Qt signal, and events() hands out a plain bounded queue.
+
+Events:
+
+    metadata          (batch,)           [(source, Detections)] every batch_interval
+    metadata_stats    (stats,)           MetadataServer throughput dict, once a second
+    worker_reply      (cmd, status)      inference worker status after a command
+    worker_failed     (cmd, message)
+    replay_finished   (report,)          the replayed file has been fully shown
+
+Frames are not events: the newest decoded frame waits in a latest-wins
+mailbox until a client calls take_frame(), so a slow client drops frames
+instead of queueing them.
+
+    python engine.py --input rtsp://cam/stream --model yolov8s.hef --record-dir recordings/
+"""
+import argparse
+import asyncio
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from detection_recorder import DetectionRecorder
+from event_recorder import add_event_arguments, event_recorder_from_args
+from frame_mailbox import LatestFrameMailbox
+from frame_ring import FrameRingReader, ring_name_for
+from governor import Action, TelemetrySampler, add_governor_arguments, governor_from_args
+from inference_worker import (DEFAULT_SETTINGS, RING_BACKENDS, WORKER_SOCKET, WorkerClient, WorkerError,
+                              worker_listening)
+from metadata_server import MetadataServer
+from pipelines import CODECS, DEFAULT_PORT, get_codec, rtpbin_receiver, udp_receiver
+from resilient_transport import ResilientReceiver, add_transport_arguments, transport_from_args
+from stream_metrics import MetricsRegistry, StageProbe, TimestampBeaconReceiver, record_display, start_metrics_server
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+INGEST_SIZE = (640, 480)
+REDUCED_INGEST_SIZE = (320, 240)  # what the governor falls back to under load
+
+
+class Engine:
+    def __init__(self, process="launcher", codec=None, metrics_port=0, metrics_csv=None, replay=None):
+        Gst.init(None)
+        self.codec = codec or get_codec("mjpeg")
+        self.replay = replay
+        self.metrics = MetricsRegistry(process)
+        self.metrics_csv = metrics_csv
+        self.frame_mailbox = LatestFrameMailbox()
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+
+        self.pipeline = None
+        self.appsink = None
+        self.display_caps = None
+        self.display_format = "RGBx"
+        self.display_size = None
+        self.beacons = None
+        self.transport = None
+        self.port = None  # UDP port the receiver listens on
+
+        self.metadata_server = None
+        self.metadata_thread = None
+        self.recorder = None
+
+        self.worker_client = None
+        self.worker_process = None  # inference worker started by us, if it was not already running
+        self.worker_backend = None
+        self.worker_commands = queue.Queue()
+        self.worker_thread = None
+
+        self.ingest_process = None
+        self.ingest_input = None
+        self.ingest_size = INGEST_SIZE
+        self.detection = None  # (model, input, settings) while detection runs
+        self.ring_name = None
+        self.ring = None
+        self.ring_retry = 0.0
+
+        if metrics_port:
+            start_metrics_server(self.metrics, metrics_port)
+
+    # Events
+
+    def subscribe(self, callback):
+        """Call ``callback(name, *args)`` for every event, on the thread that produced it."""
+        with self._listeners_lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._listeners_lock:
+            self._listeners.remove(callback)
+
+    def events(self, maxsize=256):
+        """A queue of (name, args) for every event; the newest events are dropped when it is full."""
+        events = queue.Queue(maxsize)
+
+        def put(name, *args):
+            try:
+                events.put_nowait((name, args))
+            except queue.Full:
+                self.metrics.count("events_dropped")
+        self.subscribe(put)
+        return events
+
+    def emit(self, name, *args):
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(name, *args)
+
+    # Receive pipeline
+
+    def start_receiver(self, width=None, height=None, pixel_format="RGBx", rtcp_host=None, transport=None,
+                       play=True, port=DEFAULT_PORT):
+        """Build the pipeline for the annotated UDP stream (or the replay), scaled to width x height if given.
+
+        Frames are converted straight to ``pixel_format`` so a client only has to
+        blit them. max-buffers=1 drop=true: a stalled client drops stale frames
+        instead of queueing them. With ``rtcp_host`` or ``transport``
+        (pipelines.TransportSettings) the stream goes through rtpbin.
+        """
+        self.display_format = pixel_format
+        if self.replay:
+            # Full-size frames: recorded boxes are in source pixels, the client scales both
+            self.pipeline = Gst.parse_launch(
+                f"{self.replay.source()} ! videoconvert ! video/x-raw,format={pixel_format} ! {self.replay.appsink()}"
+            )
+            self.appsink = self.pipeline.get_by_name("sink")
+            if play:
+                self.play()
+            return
+
+        if rtcp_host or transport:
+            # rtpbin sends RTCP receiver reports back to an adaptive sender (sender.py --adaptive)
+            # and NACKs to a sender that retransmits (--nack)
+            receive = rtpbin_receiver(self.codec, rtcp_host, port)
+        else:
+            receive = udp_receiver(self.codec, port)
+        self.port = port
+        self.display_size = (width, height) if width and height else None
+        self.pipeline = Gst.parse_launch(
+            f"{receive} ! videoconvert ! videoscale add-borders=true ! "
+            f"capsfilter name=displaycaps caps={self._display_caps_string()} ! "
+            "appsink name=sink emit-signals=True max-buffers=1 drop=true sync=false"
+        )
+        self.display_caps = self.pipeline.get_by_name("displaycaps")
+        self.appsink = self.pipeline.get_by_name("sink")
+        self.appsink.connect("new-sample", self.on_new_sample)
+        if transport:
+            if transport.nack and not rtcp_host:
+                print("Warning: NACK retransmission needs RTCP back to the sender; no rtcp_host given")
+            self.transport = ResilientReceiver(self.codec, transport)
+            self.transport.attach(self.pipeline.get_by_name("rtpbin"))
+
+        StageProbe(self.pipeline.get_by_name("depay"), "depayload", self.metrics)
+        StageProbe(self.pipeline.get_by_name("decoder"), "decode", self.metrics)
+        self.beacons = TimestampBeaconReceiver(self.metrics)
+        self.beacons.attach(self.pipeline.get_by_name("depay"))
+        if play:
+            self.play()
+
+    def play(self):
+        if self.pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            print("Error: Could not start GStreamer pipeline.")
+
+    def _display_caps_string(self):
+        caps = f"video/x-raw,format={self.display_format}"
+        if self.display_size:
+            caps += f",width={self.display_size[0]},height={self.display_size[1]},pixel-aspect-ratio=1/1"
+        return caps
+
+    def set_display_size(self, width, height):
+        """Renegotiate the appsink caps so frames arrive at the client's display size."""
+        if self.display_caps is None or self.display_size is None or (width, height) == self.display_size:
+            return
+        self.display_size = (width, height)
+        self.display_caps.set_property("caps", Gst.Caps.from_string(self._display_caps_string()))
+
+    def on_new_sample(self, sink):
+        """Callback on the GStreamer streaming thread: only hand the newest sample on."""
+        sample = sink.emit("pull-sample")
+        if sample:
+            self.frame_mailbox.publish((sample, time.monotonic()))
+        return Gst.FlowReturn.OK
+
+    def render_interval(self):
+        """How often a client should call take_frame(), in ms."""
+        # ~60 Hz, faster than the 30 fps sender; replay at full speed pulls back to back
+        return self.replay.render_interval() if self.replay else 16
+
+    def take_frame(self):
+        """(sample, arrived, detections) for the newest frame not taken yet, or None.
+
+        Live frames come without detections (they are drawn into the annotated
+        stream); replayed frames carry the recorded detections that match them.
+        """
+        if self.replay:
+            sample = self.replay.pull(self.appsink)
+            if sample is None:
+                if self.replay.finished(self.appsink):
+                    self.emit("replay_finished", self.replay.report())
+                return None
+            return sample, time.monotonic(), self.replay.detections_for(sample)
+        item = self.frame_mailbox.take()
+        if item is None:
+            return None
+        sample, arrived = item
+        return sample, arrived, ()
+
+    def frame_shown(self, sample, arrived):
+        """Call right after a frame from take_frame() has been displayed (or consumed)."""
+        if self.replay:
+            self.replay.frame_rendered()
+        record_display(self.metrics, sample, arrived, self.beacons)
+        self.metrics.set_gauge("frames_dropped_display", self.frame_mailbox.dropped)
+        if self.transport:
+            self.transport.update_metrics(self.metrics)
+
+    # Metadata
+
+    def start_metadata(self, record_dir=None):
+        """Serve detector metadata on a thread of its own, recording it to ``record_dir`` if given."""
+        self.recorder = DetectionRecorder(record_dir) if record_dir else None
+        self.metadata_server = MetadataServer(self._on_batch, self._on_stats)
+        self.metadata_thread = threading.Thread(
+            target=asyncio.run, args=(self.metadata_server.serve_forever(),), name="metadata-server", daemon=True
+        )
+        self.metadata_thread.start()
+
+    def _on_batch(self, batch):
+        """Called on the server loop, once per coalesced batch."""
+        if self.recorder:
+            for source, detections in batch:
+                self.recorder.record(source, detections)
+        self.emit("metadata", batch)
+
+    def _on_stats(self, stats):
+        self.emit("metadata_stats", stats)
+
+    # Inference worker
+
+    def start_worker(self, socket_path=WORKER_SOCKET, backend="script"):
+        """Connect to the inference worker, starting one if none is listening on ``socket_path``."""
+        self.worker_client = WorkerClient(socket_path)
+        self.worker_backend = backend
+        if not worker_listening(socket_path):
+            self.worker_process = subprocess.Popen([
+                sys.executable, os.path.join(SCRIPT_DIR, "inference_worker.py"),
+                "--socket", socket_path, "--backend", backend,
+            ])
+        else:
+            # A worker started separately may run another backend; it decides whether ingest is needed
+            try:
+                self.worker_backend = self.worker_client.request("status")["backend"]
+            except WorkerError as e:
+                print("Inference worker status failed:", e)
+        self.worker_thread = threading.Thread(target=self._run_worker_commands, name="worker-commands", daemon=True)
+        self.worker_thread.start()
+
+    def send(self, cmd, **params):
+        """Queue a worker command; the reply arrives as a worker_reply or worker_failed event."""
+        self.worker_commands.put((cmd, params))
+
+    def _run_worker_commands(self):
+        """Sends control commands to the inference worker in order, off the caller's thread."""
+        while True:
+            item = self.worker_commands.get()
+            if item is None:
+                break
+            cmd, params = item
+            try:
+                status = self.worker_client.request(cmd, **params)
+            except WorkerError as e:
+                self.emit("worker_failed", cmd, str(e))
+            else:
+                self.emit("worker_reply", cmd, status)
+
+    def start_detection(self, model, input, **settings):
+        """Run ``model`` on ``input``, ingesting it first for backends that read the frame ring.
+
+        The worker keeps the pipeline when only thresholds changed and switches
+        model or input in place when those changed. The detector script opens
+        the input itself, so for it ingest would only decode the input again.
+        """
+        self.detection = (model, input, settings)
+        if self.worker_backend in RING_BACKENDS:
+            self.start_ingest(input)
+            ring = self.ring_name
+        else:
+            self.stop_ingest()
+            ring = None
+        self.send("start", model=model, input=input, ring=ring, **settings)
+
+    def stop_detection(self):
+        """Stop inference; the worker stays up with its models loaded."""
+        self.detection = None
+        self.send("stop")
+        self.stop_ingest()
+
+    def set_ingest_size(self, width, height):
+        """Decode the input at a new size. Release every frame taken from latest_ring_frame() first.
+
+        A running detection moves to a new ring at that size, and the worker
+        restarts its pipeline on it.
+        """
+        if (width, height) == self.ingest_size:
+            return
+        self.ingest_size = (width, height)
+        if self.detection:
+            model, input, settings = self.detection
+            self.stop_ingest()
+            self.start_detection(model, input, **settings)
+
+    def child_pids(self):
+        """{"worker": pid, "ingest": pid} for the processes this engine started."""
+        pids = {}
+        if self.worker_process:
+            pids["worker"] = self.worker_process.pid
+        if self.ingest_process:
+            pids["ingest"] = self.ingest_process.pid
+        return pids
+
+    # Ingest
+
+    def start_ingest(self, input):
+        """Decode the input once in ingest.py; readers use its frame ring in place."""
+        if self.ingest_process and self.ingest_process.poll() is None and self.ingest_input == input:
+            return
+        self.stop_ingest()
+        self.ingest_input = input
+        width, height = self.ingest_size
+        # Another size gets another ring, so readers of the old one notice the change
+        self.ring_name = ring_name_for(input if self.ingest_size == INGEST_SIZE else f"{input}@{width}x{height}")
+        self.ingest_process = subprocess.Popen([
+            sys.executable, os.path.join(SCRIPT_DIR, "ingest.py"), "--input", input, "--ring", self.ring_name,
+            "--width", str(width), "--height", str(height), "--shm-socket", f"/tmp/{self.ring_name}.shm",
+        ])
+
+    def stop_ingest(self):
+        """Stop ingest.py. Release every frame taken from latest_ring_frame() first."""
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        if self.ingest_process:
+            self.ingest_process.terminate()
+            self.ingest_process.wait()
+            self.ingest_process = None
+        self.ingest_input = None
+
+    def latest_ring_frame(self):
+        """The newest ingested frame as a frame_ring.RingFrame, or None."""
+        if self.ring is None:
+            now = time.monotonic()
+            if self.ingest_process is None or now < self.ring_retry:
+                return None
+            self.ring_retry = now + 0.5  # ingest may still be starting up
+            try:
+                self.ring = FrameRingReader(self.ring_name)
+            except (FileNotFoundError, ValueError):
+                return None
+        return self.ring.latest()
+
+    # Shutdown
+
+    def close(self):
+        if self.metadata_server:
+            self.metadata_server.stop()
+            self.metadata_thread.join()
+        if self.recorder:
+            self.recorder.close()
+        if self.worker_thread:
+            # A worker we started goes down with us; one started separately stays warm
+            self.send("shutdown" if self.worker_process else "stop")
+            self.worker_commands.put(None)
+            self.worker_thread.join()
+            self.worker_client.close()
+            if self.worker_process:
+                self.worker_process.wait()
+        self.stop_ingest()
+        if self.pipeline:
+            self.pipeline.set_state(Gst.State.NULL)
+        if self.beacons:
+            self.beacons.close()
+        if self.metrics_csv:
+            self.metrics.write_csv(self.metrics_csv)
+
+
+def run_service(engine, status_interval=10.0, governor=None, governor_interval=2.0):
+    """Run until SIGTERM/SIGINT: consume received frames and log events, with no display."""
+    running = threading.Event()
+    running.set()
+    signal.signal(signal.SIGTERM, lambda *args: running.clear())
+    signal.signal(signal.SIGINT, lambda *args: running.clear())
+    events = engine.events()
+    next_status = time.monotonic() + status_interval
+    next_sample = time.monotonic() + governor_interval
+    sampler = TelemetrySampler() if governor else None
+    stats = None
+    while running.is_set():
+        item = engine.take_frame() if engine.pipeline else None
+        if item is not None:
+            engine.frame_shown(item[0], item[1])
+        try:
+            name, args = events.get(timeout=0.01 if engine.pipeline else 0.2)
+        except queue.Empty:
+            name = None
+        if name == "worker_reply":
+            cmd, status = args
+            print(f"Inference worker {cmd}: {'running' if status['running'] else 'stopped'}, model {status['model']}")
+        elif name == "worker_failed":
+            print(f"Inference worker {args[0]} failed:", args[1])
+        elif name == "metadata_stats":
+            stats = args[0]
+        if governor and time.monotonic() >= next_sample:
+            next_sample += governor_interval
+            sampler.watch("engine", os.getpid())
+            for role in ("worker", "ingest"):
+                sampler.watch(role, engine.child_pids().get(role))
+            governor.update(sampler.sample())
+        if time.monotonic() >= next_status:
+            next_status += status_interval
+            if stats:
+                print(f"Metadata: {stats['messages_per_sec']:.1f} msg/s from {stats['connections']} sources, "
+                      f"{stats['dropped']} dropped"
+                      + (f", {engine.recorder.records_written} recorded" if engine.recorder else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run detection, metadata ingestion and recording without a GUI")
+    parser.add_argument("--input", help='camera node, rtsp:// URL, file or "test"; omit to only serve metadata')
+    parser.add_argument("--model", help="model to run on --input")
+    parser.add_argument("--task", default=DEFAULT_SETTINGS["task"], help="inference task of --model")
+    parser.add_argument("--iou", type=float, default=DEFAULT_SETTINGS["iou"])
+    parser.add_argument("--conf", type=float, default=DEFAULT_SETTINGS["conf"])
+    parser.add_argument("--jsonframe", type=int, default=0, help="JSON frame interval, 0 to disable")
+    parser.add_argument("--worker-socket", default=WORKER_SOCKET, help="inference worker control socket")
+    parser.add_argument("--worker-backend", choices=["script", "stub"], default="script",
+                        help="backend for the worker if the engine has to start it")
+    parser.add_argument("--record-dir", help="record every detection to a binary log in this directory")
+    parser.add_argument("--receive", action="store_true",
+                        help="also receive the annotated stream on UDP port 5000 (for its metrics)")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mjpeg",
+                        help="codec of the annotated stream on UDP port 5000")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port to receive on with --receive")
+    add_transport_arguments(parser)
+    add_event_arguments(parser)
+    add_governor_arguments(parser)
+    parser.add_argument("--metrics-port", type=int, default=9104, help="local Prometheus endpoint, 0 to disable")
+    parser.add_argument("--metrics-csv", help="write a metrics CSV here on exit")
+    args = parser.parse_args()
+    if args.input and not args.model:
+        parser.error("--input needs --model")
+    if args.clip_dir and not (args.receive or args.clip_source):
+        parser.error("--clip-dir needs --receive or --clip-source")
+
+    engine = Engine("engine", get_codec(args.codec), args.metrics_port, args.metrics_csv)
+    engine.start_metadata(args.record_dir)
+    if args.receive:
+        engine.start_receiver(transport=transport_from_args(args), port=args.port)
+    events = event_recorder_from_args(args, engine)
+    if args.input:
+        engine.start_worker(args.worker_socket, args.worker_backend)
+        engine.start_detection(args.model, args.input, task=args.task, iou=args.iou, conf=args.conf,
+                               jsonframe=args.jsonframe)
+    # Headless, the only load to shed is decoding: drop the capture resolution
+    governor = governor_from_args(args, [
+        Action("capture_resolution", lambda: engine.set_ingest_size(*REDUCED_INGEST_SIZE),
+               lambda: engine.set_ingest_size(*INGEST_SIZE)),
+    ], engine.metrics)
+    try:
+        run_service(engine, governor=governor, governor_interval=args.governor_interval)
+    finally:
+        if events:
+            events.close()
+        engine.close()
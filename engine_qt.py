@@ -0,0 +1,22 @@
+"""Qt side of the engine: engine events as a queued signal on the GUI thread."""
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class EngineBridge(QObject):
+    """Re-emits every engine event as ``event(name, args)``.
+
+    Engine events arrive on engine threads; a signal emitted there reaches
+    slots of objects living on the GUI thread through Qt's event queue.
+    """
+    event = pyqtSignal(str, tuple)
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        engine.subscribe(self.forward)
+
+    def forward(self, name, *args):
+        self.event.emit(name, args)
+
+    def close(self):
+        self.engine.unsubscribe(self.forward)
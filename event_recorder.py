@@ -0,0 +1,332 @@
+"""Detection-triggered clips: a pre-event ring of encoded frames, written to disk without re-encoding.
+
+EventRecorder taps an already-encoded stream: it probes the sink pad of
+the receiver's decoder, or it opens a capture pipeline of its own that only
+depayloads and parses. It keeps the last ``pre_roll`` seconds in memory as
+whole GOPs. The ring only ever drops a GOP from its head, so it always
+starts at a keyframe, and a ``max_bytes`` cap bounds it whatever the
+bitrate.
+
+When a metadata batch (the engine's "metadata" event, i.e. detections
+received on port 57344) matches the TriggerRule, the ring is pushed into
+``appsrc ! parse ! splitmuxsink`` and the live frames follow. Recording
+stops once ``post_roll`` seconds pass with no further match. Clips are
+Matroska, which stays readable when power is lost mid-clip, and split
+every ``segment`` seconds. Every clip is logged to ``events.jsonl`` in the
+clip directory.
+
+    python engine.py --receive --clip-dir clips/ --trigger person,car:0.6
+    python layout.py --clip-dir clips/ --clip-source rtsp://cam/main --clip-codec h264 --trigger person
+"""
+import collections
+import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from pipelines import get_codec
+
+EVENT_LOG = "events.jsonl"
+
+
+class TriggerRule:
+    """Matches detections of ``classes`` (any class if empty) at ``min_confidence`` or more.
+
+    ``min_count`` such detections must be in one message; ``sources``, if
+    given, limits the rule to those metadata sources.
+    """
+
+    def __init__(self, classes=(), min_confidence=0.5, min_count=1, sources=()):
+        self.classes = set(classes)
+        self.min_confidence = min_confidence
+        self.min_count = min_count
+        self.sources = set(sources)
+
+    @classmethod
+    def parse(cls, text, min_count=1):
+        """"person,car:0.6" -> persons or cars at 0.6 or more; "person" and ":0.8" also work."""
+        names, _, confidence = text.partition(":")
+        return cls([name for name in names.split(",") if name], float(confidence) if confidence else 0.5, min_count)
+
+    def match(self, source, detections):
+        """A short description of what matched, or None."""
+        if self.sources and source not in self.sources:
+            return None
+        records = detections.records
+        records = records[records["confidence"] >= self.min_confidence]
+        if self.classes:
+            names = np.array([detections.labels.name_for(int(c)) for c in records["class_id"]], dtype=object)
+            records = records[np.isin(names, list(self.classes))]
+        if len(records) < self.min_count:
+            return None
+        found = collections.Counter(detections.labels.name_for(int(c)) for c in records["class_id"])
+        return f"{source}: " + ", ".join(f"{count} {name}" for name, count in found.most_common())
+
+
+class PreEventRing:
+    """The last ``seconds`` of encoded frames, as GOPs that each start with a keyframe."""
+
+    def __init__(self, seconds=5.0, max_bytes=32 << 20):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.gops = collections.deque()  # [(arrived, buffer, size), ...], first one a keyframe
+        self.bytes = 0
+        self.discarded = 0  # delta frames with no keyframe before them
+
+    def push(self, arrived, buffer, size, keyframe):
+        if keyframe:
+            self.gops.append([])
+        elif not self.gops:
+            self.discarded += 1
+            return
+        self.gops[-1].append((arrived, buffer, size))
+        self.bytes += size
+        # Drop the oldest GOP once the next one alone covers the window, or to stay under max_bytes
+        while len(self.gops) > 1 and (self.gops[1][0][0] <= arrived - self.seconds or self.bytes > self.max_bytes):
+            self.bytes -= sum(size for _, _, size in self.gops.popleft())
+
+    def frames(self):
+        """Everything held, oldest first, starting at a keyframe."""
+        return [frame for gop in self.gops for frame in gop]
+
+    def duration(self):
+        return self.gops[-1][-1][0] - self.gops[0][0][0] if self.gops else 0.0
+
+
+class ClipWriter:
+    """appsrc ! parse ! splitmuxsink for one event, with timestamps rebased to start at zero."""
+
+    def __init__(self, caps, parser, location, segment=60.0):
+        self.pipeline = Gst.parse_launch(
+            f"appsrc name=src format=time is-live=true caps=\"{caps.to_string()}\" ! {parser} ! "
+            f"splitmuxsink location=\"{location}\" muxer-factory=matroskamux "
+            f"max-size-time={int(segment * Gst.SECOND)}"
+        )
+        self.src = self.pipeline.get_by_name("src")
+        self.base = None
+        self.frames = 0
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def push(self, buffer):
+        if self.base is None:
+            self.base = buffer.pts
+        buffer = buffer.copy()  # shares the memory; only the timestamps change
+        if buffer.pts != Gst.CLOCK_TIME_NONE:
+            buffer.pts = max(buffer.pts - self.base, 0)
+        if buffer.dts != Gst.CLOCK_TIME_NONE:
+            buffer.dts = max(buffer.dts - self.base, 0)
+        self.src.emit("push-buffer", buffer)
+        self.frames += 1
+
+    def finish(self, timeout=5.0):
+        """Let splitmuxsink close the file properly, then tear down (blocking)."""
+        self.src.emit("end-of-stream")
+        msg = self.pipeline.get_bus().timed_pop_filtered(
+            int(timeout * Gst.SECOND), Gst.MessageType.EOS | Gst.MessageType.ERROR
+        )
+        if msg and msg.type == Gst.MessageType.ERROR:
+            print("Event recorder: clip error:", msg.parse_error()[0].message)
+        self.pipeline.set_state(Gst.State.NULL)
+
+
+def encoded_source(spec, codec):
+    """Depayloaded, parsed frames from ``udp:PORT`` or an rtsp:// URL, into a fakesink named tap."""
+    parser = codec.parser or "jpegparse"
+    if spec.startswith("udp:"):
+        source = f"udpsrc port={int(spec.split(':')[1])} caps=\"{codec.rtp_caps()}\" ! rtpjitterbuffer latency=50"
+    elif spec.startswith("rtsp://"):
+        source = f'rtspsrc location="{spec}" latency=100'
+    else:
+        raise ValueError(f"clip source must be udp:PORT or an rtsp:// URL, not {spec!r}")
+    return f"{source} ! {codec.depayloader} ! {parser} ! fakesink name=tap sync=false"
+
+
+class EventRecorder:
+    def __init__(self, directory, rule, codec, pre_roll=5.0, post_roll=10.0, segment=60.0, name="camera",
+                 max_bytes=32 << 20, metrics=None):
+        self.directory = directory
+        self.rule = rule
+        self.codec = codec
+        self.post_roll = post_roll
+        self.segment = segment
+        self.name = name
+        self.metrics = metrics
+        self.ring = PreEventRing(pre_roll, max_bytes)
+        self.caps = None
+        self.writer = None
+        self.event = None  # dict logged to events.jsonl when the clip ends
+        self.pending = None  # (reason, triggers) waiting for _watch to open a clip
+        self.record_until = 0.0
+        self.pipeline = None
+        self.engine = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._watch, name="event-recorder", daemon=True)
+        self._thread.start()
+
+    # Frames in
+
+    def tap(self, element):
+        """Hold on to every buffer entering ``element`` (e.g. the receiver's decoder)."""
+        element.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_buffer)
+
+    def start_capture(self, spec):
+        """Tap a stream of our own: ``udp:PORT`` or an rtsp:// URL, never decoded."""
+        self.pipeline = Gst.parse_launch(encoded_source(spec, self.codec))
+        self.tap(self.pipeline.get_by_name("tap"))
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def _on_buffer(self, pad, info):
+        """Streaming thread: ring the buffer, and forward it while a clip is open."""
+        buffer = info.get_buffer()
+        keyframe = not buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+        now = time.monotonic()
+        with self._lock:
+            caps = pad.get_current_caps()
+            if caps is not None and (self.caps is None or not caps.is_equal(self.caps)):
+                self.caps = caps
+                self.ring = PreEventRing(self.ring.seconds, self.ring.max_bytes)  # old frames do not fit the new caps
+            self.ring.push(now, buffer, buffer.get_size(), keyframe)
+            if self.writer:
+                self.writer.push(buffer)
+        return Gst.PadProbeReturn.OK
+
+    # Triggers in
+
+    def attach(self, engine):
+        """Trigger on the engine's metadata events."""
+        self.engine = engine
+        engine.subscribe(self.on_event)
+
+    def on_event(self, name, *args):
+        if name == "metadata":
+            self.on_batch(args[0])
+
+    def on_batch(self, batch):
+        for source, detections in batch:
+            reason = self.rule.match(source, detections)
+            if reason:
+                self.trigger(reason)
+
+    def trigger(self, reason):
+        """Ask for a clip with the pre-roll, or extend the open one by post_roll.
+
+        Called on the metadata thread, so the clip pipeline is built by
+        _watch: starting it here would stall metadata ingestion, and the
+        streaming thread waiting on the lock.
+        """
+        with self._lock:
+            self.record_until = time.monotonic() + self.post_roll
+            if self.writer:
+                self.event["triggers"] += 1
+            elif self.pending:
+                self.pending = (self.pending[0], self.pending[1] + 1)
+            else:
+                self.pending = (reason, 1)
+        self._wake.set()
+
+    # Clips out
+
+    def _watch(self):
+        """Open requested clips; close them once post_roll passes without a trigger, even if the stream stalls."""
+        while not self._stop.is_set():
+            self._wake.wait(0.25)
+            self._wake.clear()
+            with self._lock:
+                if self.metrics:
+                    self.metrics.set_gauge("event_ring_bytes", self.ring.bytes)
+                    self.metrics.set_gauge("event_ring_seconds", self.ring.duration())
+                pending, self.pending = self.pending, None
+                caps = self.caps
+            if pending and caps is not None:
+                self._open(caps, *pending)
+            with self._lock:
+                if self.writer is None or time.monotonic() < self.record_until:
+                    continue
+                writer, event = self.writer, self.event
+                self.writer = self.event = None
+            self._finish(writer, event)
+
+    def _open(self, caps, reason, triggers):
+        """Start the clip pipeline without the lock, then hand it the pre-roll and the live frames."""
+        started = datetime.datetime.now()
+        location = os.path.join(self.directory, f"{self.name}-{started:%Y%m%d-%H%M%S}-%02d.mkv")
+        writer = ClipWriter(caps, self.codec.parser or "jpegparse", location, self.segment)
+        with self._lock:
+            frames = self.ring.frames()
+            if frames and caps.is_equal(self.caps):
+                for _, buffer, _ in frames:
+                    writer.push(buffer)
+                self.writer = writer
+                self.event = {"start": started.isoformat(timespec="seconds"), "reason": reason, "location": location,
+                              "pre_roll": round(self.ring.duration(), 2), "triggers": triggers}
+        if self.writer is not writer:
+            writer.pipeline.set_state(Gst.State.NULL)  # nothing buffered yet (no keyframe seen), or the caps changed
+            return
+        print(f"Event recorder: recording {location} ({reason}), {self.event['pre_roll']:.1f}s pre-roll")
+        if self.metrics:
+            self.metrics.count("clips_started")
+
+    def _finish(self, writer, event):
+        writer.finish()
+        event["end"] = datetime.datetime.now().isoformat(timespec="seconds")
+        event["frames"] = writer.frames
+        with open(os.path.join(self.directory, EVENT_LOG), "a") as f:
+            f.write(json.dumps(event) + "\n")
+        print(f"Event recorder: closed {event['location']}, {writer.frames} frames")
+        if self.metrics:
+            self.metrics.count("clips_recorded")
+
+    def close(self):
+        if self.engine:
+            self.engine.unsubscribe(self.on_event)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        if self.pipeline:
+            self.pipeline.set_state(Gst.State.NULL)
+        with self._lock:
+            writer, event = self.writer, self.event
+            self.writer = self.event = None
+        if writer:
+            self._finish(writer, event)
+
+
+def add_event_arguments(parser):
+    parser.add_argument("--clip-dir", help="record detection-triggered clips into this directory")
+    parser.add_argument("--clip-source",
+                        help="udp:PORT or rtsp:// URL to record (default: the received annotated stream)")
+    parser.add_argument("--clip-codec", help="codec of --clip-source (default: --codec)")
+    parser.add_argument("--trigger", default=":0.5", metavar="CLASSES:CONF",
+                        help='detections that start a clip, e.g. "person,car:0.6" (default: any class at 0.5)')
+    parser.add_argument("--trigger-count", type=int, default=1, help="detections needed in one message")
+    parser.add_argument("--pre-roll", type=float, default=5.0, help="seconds kept from before the trigger")
+    parser.add_argument("--post-roll", type=float, default=10.0, help="seconds recorded after the last trigger")
+
+
+def event_recorder_from_args(args, engine):
+    """An EventRecorder fed by ``engine``'s metadata, or None without --clip-dir. Call after start_receiver()."""
+    if not args.clip_dir:
+        return None
+    codec = get_codec(args.clip_codec) if args.clip_codec else engine.codec
+    recorder = EventRecorder(args.clip_dir, TriggerRule.parse(args.trigger, args.trigger_count), codec,
+                             args.pre_roll, args.post_roll, metrics=engine.metrics)
+    if args.clip_source:
+        recorder.name = "udp" + args.clip_source[4:] if args.clip_source.startswith("udp:") else "rtsp"
+        recorder.start_capture(args.clip_source)
+    elif engine.pipeline is not None and engine.pipeline.get_by_name("decoder") is not None:
+        recorder.name = f"udp{args.port}"
+        recorder.tap(engine.pipeline.get_by_name("decoder"))
+    else:
+        raise ValueError("no stream to record: receive one or give --clip-source")
+    recorder.attach(engine)
+    return recorder
@@ -0,0 +1,36 @@
+import threading
+
+
+class LatestFrameMailbox:
+    """Single-slot, latest-wins handoff from a GStreamer streaming thread to the GUI thread.
+
+    The streaming thread only publishes; anything it publishes before the GUI
+    gets around to taking it is replaced and counted as dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.published = 0
+        self.taken = 0
+        self.dropped = 0
+
+    def publish(self, item):
+        """Store the newest item, replacing (and counting) any unread one."""
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.published += 1
+
+    def take(self):
+        """Return the newest item and empty the slot, or None if nothing new arrived."""
+        with self._lock:
+            item, self._item = self._item, None
+            if item is not None:
+                self.taken += 1
+        return item
+
+    def clear(self):
+        with self._lock:
+            self._item = None
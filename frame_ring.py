@@ -0,0 +1,140 @@
+"""Shared-memory ring of decoded frames, written by ingest.py and read in place by consumers.
+
+One writer publishes raw frames into a fixed number of slots in a
+multiprocessing.shared_memory segment; any number of readers in other
+processes look at the newest slot without copying it. Layout:
+
+    ring header  magic, version, slot count, slot size, frames written
+    slot * N     slot header (sequence, frame id, PTS, timestamp, width,
+                 height, stride, size) followed by up to ``slot size`` bytes
+
+Each slot carries a sequence number that is odd while the writer is
+filling it. A reader takes a frame only when the sequence is even and
+checks it again with RingFrame.valid() once it is done with the data; if
+the writer lapped the reader in between, the frame is discarded.
+"""
+import hashlib
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+RING_MAGIC = b"EDFR"
+RING_VERSION = 1
+RING_HEADER = struct.Struct("<4sIIIQ")  # magic, version, slots, slot size, frames written
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct("<QQQdIIII")  # sequence, frame id, pts (ns), timestamp (s), width, height, stride, size
+SEQUENCE = struct.Struct("<Q")
+
+
+def ring_name_for(uri):
+    """Stable shared-memory name for the ring fed from ``uri``."""
+    return "edge_ai_" + hashlib.sha1(uri.encode("utf-8")).hexdigest()[:10]
+
+
+class FrameRingWriter:
+    def __init__(self, name, slot_size, slots=4):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = SLOT_HEADER.size + slot_size
+        size = HEADER_SIZE + slots * self.stride
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by an ingest process that did not exit cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self.shm.name
+        self.count = 0
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, RING_VERSION, slots, slot_size, 0)
+
+    def write(self, data, frame_id, pts, timestamp, width, height, stride):
+        """Copy one frame into the next slot; this is the only copy between decoder and consumers."""
+        size = len(data)
+        if size > self.slot_size:
+            raise ValueError(f"frame of {size} bytes does not fit a {self.slot_size} byte slot")
+        n = self.count
+        offset = HEADER_SIZE + (n % self.slots) * self.stride
+        buf = self.shm.buf
+        SEQUENCE.pack_into(buf, offset, 2 * n + 1)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + size] = data
+        SLOT_HEADER.pack_into(buf, offset, 2 * n + 2, frame_id, pts, timestamp, width, height, stride, size)
+        self.count = n + 1
+        RING_HEADER.pack_into(buf, 0, RING_MAGIC, RING_VERSION, self.slots, self.slot_size, self.count)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RingFrame:
+    """A frame still living in the ring; ``data`` is a view, not a copy."""
+    __slots__ = ("frame_id", "pts", "timestamp", "width", "height", "stride", "data", "_buf", "_offset", "_sequence")
+
+    def __init__(self, buf, offset, sequence, frame_id, pts, timestamp, width, height, stride, size):
+        self.frame_id = frame_id
+        self.pts = pts
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.stride = stride
+        start = offset + SLOT_HEADER.size
+        self.data = buf[start:start + size]
+        self._buf = buf
+        self._offset = offset
+        self._sequence = sequence
+
+    def valid(self):
+        """False once the writer has started reusing this slot."""
+        return SEQUENCE.unpack_from(self._buf, self._offset)[0] == self._sequence
+
+    def array(self, channels=4):
+        """(height, width, channels) uint8 view of the frame."""
+        rows = np.frombuffer(self.data, np.uint8).reshape(self.height, self.stride)
+        return rows[:, :self.width * channels].reshape(self.height, self.width, channels)
+
+    def release(self):
+        self.data.release()
+
+
+class FrameRingReader:
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 has no track=; keep the tracker from unlinking the writer's ring
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        magic, version, self.slots, self.slot_size, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.shm.close()
+            raise ValueError(f"{name} is not a version {RING_VERSION} frame ring")
+        self.stride = SLOT_HEADER.size + self.slot_size
+        self.last_count = 0
+        self.missed = 0
+
+    def written(self):
+        return RING_HEADER.unpack_from(self.shm.buf, 0)[4]
+
+    def latest(self):
+        """The newest frame not returned before, or None; frames skipped over are counted in ``missed``."""
+        count = self.written()
+        if count <= self.last_count:
+            return None
+        n = count - 1
+        offset = HEADER_SIZE + (n % self.slots) * self.stride
+        header = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+        if header[0] != 2 * n + 2:
+            return None  # already being overwritten; try again next time
+        if self.last_count:
+            self.missed += n - self.last_count
+        self.last_count = count
+        return RingFrame(self.shm.buf, offset, *header)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a consumer still holds a frame view; the mapping goes away with the process
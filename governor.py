@@ -0,0 +1,251 @@
+"""Resource governor: degrade the viewers under CPU, memory or thermal pressure, restore when it passes.
+
+TelemetrySampler reads, with psutil: CPU per core, CPU of named processes
+(the GUI, the inference worker, ingest), memory in use, and the SoC
+temperature. On a Raspberry Pi it also reads the firmware throttling flags.
+Governor is pure logic in the style of adaptive_rate: the client hands it
+an ordered ladder of Actions (cheapest to notice first, e.g. display frame
+rate, then overlay quality, then background streams, then capture
+resolution) and calls update() with each sample.
+
+Hysteresis: one more action is applied after ``degrade_after`` consecutive
+samples over any high threshold. The last one is undone after
+``restore_after`` consecutive samples under every low threshold, never
+sooner than ``min_interval`` after the previous change. Every decision is
+printed with its reason and kept in ``history``.
+
+    python governor.py --pid <layout pid> --pid <worker pid>   # watch telemetry and dry-run decisions
+
+psutil is only needed for sampling: without it the viewers and the engine
+run as before, and --governor is disabled with a message.
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+THROTTLED_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+THROTTLE_ACTIVE = 0x2 | 0x4 | 0x8  # frequency capped, throttled, soft temperature limit (current state bits)
+
+
+class Telemetry:
+    __slots__ = ("cpu_cores", "processes", "memory_percent", "temperature", "throttled")
+
+    def __init__(self, cpu_cores, processes, memory_percent, temperature=None, throttled=None):
+        self.cpu_cores = cpu_cores            # percent per core
+        self.processes = processes            # name -> percent of one core
+        self.memory_percent = memory_percent
+        self.temperature = temperature        # degrees C, None if unknown
+        self.throttled = throttled            # Pi firmware flags, None elsewhere
+
+    @property
+    def cpu_percent(self):
+        return sum(self.cpu_cores) / len(self.cpu_cores) if self.cpu_cores else 0.0
+
+    def __repr__(self):
+        cores = " ".join(f"{c:.0f}" for c in self.cpu_cores)
+        procs = ", ".join(f"{name} {cpu:.0f}%" for name, cpu in self.processes.items())
+        temp = f", {self.temperature:.1f} C" if self.temperature is not None else ""
+        throttled = ", throttled" if self.throttled else ""
+        return f"cpu {self.cpu_percent:.0f}% [{cores}], mem {self.memory_percent:.0f}%{temp}{throttled}" + (
+            f"; {procs}" if procs else "")
+
+
+def read_temperature():
+    """SoC temperature in degrees C, or None."""
+    sensors = getattr(psutil, "sensors_temperatures", lambda: {})()
+    for name in ("cpu_thermal", "coretemp", "k10temp", "soc_thermal"):
+        if sensors.get(name):
+            return max(entry.current for entry in sensors[name])
+    try:
+        with open(THERMAL_ZONE) as f:
+            return int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def read_throttled():
+    """True/False from the Raspberry Pi firmware, None when not on a Pi."""
+    try:
+        with open(THROTTLED_PATH) as f:
+            return bool(int(f.read(), 16) & THROTTLE_ACTIVE)
+    except (OSError, ValueError):
+        return None
+
+
+class TelemetrySampler:
+    """Non-blocking: each sample covers the time since the previous one."""
+
+    def __init__(self):
+        self.processes = {}  # name -> psutil.Process
+        psutil.cpu_percent(percpu=True)  # prime the per-core counters
+
+    def watch(self, name, pid):
+        """Report the CPU of ``pid`` as ``name``; a pid of None stops watching it."""
+        if pid is None:
+            self.processes.pop(name, None)
+            return
+        current = self.processes.get(name)
+        if current is None or current.pid != pid:
+            try:
+                process = psutil.Process(pid)
+                process.cpu_percent()  # prime
+                self.processes[name] = process
+            except psutil.Error:
+                self.processes.pop(name, None)
+
+    def sample(self):
+        processes = {}
+        for name, process in list(self.processes.items()):
+            try:
+                processes[name] = process.cpu_percent()
+            except psutil.Error:  # exited
+                del self.processes[name]
+        return Telemetry(psutil.cpu_percent(percpu=True), processes, psutil.virtual_memory().percent,
+                         read_temperature(), read_throttled())
+
+
+class Action:
+    """One rung of the ladder: ``degrade()`` sheds load, ``restore()`` undoes it."""
+
+    def __init__(self, name, degrade, restore):
+        self.name = name
+        self.degrade = degrade
+        self.restore = restore
+
+
+class Governor:
+    def __init__(self, actions, cpu_high=85.0, cpu_low=60.0, core_high=98.0, memory_high=90.0, memory_low=80.0,
+                 temp_high=80.0, temp_low=72.0, degrade_after=2, restore_after=5, min_interval=5.0,
+                 history=100, metrics=None):
+        self.actions = actions
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.core_high = core_high
+        self.memory_high = memory_high
+        self.memory_low = memory_low
+        self.temp_high = temp_high
+        self.temp_low = temp_low
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+        self.min_interval = min_interval
+        self.history = collections.deque(maxlen=history)  # (wall time, level, action, reason)
+        self.metrics = metrics
+        self.level = 0  # number of actions applied
+        self.bad = 0
+        self.good = 0
+        self.last_change = None
+
+    def pressure(self, t):
+        """Why the node is overloaded, or None."""
+        reasons = []
+        if t.cpu_percent >= self.cpu_high:
+            reasons.append(f"cpu {t.cpu_percent:.0f}% >= {self.cpu_high:.0f}%")
+        elif t.cpu_cores and max(t.cpu_cores) >= self.core_high and t.processes and \
+                max(t.processes.values()) >= self.core_high:
+            # One of our single-threaded stages pinning a core falls behind even on an idle machine
+            name = max(t.processes, key=t.processes.get)
+            reasons.append(f"{name} pinning a core ({t.processes[name]:.0f}%)")
+        if t.memory_percent >= self.memory_high:
+            reasons.append(f"memory {t.memory_percent:.0f}% >= {self.memory_high:.0f}%")
+        if t.temperature is not None and t.temperature >= self.temp_high:
+            reasons.append(f"temperature {t.temperature:.1f} C >= {self.temp_high:.0f} C")
+        if t.throttled:
+            reasons.append("SoC throttled")
+        return ", ".join(reasons) or None
+
+    def relaxed(self, t):
+        return (t.cpu_percent <= self.cpu_low and t.memory_percent <= self.memory_low
+                and (t.temperature is None or t.temperature <= self.temp_low) and not t.throttled)
+
+    def update(self, telemetry, now=None):
+        """Apply at most one step; returns (action name, "degrade"/"restore", reason) when something changed."""
+        now = time.monotonic() if now is None else now
+        reason = self.pressure(telemetry)
+        if reason:
+            self.bad += 1
+            self.good = 0
+        elif self.relaxed(telemetry):
+            self.good += 1
+            self.bad = 0
+            reason = f"load down ({telemetry!r})"
+        else:
+            # Between the thresholds: hold, and start counting again
+            self.bad = self.good = 0
+            return None
+        if self.last_change is not None and now - self.last_change < self.min_interval:
+            return None
+
+        if self.bad >= self.degrade_after and self.level < len(self.actions):
+            action = self.actions[self.level]
+            action.degrade()
+            self.level += 1
+            change = (action.name, "degrade", reason)
+        elif self.good >= self.restore_after and self.level > 0:
+            self.level -= 1
+            action = self.actions[self.level]
+            action.restore()
+            change = (action.name, "restore", reason)
+        else:
+            return None
+        self.bad = self.good = 0
+        self.last_change = now
+        self.history.append((time.time(), self.level, change[0], change[1] + ": " + reason))
+        print(f"Governor: {change[1]} {change[0]} (level {self.level}/{len(self.actions)}): {reason}")
+        if self.metrics:
+            self.metrics.set_gauge("governor_level", self.level)
+        return change
+
+    def restore_all(self):
+        while self.level:
+            self.level -= 1
+            self.actions[self.level].restore()
+
+
+def add_governor_arguments(parser):
+    parser.add_argument("--governor", action="store_true", help="shed load under CPU, memory or thermal pressure")
+    parser.add_argument("--governor-interval", type=float, default=2.0, help="seconds between telemetry samples")
+    parser.add_argument("--cpu-high", type=float, default=85.0, help="average CPU %% that counts as overload")
+    parser.add_argument("--temp-high", type=float, default=80.0, help="SoC temperature (C) that counts as overload")
+
+
+def governor_from_args(args, actions, metrics=None):
+    if not args.governor:
+        return None
+    if psutil is None:
+        print("psutil not installed; --governor is disabled")
+        return None
+    return Governor(actions, cpu_high=args.cpu_high, cpu_low=args.cpu_high - 25,
+                    temp_high=args.temp_high, temp_low=args.temp_high - 8, metrics=metrics)
+
+
+if __name__ == "__main__":
+    if psutil is None:
+        sys.exit("governor.py needs psutil (pip install psutil)")
+    parser = argparse.ArgumentParser(description="Print telemetry and what the governor would do")
+    parser.add_argument("--pid", type=int, action="append", help="process to watch (repeatable)")
+    parser.add_argument("--levels", type=int, default=4, help="length of the dry-run ladder")
+    add_governor_arguments(parser)
+    args = parser.parse_args()
+
+    sampler = TelemetrySampler()
+    for pid in args.pid or [os.getpid()]:
+        sampler.watch(psutil.Process(pid).name() if psutil.pid_exists(pid) else str(pid), pid)
+    actions = [Action(f"level{i + 1}", lambda: None, lambda: None) for i in range(args.levels)]
+    args.governor = True
+    governor = governor_from_args(args, actions)
+    try:
+        while True:
+            time.sleep(args.governor_interval)
+            telemetry = sampler.sample()
+            print(telemetry)
+            governor.update(telemetry)
+    except KeyboardInterrupt:
+        pass
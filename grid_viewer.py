@@ -0,0 +1,460 @@
+"""Video wall: N streams composed into one frame by a single GStreamer pipeline.
+
+Every tile is decoded, rate-limited and scaled to its cell inside
+GStreamer, and ``compositor`` lays the cells out into one RGBx frame. Rate
+limits start ahead of the decoder (DecodeGate), so a capped tile is not
+decoded at full rate only for videorate to throw the frames away. Qt
+gets one buffer per refresh through the same latest-wins mailbox as the
+single-stream viewers, so the Python cost does not grow with the number of
+tiles.
+
+The focused tile (click to choose it) runs at ``--fps``; the others are
+capped at ``--background-fps``, per tile with ``--tile-fps``. A tile given
+a sub-stream (``--sub 2=rtsp://cam2/sub``) shows that low-resolution
+stream while it is not focused; each source is a bin of its own, so a
+focus change replaces only that tile's source while the others keep
+playing. Double-click shows the focused tile alone
+across the whole wall, and the hidden tiles drop to keyframes at 1 fps.
+
+With ``--governor`` the wall sheds load under CPU, memory or thermal
+pressure (see governor.py): first half the wall frame rate, then the
+unfocused tiles drop to keyframes at 1 fps as if hidden.
+
+Sources are ``udp:PORT[:CODEC]`` for the RTP streams sent by sender.py,
+rtsp:// URLs, camera nodes, files, or ``test``:
+
+    python grid_viewer.py udp:5000 udp:5010:h264 rtsp://cam2/main rtsp://cam3/main --sub 2=rtsp://cam2/sub
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QLabel, QSizePolicy, QVBoxLayout, QWidget
+
+from frame_mailbox import LatestFrameMailbox
+from governor import Action, TelemetrySampler, add_governor_arguments, governor_from_args
+from pipelines import CODECS, decoded_source, get_codec, udp_receiver
+from stream_metrics import MetricsRegistry, record_display, start_metrics_server
+
+HIDDEN_FPS = 1  # tiles covered by a solo tile, or paused by the governor
+
+
+class DecodeGate:
+    """Buffer probe on a tile's decoder sink pad: frames the tile will not show are dropped before decoding.
+
+    Intra-only streams (MJPEG) are thinned to ``fps``. Dropping a frame of an
+    inter-coded stream breaks the delta frames after it, so those are only
+    thinned when ``keyframes_only`` is set (hidden tiles), to keyframes at
+    most ``fps``; a visible tile at a capped rate is still decoded in full
+    and capped by its videorate.
+    """
+
+    def __init__(self):
+        self.fps = 0  # 0 passes everything
+        self.keyframes_only = False
+        self.dropped = 0
+        self._next = 0.0
+        self._seen_delta = False
+        self._resync = False  # a frame was dropped: delta frames wait for the next keyframe
+
+    def set_rate(self, fps, keyframes_only=False):
+        self.fps = fps
+        self.keyframes_only = keyframes_only
+
+    def _on_buffer(self, pad, info):
+        buf = info.get_buffer()
+        if buf.has_flags(Gst.BufferFlags.HEADER):
+            return Gst.PadProbeReturn.OK  # codec headers, the decoder needs them whatever it skips
+        if buf.has_flags(Gst.BufferFlags.DELTA_UNIT):
+            self._seen_delta = True
+            if self._resync or (self.keyframes_only and self.fps):
+                self._resync = True
+                self.dropped += 1
+                return Gst.PadProbeReturn.DROP
+            return Gst.PadProbeReturn.OK
+        if self.fps and (self.keyframes_only or not self._seen_delta):
+            now = time.monotonic()
+            if now < self._next:
+                self._resync = True
+                self.dropped += 1
+                return Gst.PadProbeReturn.DROP
+            period = 1.0 / self.fps
+            # Keep to the schedule so arrival jitter does not cost a whole period
+            self._next = self._next + period if now - self._next < period else now + period
+        self._resync = False
+        return Gst.PadProbeReturn.OK
+
+    def attach(self, source):
+        """Probe the video decoders in ``source``, including those decodebin adds later."""
+        for element in source.iterate_recurse():
+            self._on_element(source, None, element)
+        source.connect("deep-element-added", self._on_element)
+
+    def _on_element(self, bin, sub_bin, element):
+        factory = element.get_factory()
+        klass = factory.get_metadata("klass") if factory else ""
+        if "Decoder" in klass and "Video" in klass:
+            element.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_buffer)
+
+
+class Tile:
+    def __init__(self, index, main, sub=None, fps=None):
+        self.index = index
+        self.main = main
+        self.sub = sub
+        self.fps = fps  # cap while not focused; None uses the grid's background fps
+
+
+def tile_source(spec, index):
+    """Decoded raw video for one tile, with element names unique to the tile."""
+    if spec.startswith("udp:"):
+        _, port, *codec = spec.split(":")
+        return udp_receiver(get_codec(codec[0] if codec else "mjpeg"), int(port), suffix=f"_{index}")
+    return decoded_source(spec, name=f"source_{index}")
+
+
+def grid_shape(count):
+    """(columns, rows) for ``count`` tiles, as square as possible: 4 -> 2x2, 9 -> 3x3, 5 -> 3x2."""
+    columns = math.ceil(math.sqrt(count))
+    return columns, math.ceil(count / columns)
+
+
+class GridPipeline:
+    def __init__(self, tiles, width=1280, height=720, fps=30, background_fps=10, metrics=None):
+        Gst.init(None)
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.background_fps = background_fps
+        self.metrics = metrics or MetricsRegistry("grid")
+        self.mailbox = LatestFrameMailbox()
+        self.columns, self.rows = grid_shape(len(tiles))
+        self.focus = 0
+        self.solo = False
+        self.background_paused = False
+        self.pipeline = None
+        self.sources = {}  # tile index -> source bin
+        self.gates = {}  # tile index -> DecodeGate of its source
+
+    def launch(self):
+        """The compositor and each tile's rate/scale chain; sources are added as bins of their own."""
+        parts = [
+            "compositor name=comp background=black ignore-inactive-pads=true ! "
+            f"capsfilter name=outcaps caps={self._output_caps()} ! "
+            "appsink name=sink emit-signals=true max-buffers=1 drop=true sync=false"
+        ]
+        for tile in self.tiles:
+            i = tile.index
+            # The leaky queue keeps a stalled source from holding up the compositor
+            parts.append(
+                f"queue name=in_{i} leaky=downstream max-size-buffers=2 ! "
+                f"videorate drop-only=true ! capsfilter name=rate_{i} caps=video/x-raw,framerate={self.tile_fps(i)}/1 ! "
+                f"videoscale ! videoconvert ! capsfilter name=size_{i} caps={self._tile_caps(i)} ! comp.sink_{i}"
+            )
+        return " ".join(parts)
+
+    def start(self):
+        self.pipeline = Gst.parse_launch(self.launch())
+        self.pipeline.get_by_name("sink").connect("new-sample", self.on_new_sample)
+        for tile in self.tiles:
+            self._attach_source(tile)
+        self.apply_layout()
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def _attach_source(self, tile):
+        """Decode the tile's main or sub stream in a bin linked into its chain."""
+        i = tile.index
+        spec = tile.sub if tile.sub and i != self.focus else tile.main
+        # videoconvert gives the bin a static src pad to ghost (decodebin's pads come later)
+        source = Gst.parse_bin_from_description(f"{tile_source(spec, i)} ! videoconvert", True)
+        gate = DecodeGate()
+        gate.set_rate(*self.decode_rate(i))
+        gate.attach(source)
+        self.pipeline.add(source)
+        source.link(self.pipeline.get_by_name(f"in_{i}"))
+        self.sources[i] = source
+        self.gates[i] = gate
+        return source
+
+    def _swap_source(self, tile):
+        """Switch one tile between its main and sub stream; the other tiles keep playing."""
+        old = self.sources.pop(tile.index)
+        old.set_state(Gst.State.NULL)  # stop its streaming threads before unlinking
+        old.unlink(self.pipeline.get_by_name(f"in_{tile.index}"))
+        self.pipeline.remove(old)
+        self._attach_source(tile).sync_state_with_parent()
+
+    def stop(self):
+        if self.pipeline:
+            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline = None
+            self.sources = {}
+            self.gates = {}
+
+    def on_new_sample(self, sink):
+        """Streaming thread: publish only, never touch widgets here."""
+        sample = sink.emit("pull-sample")
+        if sample:
+            self.mailbox.publish((sample, time.monotonic()))
+        return Gst.FlowReturn.OK
+
+    def geometry(self, index):
+        """(x, y, width, height) of a tile on the wall."""
+        if self.solo:
+            if index == self.focus:
+                return 0, 0, self.width, self.height
+            return 0, 0, 2, 2  # kept tiny and hidden; the pad stays linked
+        cell_w, cell_h = self.width // self.columns, self.height // self.rows
+        column, row = index % self.columns, index // self.columns
+        return column * cell_w, row * cell_h, cell_w - cell_w % 2, cell_h - cell_h % 2
+
+    def tile_at(self, x, y):
+        """Index of the tile under wall coordinates (x, y), or None."""
+        if self.solo:
+            return self.focus
+        column = int(x * self.columns // self.width)
+        row = int(y * self.rows // self.height)
+        index = row * self.columns + column
+        return index if 0 <= column < self.columns and index < len(self.tiles) else None
+
+    def tile_fps(self, index):
+        if index == self.focus:
+            return self.fps
+        if self.hidden(index):
+            return HIDDEN_FPS
+        return self.tiles[index].fps or self.background_fps
+
+    def hidden(self, index):
+        return index != self.focus and (self.solo or self.background_paused)
+
+    def decode_rate(self, index):
+        """(fps, keyframes_only) for the tile's DecodeGate."""
+        return self.tile_fps(index), self.hidden(index)
+
+    def _output_caps(self):
+        return f"video/x-raw,format=RGBx,width={self.width},height={self.height},framerate={self.fps}/1"
+
+    def _tile_caps(self, index):
+        _, _, width, height = self.geometry(index)
+        return f"video/x-raw,width={width},height={height},pixel-aspect-ratio=1/1"
+
+    def apply_layout(self):
+        """Push tile positions, sizes and frame rates into the running pipeline."""
+        for tile in self.tiles:
+            i = tile.index
+            x, y, width, height = self.geometry(i)
+            pad = self.pipeline.get_by_name("comp").get_static_pad(f"sink_{i}")
+            pad.set_property("xpos", x)
+            pad.set_property("ypos", y)
+            pad.set_property("width", width)
+            pad.set_property("height", height)
+            pad.set_property("zorder", 1 if self.solo and i == self.focus else 0)
+            pad.set_property("alpha", 0.0 if self.solo and i != self.focus else 1.0)
+            self.pipeline.get_by_name(f"size_{i}").set_property("caps", Gst.Caps.from_string(self._tile_caps(i)))
+            self.pipeline.get_by_name(f"rate_{i}").set_property(
+                "caps", Gst.Caps.from_string(f"video/x-raw,framerate={self.tile_fps(i)}/1")
+            )
+            self.gates[i].set_rate(*self.decode_rate(i))
+        self.metrics.set_gauge("grid_focus", self.focus)
+        self.metrics.set_gauge("grid_frames_skipped_before_decode", sum(g.dropped for g in self.gates.values()))
+
+    def set_focus(self, index):
+        if index == self.focus:
+            return
+        previous, self.focus = self.focus, index
+        if self.pipeline:
+            # Only tiles with a sub-stream change source; everything else is adjusted in place
+            for i in (previous, index):
+                if self.tiles[i].sub:
+                    self._swap_source(self.tiles[i])
+            self.apply_layout()
+
+    def toggle_solo(self):
+        self.solo = not self.solo
+        self.apply_layout()
+
+    def set_fps(self, fps):
+        """Change the wall (and focused tile) frame rate in place."""
+        self.fps = fps
+        if self.pipeline:
+            self.pipeline.get_by_name("outcaps").set_property("caps", Gst.Caps.from_string(self._output_caps()))
+            self.apply_layout()
+
+    def pause_background(self, paused):
+        """Drop every tile but the focused one to HIDDEN_FPS before decoding (keyframes only), or bring them back."""
+        self.background_paused = paused
+        if self.pipeline:
+            self.apply_layout()
+
+    def resize(self, width, height):
+        """Compose at a new wall size, e.g. the widget's."""
+        if (width, height) == (self.width, self.height):
+            return
+        self.width, self.height = width, height
+        if self.pipeline is None:
+            return
+        self.pipeline.get_by_name("outcaps").set_property("caps", Gst.Caps.from_string(self._output_caps()))
+        self.apply_layout()
+
+    def poll_errors(self):
+        """Print errors posted since the last call; a failed tile stops, the wall keeps going."""
+        bus = self.pipeline.get_bus()
+        while True:
+            msg = bus.pop_filtered(Gst.MessageType.ERROR)
+            if msg is None:
+                return
+            err, debug = msg.parse_error()
+            print(f"Grid: {msg.src.get_name()}: {err.message}")
+            self.metrics.count("tile_errors")
+
+
+def governor_actions(grid):
+    """What the wall gives up under load, cheapest first."""
+    full_fps = grid.fps
+    return [
+        Action("display_fps", lambda: grid.set_fps(max(full_fps // 2, 1)), lambda: grid.set_fps(full_fps)),
+        Action("background_streams", lambda: grid.pause_background(True), lambda: grid.pause_background(False)),
+    ]
+
+
+class GridViewer(QWidget):
+    def __init__(self, grid, metrics_csv=None, governor=None, governor_interval=2.0):
+        super().__init__()
+        self.grid = grid
+        self.metrics_csv = metrics_csv
+        self.governor = governor
+        self.setWindowTitle(f"Video Wall ({len(grid.tiles)} streams)")
+        self.video_label = QLabel(self)
+        self.video_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.video_label.setMinimumSize(320, 180)
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.video_label.setStyleSheet("background-color: black;")
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.video_label)
+        self.setLayout(layout)
+
+        # Coalesce resize events before renegotiating the wall size
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.update_wall_size)
+        # One composed frame per tick at most
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_latest_frame)
+        self.render_timer.start(16)
+        if governor:
+            self.sampler = TelemetrySampler()
+            self.sampler.watch("grid", os.getpid())
+            self.governor_timer = QTimer(self)
+            self.governor_timer.timeout.connect(lambda: self.governor.update(self.sampler.sample()))
+            self.governor_timer.start(int(governor_interval * 1000))
+        self.resize(grid.width, grid.height)
+        self.grid.start()
+
+    def render_latest_frame(self):
+        self.grid.poll_errors()
+        item = self.grid.mailbox.take()
+        if item is None:
+            return
+        sample, arrived = item
+        buf = sample.get_buffer()
+        structure = sample.get_caps().get_structure(0)
+        width = structure.get_int("width")[1]
+        height = structure.get_int("height")[1]
+        success, map_info = buf.map(Gst.MapFlags.READ)
+        if not success:
+            return
+        try:
+            image = QImage(map_info.data, width, height, width * 4, QImage.Format_RGBX8888)
+            size = self.video_label.contentsRect().size()
+            if (width, height) != (size.width(), size.height()):
+                image = image.scaled(size, Qt.KeepAspectRatio)
+            # fromImage copies, so the buffer can be unmapped afterwards
+            self.video_label.setPixmap(QPixmap.fromImage(image))
+        finally:
+            buf.unmap(map_info)
+        record_display(self.grid.metrics, sample, arrived)
+        self.grid.metrics.set_gauge("frames_dropped_display", self.grid.mailbox.dropped)
+
+    def wall_position(self, event):
+        """Widget coordinates -> wall coordinates (the label shows the wall scaled, centred)."""
+        rect = self.video_label.geometry()
+        scale = min(rect.width() / self.grid.width, rect.height() / self.grid.height)
+        x = (event.x() - rect.x() - (rect.width() - self.grid.width * scale) / 2) / scale
+        y = (event.y() - rect.y() - (rect.height() - self.grid.height * scale) / 2) / scale
+        return x, y
+
+    def mousePressEvent(self, event):
+        index = self.grid.tile_at(*self.wall_position(event))
+        if index is not None:
+            self.grid.set_focus(index)
+
+    def mouseDoubleClickEvent(self, event):
+        self.grid.toggle_solo()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resize_timer.start(100)
+
+    def update_wall_size(self):
+        rect = self.video_label.contentsRect()
+        self.grid.resize(max(rect.width() - rect.width() % 2, 2), max(rect.height() - rect.height() % 2, 2))
+
+    def closeEvent(self, event):
+        if self.governor:
+            self.governor_timer.stop()
+        self.render_timer.stop()
+        self.grid.stop()
+        if self.metrics_csv:
+            self.grid.metrics.write_csv(self.metrics_csv)
+        event.accept()
+
+
+def parse_index_map(items, convert):
+    """["2=rtsp://cam/sub", ...] -> {2: "rtsp://cam/sub", ...}"""
+    result = {}
+    for item in items or []:
+        index, _, value = item.partition("=")
+        result[int(index)] = convert(value)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show several streams as one composed video wall")
+    parser.add_argument("sources", nargs="+",
+                        help=f"udp:PORT[:CODEC] (CODEC one of {', '.join(sorted(CODECS))}), rtsp:// URL, "
+                             "camera node, file or test")
+    parser.add_argument("--size", default="1280x720", help="initial wall size")
+    parser.add_argument("--fps", type=int, default=30, help="wall and focused tile frame rate")
+    parser.add_argument("--background-fps", type=int, default=10, help="frame rate of the other tiles")
+    parser.add_argument("--tile-fps", action="append", metavar="INDEX=FPS",
+                        help="frame rate of one tile while not focused (repeatable)")
+    parser.add_argument("--sub", action="append", metavar="INDEX=SOURCE",
+                        help="low-resolution source shown while a tile is not focused (repeatable)")
+    add_governor_arguments(parser)
+    parser.add_argument("--metrics-port", type=int, default=9105, help="local Prometheus endpoint, 0 to disable")
+    parser.add_argument("--metrics-csv", help="write a metrics CSV here on exit")
+    args, qt_args = parser.parse_known_args()
+
+    subs = parse_index_map(args.sub, str)
+    tile_fps = parse_index_map(args.tile_fps, int)
+    tiles = [Tile(i, source, subs.get(i), tile_fps.get(i)) for i, source in enumerate(args.sources)]
+    width, height = (int(v) for v in args.size.split("x"))
+    metrics = MetricsRegistry("grid")
+    if args.metrics_port:
+        start_metrics_server(metrics, args.metrics_port)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    grid = GridPipeline(tiles, width, height, args.fps, args.background_fps, metrics)
+    window = GridViewer(grid, args.metrics_csv, governor_from_args(args, governor_actions(grid), metrics),
+                        args.governor_interval)
+    window.show()
+    sys.exit(app.exec_())
@@ -0,0 +1,457 @@
+"""Long-lived inference worker driven over a local control socket.
+
+The launcher used to spawn a fresh detector process on every Run, paying
+interpreter start, imports, device open and model load each time. This
+worker stays up instead and takes newline-delimited JSON requests on a
+Unix socket (framed with metadata_protocol), each answered with
+``{"ok": true, "status": {...}}`` or ``{"ok": false, "error": "..."}``:
+
+    {"cmd": "start", "model": path, "input": uri, "ring": name, "task": ..., "iou": ..., "conf": ..., "jsonframe": ...}
+    {"cmd": "stop"}
+    {"cmd": "switch_model", "model": path}
+    {"cmd": "switch_input", "input": uri}
+    {"cmd": "set_thresholds", "iou": ..., "conf": ...}
+    {"cmd": "status"}
+    {"cmd": "shutdown"}
+
+"start" while already running only changes what differs, so re-running
+with new thresholds keeps the pipeline and re-running with another model
+is a model switch. Loaded models stay in an LRU cache of ``cache_size``.
+
+Backends:
+
+* stub: fake detections sent to the launcher's metadata server, with a
+  configurable model load delay; for testing the launcher without Hailo
+  hardware. When given the ingest frame ring ("ring", see ingest.py) it
+  stamps detections with the frame ids and timestamps of real frames.
+* script: the existing detector script, one process per session. Scripts
+  cannot hand over a loaded model, so model and input switches restart the
+  process; the worker still saves the launcher's own process churn. The
+  script opens and decodes its input itself, so the engine does not start
+  ingest for it (see RING_BACKENDS).
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from detection_records import DETECTION_DTYPE, MetadataClient
+from frame_ring import FrameRingReader
+from metadata_protocol import METADATA_PORT, MessageDecoder, encode_message
+
+WORKER_SOCKET = "/tmp/edge_ai_inference.sock"
+DETECTOR_SCRIPT = "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/new_pipe/np_detection_test.py"
+DEFAULT_SETTINGS = {"task": "detection", "iou": 0.1, "conf": 0.2, "jsonframe": 0, "ring": None}
+RING_BACKENDS = {"stub"}  # backends that read frames from the ingest ring rather than opening the input
+
+
+class WorkerError(Exception):
+    pass
+
+
+class ModelCache:
+    """LRU of loaded models keyed by path; evicted models are unloaded by the backend."""
+
+    def __init__(self, backend, capacity=3):
+        self.backend = backend
+        self.capacity = capacity
+        self.models = collections.OrderedDict()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path):
+        model = self.models.get(path)
+        if model is not None:
+            self.models.move_to_end(path)
+            self.hits += 1
+            return model
+        model = self.backend.load_model(path)
+        self.loads += 1
+        self.models[path] = model
+        while len(self.models) > self.capacity:
+            _, evicted = self.models.popitem(last=False)
+            self.backend.unload_model(evicted)
+        return model
+
+
+class StubModel:
+    def __init__(self, path, labels):
+        self.path = path
+        self.labels = labels
+
+
+class StubSession:
+    """Random boxes at ``fps`` for the current model/input, filtered by the confidence threshold."""
+
+    def __init__(self, model, source, settings, host, port, fps):
+        self.model = model
+        self.source = source
+        self.settings = dict(settings)
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stub-inference", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        client = client_model = None
+        ring = None
+        frame_id = 0
+        while not self._stop.wait(1.0 / self.fps):
+            model = self.model
+            timestamp, width, height = time.time(), 640, 480
+            if ring is None and self.settings.get("ring"):
+                try:
+                    ring = FrameRingReader(self.settings["ring"])
+                except (FileNotFoundError, ValueError):
+                    pass
+            if ring:
+                frame = ring.latest()
+                if frame is None:
+                    continue
+                frame_id, timestamp, width, height = frame.frame_id, frame.timestamp, frame.width, frame.height
+                frame.release()
+            if client is None or client_model is not model:
+                if client:
+                    client.close()
+                try:
+                    client = MetadataClient(self.host, self.port, f"stub/{os.path.basename(model.path)}", model.labels)
+                    client_model = model
+                except OSError:
+                    client = None
+                    continue
+            records = np.zeros(random.randint(0, 4), dtype=DETECTION_DTYPE)
+            records["frame_id"] = frame_id
+            records["timestamp"] = timestamp
+            records["class_id"] = np.random.randint(0, len(model.labels), len(records))
+            records["confidence"] = np.random.uniform(0.0, 1.0, len(records))
+            x, y = np.random.uniform(0, width - 40, len(records)), np.random.uniform(0, height - 40, len(records))
+            records["x1"], records["y1"], records["x2"], records["y2"] = x, y, x + 40, y + 40
+            records = records[records["confidence"] >= self.settings["conf"]]
+            try:
+                client.send(records, frame_id, timestamp)
+            except OSError:
+                client = None
+            frame_id += 1
+        if client:
+            client.close()
+        if ring:
+            ring.close()
+
+    def set_model(self, model):
+        self.model = model
+
+    def set_source(self, source):
+        self.source = source
+
+    def set_thresholds(self, settings):
+        self.settings.update(settings)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, load_delay=1.0, host="127.0.0.1", port=METADATA_PORT, fps=10):
+        self.load_delay = load_delay
+        self.host = host
+        self.port = port
+        self.fps = fps
+
+    def load_model(self, path):
+        time.sleep(self.load_delay)  # stands in for reading and configuring the HEF
+        return StubModel(path, ["person", "car", "bicycle"])
+
+    def unload_model(self, model):
+        pass
+
+    def open(self, model, source, settings):
+        return StubSession(model, source, settings, self.host, self.port, self.fps)
+
+
+class ScriptSession:
+    def __init__(self, script, model, source, settings):
+        self.script = script
+        self.model = model
+        self.source = source
+        self.settings = dict(settings)
+        self.process = None
+        self._spawn()
+
+    def _spawn(self):
+        command = [
+            "python", self.script,
+            "--hef-path", self.model,
+            "--input", self.source,
+            "--infer", self.settings["task"],
+            "--jsonframe", str(self.settings["jsonframe"]),
+        ]
+        print("Starting detector:", command)
+        self.process = subprocess.Popen(command)
+
+    def _restart(self):
+        self.stop()
+        self._spawn()
+
+    def set_model(self, model):
+        self.model = model
+        self._restart()
+
+    def set_source(self, source):
+        self.source = source
+        self._restart()
+
+    def set_thresholds(self, settings):
+        # The detector script does not take thresholds yet; keep them for status
+        self.settings.update(settings)
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+class ScriptBackend:
+    name = "script"
+
+    def __init__(self, script=DETECTOR_SCRIPT):
+        self.script = script
+
+    def load_model(self, path):
+        if not os.path.isfile(path):
+            raise WorkerError(f"model not found: {path}")
+        return path  # the script loads the HEF itself
+
+    def unload_model(self, model):
+        pass
+
+    def open(self, model, source, settings):
+        return ScriptSession(self.script, model, source, settings)
+
+
+class InferenceWorker:
+    """Command handling; called from one thread at a time."""
+
+    def __init__(self, backend, cache_size=3):
+        self.backend = backend
+        self.cache = ModelCache(backend, cache_size)
+        self.session = None
+        self.model_path = None
+        self.source = None
+        self.settings = dict(DEFAULT_SETTINGS)
+
+    def handle(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("cmd"), str):
+            return {"ok": False, "error": "expected {\"cmd\": ...}"}
+        handler = getattr(self, "cmd_" + request["cmd"], None)
+        if handler is None:
+            return {"ok": False, "error": f"unknown command {request['cmd']!r}"}
+        try:
+            handler(request)
+        except (WorkerError, KeyError, TypeError, ValueError, OSError) as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+        return {"ok": True, "status": self.status()}
+
+    def _thresholds(self, request):
+        return {key: float(request[key]) for key in ("iou", "conf") if key in request}
+
+    def cmd_start(self, request):
+        if self.session is None:
+            self.settings.update(self._thresholds(request))
+            for key in ("task", "jsonframe", "ring"):
+                if key in request:
+                    self.settings[key] = request[key]
+            model = self.cache.get(request["model"])
+            self.session = self.backend.open(model, request["input"], self.settings)
+            self.model_path, self.source = request["model"], request["input"]
+            return
+        # Already running: only touch what changed
+        if any(request.get(key, self.settings[key]) != self.settings[key] for key in ("task", "jsonframe", "ring")):
+            self.cmd_stop(request)
+            self.cmd_start(request)
+            return
+        if request["model"] != self.model_path:
+            self.cmd_switch_model(request)
+        if request["input"] != self.source:
+            self.cmd_switch_input(request)
+        self.cmd_set_thresholds(request)
+
+    def cmd_stop(self, request):
+        if self.session:
+            self.session.stop()
+            self.session = None
+
+    def cmd_switch_model(self, request):
+        model = self.cache.get(request["model"])
+        self.model_path = request["model"]
+        if self.session:
+            self.session.set_model(model)
+
+    def cmd_switch_input(self, request):
+        self.source = request["input"]
+        if self.session:
+            self.session.set_source(self.source)
+
+    def cmd_set_thresholds(self, request):
+        thresholds = self._thresholds(request)
+        self.settings.update(thresholds)
+        if self.session and thresholds:
+            self.session.set_thresholds(thresholds)
+
+    def cmd_status(self, request):
+        pass
+
+    def cmd_shutdown(self, request):
+        self.cmd_stop(request)
+
+    def status(self):
+        return {
+            "backend": self.backend.name,
+            "running": self.session is not None,
+            "model": self.model_path,
+            "input": self.source,
+            "settings": self.settings,
+            "cached_models": list(self.cache.models),
+            "model_loads": self.cache.loads,
+            "cache_hits": self.cache.hits,
+        }
+
+
+async def serve(worker, path=WORKER_SOCKET):
+    """Accept control connections on ``path`` until a shutdown command arrives."""
+    loop = asyncio.get_running_loop()
+    # One thread runs every command, so the worker never sees two at once
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    done = asyncio.Event()
+
+    async def on_client(reader, writer):
+        decoder = MessageDecoder()
+        try:
+            while not done.is_set():
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for request in decoder.feed(data):
+                    reply = await loop.run_in_executor(executor, worker.handle, request)
+                    writer.write(encode_message(reply))
+                    await writer.drain()
+                    if isinstance(request, dict) and request.get("cmd") == "shutdown" and reply["ok"]:
+                        done.set()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(on_client, path)
+    print(f"Inference worker ({worker.backend.name}) listening on {path}")
+    try:
+        await done.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await loop.run_in_executor(executor, worker.cmd_stop, {})
+        executor.shutdown()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def worker_listening(path=WORKER_SOCKET):
+    """True if a worker accepts connections on ``path``; a stale socket left by a crashed one is removed."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except ConnectionRefusedError:
+        os.remove(path)
+        return False
+    finally:
+        sock.close()
+
+
+class WorkerClient:
+    """Blocking client for the control socket; reconnects on the next request after a failure."""
+
+    def __init__(self, path=WORKER_SOCKET, timeout=30.0, connect_timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout  # a freshly started worker needs a moment to listen
+        self.sock = None
+        self.decoder = MessageDecoder()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def request(self, cmd, **params):
+        """Send one command and return its status dict; raises WorkerError."""
+        try:
+            if self.sock is None:
+                self.sock = self._connect()
+                self.decoder.reset()
+            self.sock.sendall(encode_message(dict(params, cmd=cmd)))
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise ConnectionError("worker closed the connection")
+                replies = self.decoder.feed(data)
+                if replies:
+                    reply = replies[0]
+                    break
+        except OSError as e:
+            self.close()
+            raise WorkerError(f"inference worker unavailable at {self.path}: {e}") from None
+        if not reply.get("ok"):
+            raise WorkerError(reply.get("error", "request failed"))
+        return reply["status"]
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm inference worker for the detection launcher")
+    parser.add_argument("--socket", default=WORKER_SOCKET)
+    parser.add_argument("--backend", choices=["script", "stub"], default="script")
+    parser.add_argument("--cache-size", type=int, default=3, help="loaded models kept warm")
+    parser.add_argument("--script", default=DETECTOR_SCRIPT, help="detector script (script backend)")
+    parser.add_argument("--load-delay", type=float, default=1.0, help="simulated model load seconds (stub backend)")
+    parser.add_argument("--metadata-port", type=int, default=METADATA_PORT, help="where the stub sends detections")
+    args = parser.parse_args()
+
+    if args.backend == "stub":
+        backend = StubBackend(args.load_delay, port=args.metadata_port)
+    else:
+        backend = ScriptBackend(args.script)
+    try:
+        asyncio.run(serve(InferenceWorker(backend, args.cache_size), args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,111 @@
+"""Decode-once ingest: pull one source, decode it once, publish raw frames.
+
+Every decoded frame goes into a frame_ring shared-memory ring with its
+frame id, PTS and wall-clock timestamp, where the viewer, the recorder and
+Python inference backends read it in place. With --shm-socket the same
+frames are also offered through shmsink, so GStreamer-based detectors can
+attach with shmsrc instead of opening the camera or RTSP stream again:
+
+    python ingest.py --input rtsp://cam/stream --shm-socket /tmp/cam.shm
+    gst-launch-1.0 shmsrc socket-path=/tmp/cam.shm is-live=true ! \\
+        video/x-raw,format=RGBx,width=640,height=480,framerate=0/1 ! videoconvert ! autovideosink
+"""
+import argparse
+import signal
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from frame_ring import FrameRingWriter, ring_name_for
+from pipelines import decoded_source
+from stream_metrics import MetricsRegistry, start_metrics_server
+
+
+def ingest_pipeline(uri, width, height, shm_socket=None):
+    launch = (
+        f"{decoded_source(uri)} ! videoconvert ! videoscale ! "
+        f"video/x-raw,format=RGBx,width={width},height={height},pixel-aspect-ratio=1/1 ! tee name=t "
+        "t. ! queue leaky=downstream max-size-buffers=1 ! "
+        "appsink name=sink emit-signals=true max-buffers=1 drop=true sync=false"
+    )
+    if shm_socket:
+        launch += (
+            f" t. ! queue leaky=downstream max-size-buffers=2 ! "
+            f"shmsink socket-path={shm_socket} shm-size={width * height * 4 * 8} "
+            "wait-for-connection=false sync=false"
+        )
+    return launch
+
+
+class Ingest:
+    def __init__(self, uri, ring_name=None, width=640, height=480, slots=8, shm_socket=None, metrics_port=0):
+        Gst.init(None)
+        self.width = width
+        self.height = height
+        self.ring = FrameRingWriter(ring_name or ring_name_for(uri), width * height * 4, slots)
+        self.metrics = MetricsRegistry("ingest")
+        self.frame_id = 0
+        self.running = True
+        self.pipeline = Gst.parse_launch(ingest_pipeline(uri, width, height, shm_socket))
+        self.pipeline.get_by_name("sink").connect("new-sample", self.on_new_sample)
+        if metrics_port:
+            start_metrics_server(self.metrics, metrics_port)
+
+    def on_new_sample(self, sink):
+        """Streaming thread: copy the decoded frame into the ring once."""
+        sample = sink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+        buf = sample.get_buffer()
+        success, map_info = buf.map(Gst.MapFlags.READ)
+        if not success:
+            return Gst.FlowReturn.OK
+        try:
+            pts = buf.pts if buf.pts != Gst.CLOCK_TIME_NONE else 0
+            self.ring.write(map_info.data, self.frame_id, pts, time.time(),
+                            self.width, self.height, self.width * 4)
+        finally:
+            buf.unmap(map_info)
+        self.frame_id += 1
+        self.metrics.count("frames_ingested")
+        return Gst.FlowReturn.OK
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        print(f"Ingest publishing {self.width}x{self.height} RGBx frames to ring {self.ring.name}")
+        self.pipeline.set_state(Gst.State.PLAYING)
+        bus = self.pipeline.get_bus()
+        try:
+            while self.running:
+                msg = bus.timed_pop_filtered(100 * Gst.MSECOND, Gst.MessageType.ERROR | Gst.MessageType.EOS)
+                if msg is None:
+                    continue
+                if msg.type == Gst.MessageType.ERROR:
+                    err, debug = msg.parse_error()
+                    print("Ingest error:", err.message)
+                break
+        finally:
+            self.pipeline.set_state(Gst.State.NULL)
+            self.ring.close()
+            print(f"Ingest stopped after {self.frame_id} frames.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode a source once and share its frames")
+    parser.add_argument("--input", required=True, help='camera node, rtsp:// URL, file or "test"')
+    parser.add_argument("--ring", help="shared-memory ring name (default derived from --input)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--slots", type=int, default=8, help="frames kept in the ring")
+    parser.add_argument("--shm-socket", help="also publish through shmsink at this path")
+    parser.add_argument("--metrics-port", type=int, default=0, help="local Prometheus endpoint, 0 to disable")
+    args = parser.parse_args()
+
+    ingest = Ingest(args.input, args.ring, args.width, args.height, args.slots, args.shm_socket, args.metrics_port)
+    signal.signal(signal.SIGTERM, ingest.stop)
+    signal.signal(signal.SIGINT, ingest.stop)
+    ingest.run()
@@ -1,100 +1,106 @@
 import sys
-import subprocess
-import socket
-import json
+import collections
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QButtonGroup, 
-    QComboBox, QFileDialog, QSpinBox, QDoubleSpinBox, QTextEdit, QHBoxLayout, QFrame, QRadioButton, QMessageBox, QSizePolicy
+    QComboBox, QFileDialog, QSpinBox, QDoubleSpinBox, QPlainTextEdit, QHBoxLayout, QFrame, QRadioButton, QMessageBox, QSizePolicy,
+    QProgressDialog
 )
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
-from PyQt5.QtCore import QUrl, QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QFileSystemWatcher
 from PyQt5.QtGui import QPalette, QColor, QFont
-import numpy as np
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtCore import Qt, QTimer
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 import time 
-import psutil
-import shutil
 import os 
+import argparse
+from camera_devices import CameraRegistry, get_available_cameras
+from engine import INGEST_SIZE, REDUCED_INGEST_SIZE, Engine
+from engine_qt import EngineBridge
+from overlay import FrameMatcher, draw_detections
+from inference_worker import WORKER_SOCKET
+from model_repository import ModelRepository
+from detection_records import format_detections
+from pipelines import CODECS, DEFAULT_PORT, get_codec
+from replay import add_replay_arguments, replay_from_args
+from resilient_transport import add_transport_arguments, transport_from_args
+from event_recorder import add_event_arguments, event_recorder_from_args
+from governor import Action, TelemetrySampler, add_governor_arguments, governor_from_args
+
+DEGRADED_RENDER_INTERVAL = 66  # ms, ~15 fps while the governor sheds load
+
+class ModelImportThread(QThread):
+    """Copies a model into the repository off the GUI thread, reporting percent done."""
+    progress = pyqtSignal(int)
+    imported = pyqtSignal(str, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, repository, source, task, parent=None):
+        super().__init__(parent)
+        self.repository = repository
+        self.source = source
+        self.task = task
+        self.cancelled = False
+        self.percent = -1
 
-def get_hef_files(directory):
-    """Retrieve HEF files from the specified directory."""
-    if os.path.exists(directory):
-        return [f for f in os.listdir(directory) if f.endswith(".hef")]
-    return []
+    def run(self):
+        try:
+            entry, copied = self.repository.import_model(
+                self.source, self.task, progress=self.on_progress, cancelled=lambda: self.cancelled
+            )
+        except InterruptedError:
+            self.failed.emit("Import cancelled")
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.imported.emit(entry.name, copied)
 
-def get_available_cameras():
-    """Detect available camera devices using v4l2."""
-    try:
-        result = subprocess.run(["ls /dev/video*"], capture_output=True, text=True, shell=True)
-        available_cameras = result.stdout.strip().split("\n")
-        return available_cameras if available_cameras and available_cameras[0] else ["No Camera Found"]
-    except Exception:
-        return ["No Camera Found"]
+    def on_progress(self, done, total):
+        percent = done * 100 // total if total else 100
+        if percent != self.percent:  # one signal per percent, not per chunk
+            self.percent = percent
+            self.progress.emit(percent)
 
-class SocketThread(QThread):
-    data_received = pyqtSignal(str)
-
-    def run(self):
-        """Continuously listen for incoming connections and handle data."""
-        while True:
-            try:
-                server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow socket reuse
-                server_socket.bind(('0.0.0.0', 57344))
-                server_socket.listen(1)
-
-                print("Waiting for connection...")
-                connection, client_address = server_socket.accept()
-                print(f"Connected to {client_address}")
-
-                while True:
-                    data = connection.recv(1024)
-                    if not data:
-                        print("Client disconnected. Waiting for new connection...")
-                        break  # Break out of the inner loop and wait for a new connection
-
-                    try:
-                        json_data = json.loads(data.decode('utf-8'))
-                        formatted_data = self.format_json(json_data)
-                        self.data_received.emit(formatted_data)
-                    except json.JSONDecodeError:
-                        self.data_received.emit("Failed to decode JSON data.")
-
-                connection.close()  # Ensure the socket is closed before looping again
-
-            except Exception as e:
-                print(f"Socket error: {e}")
-                server_socket.close()  # Ensure the socket is properly closed before retrying
-
-    def format_json(self, json_data):
-        """Format JSON data to a readable dictionary."""
-        if isinstance(json_data, list) and len(json_data) > 0:
-            json_data = json_data[0]  # Extract first object if it's a list
-        formatted_dict = {
-            "boxex": json_data.get("boxex", []),
-            "confidence": json_data.get("confidence", 0.0),
-            "label": json_data.get("label", "unknown")
-        }
-        return str(formatted_dict)
+    def cancel(self):
+        self.cancelled = True
 
 class DetectionApp(QWidget):
-    def __init__(self):
-        super().__init__()
-        self.initUI()
-        self.startSocketThread()
-        self.initGStreamer()
+    """Qt client of an Engine: controls, preview and metadata panel.
 
-        self.process = None
-        self.last_frame_time = None
-        self.fps_counter = 0
-        self.total_fps = 0.0
+    The engine has already been set up (receive pipeline aside) by the
+    caller; the widget only draws what it hands over and forwards commands.
+    """
+    def __init__(self, engine, overlay_match="timestamp", overlay_wait=0.1, transport=None, port=DEFAULT_PORT):
+        super().__init__()
+        self.engine = engine
+        self.replay = engine.replay
+        self.overlay = FrameMatcher(overlay_match, overlay_wait)
+        self.overlay_labels = 64  # labels drawn per frame; boxes are always drawn
+        self.governor = None
+        self.sampler = None
+        self.last_fps_update = 0.0
+        # Fixed capacity: everything that arrives between two panel refreshes is coalesced
+        # into ``metadata_pending`` and only the newest entries survive; the panel itself
+        # keeps the last metadata_history_len lines
         self.metadata_history_len = 20
-        self.metadata_history = []
+        self.metadata_pending = collections.deque(maxlen=self.metadata_history_len)
+        self.metadata_received = 0
+        self.metadata_rendered = 0
+        self.cameras = CameraRegistry().start()
+        self.cameras_version = -1
+        self.models = ModelRepository()
+        self.model_import = None
+        self.model_watcher = QFileSystemWatcher(self)
+        self.model_watcher.directoryChanged.connect(self.onModelDirChanged)
+        self.watchModelDirs()
+        self.initUI()
+        self.last_annotated = 0.0
+        # Engine events are handled on the GUI thread
+        self.bridge = EngineBridge(engine, self)
+        self.bridge.event.connect(self.onEngineEvent)
+        # Frames arrive converted and scaled to the label size, so the GUI thread only blits them
+        self.engine.start_receiver(*self.display_size(), transport=transport, port=port)
 
     def initUI(self):
         main_layout = QHBoxLayout()
@@ -137,7 +143,6 @@ class DetectionApp(QWidget):
         control_layout.addLayout(radio_layout)
 
         self.input_dropdown = QComboBox()
-        self.input_dropdown.addItems(get_available_cameras())
         self.input_dropdown.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         self.input_dropdown.setMaximumWidth(180) 
         control_layout.addWidget(self.input_dropdown)
@@ -171,7 +176,7 @@ class DetectionApp(QWidget):
         self.conf_input.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         self.conf_input.setMaximumWidth(180) 
 
-        self.fps_label = QLabel("Avg FPS: 0")
+        self.fps_label = QLabel("FPS: 0")
         # self.fps_label.setStyleSheet("font-size: 10px;")
         layout = QVBoxLayout()
         control_layout.addWidget(self.fps_label)
@@ -237,20 +242,21 @@ class DetectionApp(QWidget):
         self.video_label = QLabel()
         self.video_label.setStyleSheet("background-color: grey; border: 3px solid black;")
 
-        # Allow QLabel to expand
-        self.video_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        # Allow QLabel to expand; Ignored keeps the pixmap from driving the layout
+        self.video_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.video_label.setMinimumSize(320, 240)
+        self.video_label.setAlignment(Qt.AlignCenter)
 
+        # Coalesce resize events before renegotiating the display caps
+        self.resize_timer = QTimer()
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.update_display_caps)
+
+        # Frames are rendered from the GUI thread, at most once per tick
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # Refresh every 30ms
-
-        self.video_widget = QVideoWidget(self.video_label)
-
-        # # Make QVideoWidget resize dynamically
-        self.video_widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-
-        self.player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
-        self.player.setVideoOutput(self.video_widget)
+        # ~60 Hz, faster than the 30 fps sender; replay at full speed pulls back to back
+        self.timer.start(self.engine.render_interval())
 
         video_layout.addWidget(self.video_label)
         main_layout.addLayout(video_layout)
@@ -258,12 +264,24 @@ class DetectionApp(QWidget):
         #################################################
 
         self.metadata_label = QLabel("Model Metadata:")
-        self.metadata_display = QTextEdit()
+        self.metadata_display = QPlainTextEdit()
         self.metadata_display.setReadOnly(True)
+        self.metadata_display.setMaximumBlockCount(self.metadata_history_len)
         self.metadata_display.setFixedHeight(150)  
         self.metadata_display.setStyleSheet("background-color: black; color: orange; font-family: monospace;")
         self.metadata_display.setFont(QFont("Courier", 10))
 
+        # Refresh the panel at a bounded rate instead of once per message
+        self.metadata_timer = QTimer()
+        self.metadata_timer.timeout.connect(self.refreshMetadata)
+        self.metadata_timer.start(100)  # 10 Hz
+
+        # The camera registry watches for hotplug in the background; the GUI only
+        # looks at its cached list when the registry reports a change
+        self.camera_timer = QTimer()
+        self.camera_timer.timeout.connect(self.refreshCameras)
+        self.camera_timer.start(500)
+
         video_layout.addWidget(self.metadata_label)  
         video_layout.addWidget(self.metadata_display) 
 
@@ -290,46 +308,93 @@ class DetectionApp(QWidget):
         if hef_path:
             self.hef_input.setText(hef_path)
 
-    def update_hef_dropdown(self):
+    def update_hef_dropdown(self, select=None):
+        """List the current task's models from the repository index; no directory scan here."""
         infer_mode = self.infer_combo.currentText()
-        directory_map = {
-            "detection": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/Detection",
-            "Segmentation": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/Segmentation",
-            "PoseEstimation": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/PoseEstimation"
-        }
-        directory = directory_map.get(infer_mode, "")
-        hef_files = get_hef_files(directory)
+        selected = select or self.hef_dropdown.currentText()
+        hef_files = [entry.name for entry in self.models.models(infer_mode)] if infer_mode in self.models.tasks else []
         self.hef_dropdown.clear()
         self.hef_dropdown.addItems(hef_files if hef_files else ["No HEF files found"])
         self.hef_dropdown.addItem("Upload Model")
+        index = self.hef_dropdown.findText(selected)
+        if selected in hef_files and index >= 0:
+            self.hef_dropdown.setCurrentIndex(index)
+
+    def watchModelDirs(self):
+        missing = [d for d in map(self.models.task_dir, self.models.tasks) if d not in self.model_watcher.directories()]
+        existing = [d for d in missing if os.path.isdir(d)]
+        if existing:
+            self.model_watcher.addPaths(existing)
+
+    def onModelDirChanged(self, directory):
+        for task in self.models.tasks:
+            if self.models.task_dir(task) == directory and self.models.rescan(task):
+                if task == self.infer_combo.currentText():
+                    self.update_hef_dropdown()
 
     def handle_hef_selection(self, index):
         if self.hef_dropdown.itemText(index) == "Upload Model":
             self.upload_model()
 
     def upload_model(self):
-        if not self.fetch_target_dir_path():
+        task = self.infer_combo.currentText()
+        if task not in self.models.tasks or self.model_import:
             return
-        
+
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Model File", "", "HEF Files (*.hef)")
-        target_directory = self.fetch_target_dir_path()
-        if file_path and file_path.endswith(".hef"):
-            try:
-                shutil.copy(file_path, target_directory)
-                self.update_hef_dropdown()
-            except Exception as e:
-                print("Error uploading file:", e)
+        if not (file_path and file_path.endswith(".hef")):
+            return
+        self.model_import = ModelImportThread(self.models, file_path, task, self)
+        self.import_progress = QProgressDialog(f"Importing {os.path.basename(file_path)}...", "Cancel", 0, 100, self)
+        self.import_progress.setMinimumDuration(500)
+        self.import_progress.canceled.connect(self.model_import.cancel)
+        self.model_import.progress.connect(self.import_progress.setValue)
+        self.model_import.imported.connect(self.onModelImported)
+        self.model_import.failed.connect(self.onModelImportFailed)
+        self.model_import.finished.connect(self.onModelImportFinished)
+        self.model_import.start()
+
+    def onModelImported(self, name, copied):
+        self.watchModelDirs()  # the task directory may have just been created
+        self.update_hef_dropdown(select=name)
+        if not copied:
+            QMessageBox.information(self, "Upload Model", f"This model is already in the repository as {name}.")
+
+    def onModelImportFailed(self, message):
+        print("Error uploading file:", message)
+        if message != "Import cancelled":
+            QMessageBox.critical(self, "Upload Model", f"Could not import the model: {message}")
+
+    def onModelImportFinished(self):
+        self.import_progress.reset()
+        self.model_import = None
 
     def update_input_options(self):
         if self.camera_radio.isChecked():
             self.input_dropdown.setVisible(True)
             self.rtsp_input.setVisible(False)
-            self.input_dropdown.clear()
-            self.input_dropdown.addItems(get_available_cameras())
+            self.refreshCameras(force=True)
         else:
             self.input_dropdown.setVisible(False)
             self.rtsp_input.setVisible(True)
 #############################################################################
+    def refreshCameras(self, force=False):
+        """Repopulate the camera dropdown from the registry cache, keeping the selection."""
+        if not force and self.cameras.version == self.cameras_version:
+            return
+        self.cameras_version = self.cameras.version
+        selected = self.input_dropdown.currentText()
+        self.input_dropdown.clear()
+        self.input_dropdown.addItems(get_available_cameras(self.cameras))
+        for index in range(self.input_dropdown.count()):
+            camera = self.cameras.get(self.input_dropdown.itemText(index))
+            if camera:
+                self.input_dropdown.setItemData(index, f"{camera.name}\n{camera.summary()}", Qt.ToolTipRole)
+        if selected:
+            index = self.input_dropdown.findText(selected)
+            if index >= 0:
+                self.input_dropdown.setCurrentIndex(index)
+
     def toggleInputField(self):
         selected_source = self.input_combo.currentText()
         if selected_source == "/dev/video0":
@@ -337,22 +402,12 @@ class DetectionApp(QWidget):
         else:
             self.rtsp_input.clear()
 
-    def fetch_target_dir_path(self):
-        infer_mode = self.infer_combo.currentText()
-        directory_map = {
-            "detection": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/Detection/",
-            "Segmentation": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/Segmentation/",
-            "PoseEstimation": "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models/PoseEstimation/"
-        }
-        target_directory = directory_map.get(infer_mode, "")
-        return target_directory
-
     def runDetection(self):
         # warning if no HEF is selected 
-        if self.hef_dropdown.currentText() == "Upload Model":
+        if self.hef_dropdown.currentText() in ("Upload Model", "No HEF files found"):
             QMessageBox.critical(self, "Error", "No valid HEF file selected! Please select a HEF file.")
             return False
-        hef_path = self.fetch_target_dir_path() + self.hef_dropdown.currentText()
+        hef_path = self.models.path(self.infer_combo.currentText(), self.hef_dropdown.currentText())
         rtsp_url = self.rtsp_input.text() if self.rtsp_radio.isChecked() else self.input_dropdown.currentText()
         # warning if no RTSP url 
         if len(rtsp_url) == 0:
@@ -376,133 +431,229 @@ class DetectionApp(QWidget):
         infer_type = self.infer_combo.currentText()
         
 
-        command = [
-            "python", "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/new_pipe/np_detection_test.py",
-            "--hef-path", hef_path,
-            "--input", rtsp_url,
-            # "--iou", str(iou),
-            # "--conf", str(conf),
-            "--infer", infer_type,
-            "--jsonframe", str(json_frame)
-        ]
-        self.process = subprocess.Popen(command)
-        print(command)
-        # Start GStreamer-based RTSP playback
-        self.startStream(rtsp_url)
+        if rtsp_url != self.engine.ingest_input:
+            self.overlay.clear()  # its frames live in the ring that is about to go away
+        self.engine.start_detection(hef_path, rtsp_url, task=infer_type, iou=iou, conf=conf, jsonframe=json_frame)
 
     def stopDetection(self):
-        """Terminate the running script."""
-        if self.process:
-            self.process.terminate()  # Send SIGTERM
-            self.process.wait()  # Wait for the process to exit
-            self.process = None
-        #     self.status_label.setText("Status: Stopped")
-        # else:
-        #     self.status_label.setText("Status: No Process Running")
+        """Stop inference; the worker stays up with its models loaded."""
+        self.overlay.clear()
+        self.engine.stop_detection()
+
+    def onEngineEvent(self, name, args):
+        handler = {
+            "metadata": self.updateMetadata,
+            "metadata_stats": self.updateMetadataStats,
+            "worker_reply": self.onWorkerReply,
+            "worker_failed": self.onWorkerFailed,
+            "replay_finished": self.onReplayFinished,
+        }.get(name)
+        if handler:
+            handler(*args)
+
+    def onWorkerReply(self, cmd, status):
+        state = "running" if status["running"] else "stopped"
+        print(f"Inference worker {cmd}: {state}, model {status['model']}, "
+              f"{status['model_loads']} loads / {status['cache_hits']} cache hits")
+
+    def onWorkerFailed(self, cmd, message):
+        print(f"Inference worker {cmd} failed:", message)
+        QMessageBox.critical(self, "Inference worker", message)
     
-    def startStream(self, rtsp_url):
-        media = QMediaContent(QUrl(rtsp_url))
-        self.player.setMedia(media)
-        self.player.play()
-    
-    def startSocketThread(self):
-        self.socket_thread = SocketThread()
-        self.socket_thread.data_received.connect(self.updateMetadata)
-        self.socket_thread.start()
+    def update_preview(self):
+        """Show the newest ingested frame with its detections while no annotated stream is arriving."""
+        now = time.monotonic()
+        frame = self.engine.latest_ring_frame()
+        if frame is not None:
+            self.overlay.push(frame, now)
+        ready = self.overlay.pop_ready(now)
+        if ready is None:
+            return
+        frame, detections = ready
+        self.display_frame(frame.data, frame.width, frame.height, frame.stride, detections, frame.valid)
+        frame.release()
+        metrics = self.engine.metrics
+        metrics.set_gauge("overlay_matched", self.overlay.matched)
+        metrics.set_gauge("overlay_unmatched", self.overlay.unmatched)
+        metrics.set_gauge("overlay_skipped", self.overlay.skipped)
     
-    def updateMetadata(self, data):
-        self.metadata_history.append(data)
-        if len(self.metadata_history) > self.metadata_history_len:
-            self.metadata_history.pop(0)
-
-        self.metadata_display.setText("\n".join(self.metadata_history))
-
-        # self.metadata_display.setText(data)
-
-    def initGStreamer(self):
-        """Initialize the GStreamer pipeline to receive UDP video."""
-        Gst.init(None)
-
-        # pipeline_str = (
-        #     "udpsrc port=5000 caps=\"application/x-rtp,encoding-name=H264,payload=96\" ! "
-        #     "rtph264depay ! h264parse ! avdec_h264 ! videoconvert ! video/x-raw,format=BGR ! "
-        #     "appsink name=sink emit-signals=true"
-        # )
-
-        pipeline_str = (
-            "udpsrc port=5000 ! application/x-rtp,encoding-name=JPEG,payload=26\""
-            " ! rtpjpegdepay ! jpegdec ! videoconvert ! video/x-raw,format=BGR ! appsink name=sink emit-signals=True"
+    def updateMetadata(self, batch):
+        """Queue a batch for the next panel refresh; older unrendered entries fall off."""
+        self.metadata_received += len(batch)
+        self.metadata_pending.extend(batch)
+        for source, detections in batch:
+            self.overlay.add_detections(detections)
+
+    def refreshMetadata(self):
+        """Append only what arrived since the last refresh, in one edit."""
+        if not self.metadata_pending:
+            return
+        lines = [f"[{source}] {format_detections(detections)}" for source, detections in self.metadata_pending]
+        self.metadata_pending.clear()
+        self.metadata_rendered += len(lines)
+        # The document keeps at most metadata_history_len blocks, dropping the oldest
+        self.metadata_display.appendPlainText("\n".join(lines))
+
+    def updateMetadataStats(self, stats):
+        self.metadata_label.setText(
+            f"Model Metadata: {stats['messages_per_sec']:.1f} msg/s, "
+            f"{stats['bytes_per_sec'] / 1024:.1f} KB/s, "
+            f"{stats['connections']} sources, {stats['dropped']} dropped, "
+            f"{stats['parse_errors']} parse errors, {stats['oversized']} oversized, "
+            f"{self.metadata_rendered} rendered / {self.metadata_received - self.metadata_rendered} coalesced"
         )
 
-        self.pipeline = Gst.parse_launch("udpsrc port=5000 ! application/x-rtp,encoding-name=JPEG,payload=26 ! rtpjpegdepay ! jpegdec ! videoconvert ! video/x-raw,format=BGR ! appsink name=sink emit-signals=True")
-        self.appsink = self.pipeline.get_by_name("sink")
-
-        if not self.appsink:
-            print("Error: appsink element not found in pipeline")
+    def update_frame(self):
+        """Render the newest frame, if any arrived since the last tick (GUI thread)."""
+        item = self.engine.take_frame()
+        if item is None:
+            if not self.replay and time.monotonic() - self.last_annotated > 1.0:
+                self.update_preview()
             return
+        sample, arrived, detections = item
+        self.last_annotated = time.monotonic()
+        self.render_sample(sample, arrived, detections)
+
+    def onReplayFinished(self, report):
+        print(report)
+        self.fps_label.setText(f"Replay: {self.replay.fps():.1f} fps")
+        if self.replay.exit_at_end:
+            self.close()
+
+    def render_sample(self, sample, arrived, detections=()):
+        buf = sample.get_buffer()
+        caps = sample.get_caps()
+        width = caps.get_structure(0).get_int("width")[1]
+        height = caps.get_structure(0).get_int("height")[1]
+        success, map_info = buf.map(Gst.MapFlags.READ)
+        if not success:
+            return
+        try:
+            self.display_frame(map_info.data, width, height, detections=detections)
+        finally:
+            buf.unmap(map_info)
+
+        self.engine.frame_shown(sample, arrived)
+
+        # Frames actually shown over the metrics window, refreshed once a second
+        current_time = time.monotonic()
+        if current_time - self.last_fps_update >= 1.0:
+            self.last_fps_update = current_time
+            fps = self.engine.metrics.rate("frames_displayed")
+            self.fps_label.setText(f"FPS: {fps:.2f} | Dropped: {self.engine.frame_mailbox.dropped}")
+
+    def display_frame(self, data, width, height, stride=None, detections=(), valid=None):
+        """Blit an RGBx frame, scaling it unless GStreamer already did, and draw ``detections`` over it.
+
+        ``valid`` is checked once the pixels have been copied out of ``data``, for
+        buffers that another process may overwrite (the ingest ring).
+        """
+        q_img = QImage(data, width, height, stride or 4 * width, QImage.Format_RGBX8888)
+        size = self.video_label.contentsRect().size()
+        if (width, height) != (size.width(), size.height()):
+            q_img = q_img.scaled(size, Qt.KeepAspectRatio)
+        # fromImage uploads a copy, so the mapped buffer may be released afterwards
+        pixmap = QPixmap.fromImage(q_img)
+        del q_img
+        if valid and not valid():
+            return
+        draw_detections(pixmap, detections, width, height, self.overlay_labels)
+        self.video_label.setPixmap(pixmap)
+
+    def governor_actions(self):
+        """What to give up under load, cheapest first."""
+        return [
+            Action("display_fps", lambda: self.timer.setInterval(DEGRADED_RENDER_INTERVAL),
+                   lambda: self.timer.setInterval(self.engine.render_interval())),
+            Action("overlay_quality", lambda: self.set_overlay_quality(False), lambda: self.set_overlay_quality(True)),
+            Action("capture_resolution", lambda: self.set_ingest_size(*REDUCED_INGEST_SIZE),
+                   lambda: self.set_ingest_size(*INGEST_SIZE)),
+        ]
 
-        self.appsink.set_property("emit-signals", True)
-        self.appsink.connect("new-sample", self.on_new_sample)
-        # self.appsink.connect("fps-measurements", self.on_fps_measurement)
-
-        # Start GStreamer pipeline
-        ret = self.pipeline.set_state(Gst.State.PLAYING)
-        if ret == Gst.StateChangeReturn.FAILURE:
-            print("Error: Could not start GStreamer pipeline.")
-
-    def on_new_sample(self, sink):
-        """Callback function to retrieve frames from appsink."""
-        sample = sink.emit("pull-sample")
-        if sample:
-            buf = sample.get_buffer()
-            caps = sample.get_caps()
-            width = caps.get_structure(0).get_int("width")[1]
-            height = caps.get_structure(0).get_int("height")[1]
-            success, map_info = buf.map(Gst.MapFlags.READ)
-            if success:
-                frame = np.frombuffer(map_info.data, np.uint8).reshape((height, width, 3))
-                self.display_frame(frame)
-                buf.unmap(map_info)
-
-            current_time = time.time()
-            if self.last_frame_time:
-                delta = current_time - self.last_frame_time
-                if delta > 0:
-                    fps = 1 / delta
-                    self.total_fps += fps
-                    self.fps_counter += 1
-                    avg_fps = self.total_fps / self.fps_counter
-                    # print(f"Instant FPS: {fps:.2f} | Avg FPS: {avg_fps:.2f}")
-                    self.fps_label.setText(f"Avg FPS: {avg_fps:.2f}")
-            self.last_frame_time = current_time
-
-        return Gst.FlowReturn.OK
-
-    def display_frame(self, frame):
-        """Convert OpenCV frame to PyQt format and display it."""
-        height, width, channel = frame.shape
-        bytes_per_line = channel * width
-        q_img = QImage(frame.data, width, height, bytes_per_line, QImage.Format_BGR888)
-
-        # Scale image to fit 480x480
-        label_width = self.video_label.width()
-        label_height = self.video_label.height()
-        if label_width > 1080 or label_height > 720:  # Adjust limits as per your UI
-            label_width = 1080
-            label_height = 720
-        print(f"{label_height} {label_width}")
-        scaled_img = q_img.scaled(label_width, label_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        # self.video_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.video_label.setPixmap(QPixmap.fromImage(scaled_img))
-        # print("called")
-
-    def update_frame(self):
-        """Force repaint the QLabel to refresh the video display."""
-        self.video_label.repaint()
+    def set_overlay_quality(self, full):
+        """Boxes only and a 1 Hz metadata panel, or labels and 10 Hz."""
+        self.overlay_labels = 64 if full else 0
+        self.metadata_timer.setInterval(100 if full else 1000)
+
+    def set_ingest_size(self, width, height):
+        self.overlay.clear()  # its frames live in the ring that is about to be replaced
+        self.engine.set_ingest_size(width, height)
+
+    def start_governor(self, governor, interval=2.0):
+        self.governor = governor
+        self.sampler = TelemetrySampler()
+        self.governor_timer = QTimer()
+        self.governor_timer.timeout.connect(self.updateGovernor)
+        self.governor_timer.start(int(interval * 1000))
+
+    def updateGovernor(self):
+        self.sampler.watch("gui", os.getpid())
+        pids = self.engine.child_pids()
+        for role in ("worker", "ingest"):
+            self.sampler.watch(role, pids.get(role))
+        self.governor.update(self.sampler.sample())
+
+    def display_size(self):
+        """Size of the video area, capped to what the UI is laid out for."""
+        rect = self.video_label.contentsRect()
+        width = min(max(rect.width(), 2), 1080)  # Adjust limits as per your UI
+        height = min(max(rect.height(), 2), 720)
+        return width - width % 2, height - height % 2
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resize_timer.start(100)
+
+    def update_display_caps(self):
+        """Have frames arrive at the current label size."""
+        self.engine.set_display_size(*self.display_size())
+
+    def closeEvent(self, event):
+        if self.governor:
+            self.governor_timer.stop()
+        self.timer.stop()
+        self.metadata_timer.stop()
+        self.camera_timer.stop()
+        self.cameras.stop()
+        self.bridge.close()
+        self.overlay.clear()
+        self.engine.close()
+        event.accept()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = DetectionApp()
+    parser = argparse.ArgumentParser(description="Detection launcher")
+    parser.add_argument("--metrics-port", type=int, default=9100, help="local Prometheus endpoint, 0 to disable")
+    parser.add_argument("--metrics-csv", help="write a metrics CSV here on exit")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mjpeg",
+                        help="codec of the annotated stream on UDP port 5000")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="UDP port of the annotated stream")
+    parser.add_argument("--worker-socket", default=WORKER_SOCKET, help="inference worker control socket")
+    parser.add_argument("--worker-backend", choices=["script", "stub"], default="script",
+                        help="backend for the worker if the launcher has to start it")
+    parser.add_argument("--overlay-match", choices=["timestamp", "frame_id"], default="timestamp",
+                        help="how detections are paired with preview frames")
+    parser.add_argument("--overlay-wait", type=int, default=100, help="ms a frame may wait for its detections")
+    parser.add_argument("--record-dir", help="record every detection to a binary log in this directory")
+    add_replay_arguments(parser)
+    add_transport_arguments(parser)
+    add_event_arguments(parser)
+    add_governor_arguments(parser)
+    args, qt_args = parser.parse_known_args()
+    if args.clip_dir and args.replay and not args.clip_source:
+        parser.error("--clip-dir records the live stream; give --clip-source to use it with --replay")
+    app = QApplication(sys.argv[:1] + qt_args)
+    engine = Engine("launcher", get_codec(args.codec), args.metrics_port, args.metrics_csv, replay_from_args(args))
+    engine.start_metadata(args.record_dir)
+    engine.start_worker(args.worker_socket, args.worker_backend)
+    window = DetectionApp(engine, args.overlay_match, args.overlay_wait / 1000.0, transport_from_args(args),
+                          args.port)
+    governor = governor_from_args(args, window.governor_actions(), engine.metrics)
+    if governor:
+        window.start_governor(governor, args.governor_interval)
+    events = event_recorder_from_args(args, engine)
     window.show()
-    sys.exit(app.exec_())
+    status = app.exec_()
+    if events:
+        events.close()
+    sys.exit(status)
 
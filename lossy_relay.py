@@ -0,0 +1,149 @@
+"""UDP relay that loses, delays, reorders and duplicates packets, to test the transport under loss.
+
+Losses follow a two-state (Gilbert-Elliott) model: ``loss`` is the long-run
+loss rate and ``burst`` the mean number of packets lost in a row, so 1 means
+independent losses and larger values model the bursty loss of a cellular
+link. Each packet is delayed by ``delay`` +/- ``jitter`` ms; with jitter
+larger than the packet spacing, packets arrive out of order.
+
+    python lossy_relay.py --listen 6000 --forward 127.0.0.1:5000 --loss 0.03 --burst 3 --jitter 10
+    python "usb stream gui/sender.py" --port 6000 --fec 30 --nack
+    python "usb stream gui/receiver.py" --fec 30 --nack --rtcp-host 127.0.0.1
+
+RTCP goes through the relay too, under the same loss model, so NACKs and
+sender reports can be lost like media: sender reports from listen + 1 to
+forward + 1, and receiver reports and NACKs from forward + 5 (the port the
+receiver sends them to, on this host) back to the sender's host on
+listen + 5 (see pipelines.RTCP_OFFSET).
+"""
+import argparse
+import asyncio
+import random
+import signal
+
+from pipelines import RTCP_OFFSET, RTCP_RETURN_OFFSET
+
+
+class LossModel:
+    def __init__(self, loss=0.0, burst=1.0, rng=None):
+        self.rng = rng or random.Random()
+        self.losing = False
+        burst = max(burst, 1.0)
+        # Stationary loss rate of the two-state chain is p_enter / (p_enter + p_leave) == loss
+        self.p_leave = 1.0 / burst
+        self.p_enter = loss * self.p_leave / (1.0 - loss) if loss < 1.0 else 1.0
+
+    def lose(self):
+        if self.losing:
+            self.losing = self.rng.random() >= self.p_leave
+        else:
+            self.losing = self.rng.random() < self.p_enter
+        return self.losing
+
+
+class LossyRelay(asyncio.DatagramProtocol):
+    def __init__(self, forward, loss=0.0, burst=1.0, delay=0.0, jitter=0.0, duplicate=0.0, seed=None):
+        self.forward = forward  # None drops everything until it is known
+        self.reply = None  # (relay, port): point that relay back at the host our packets come from
+        self.rng = random.Random(seed)
+        self.model = LossModel(loss, burst, self.rng)
+        self.delay = delay / 1000.0
+        self.jitter = jitter / 1000.0
+        self.duplicate = duplicate
+        self.received = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.last_due = 0.0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        if self.reply:
+            relay, port = self.reply
+            relay.forward = (addr[0], port)
+        if self.forward is None:
+            self.dropped += 1
+            return
+        if self.model.lose():
+            self.dropped += 1
+            return
+        copies = 2 if self.rng.random() < self.duplicate else 1
+        self.duplicated += copies - 1
+        for _ in range(copies):
+            self.schedule(data)
+
+    def schedule(self, data):
+        wait = max(0.0, self.delay + self.rng.uniform(-self.jitter, self.jitter))
+        due = self.loop.time() + wait
+        if due < self.last_due:
+            self.reordered += 1
+        self.last_due = max(self.last_due, due)
+        if wait:
+            self.loop.call_later(wait, self.transport.sendto, data, self.forward)
+        else:
+            self.transport.sendto(data, self.forward)
+
+    def summary(self):
+        rate = self.dropped / self.received if self.received else 0.0
+        return (f"{self.received} received, {self.dropped} dropped ({rate:.1%}), "
+                f"{self.reordered} reordered, {self.duplicated} duplicated")
+
+
+async def run(args):
+    host, port = args.forward.rsplit(":", 1)
+    port = int(port)
+    loop = asyncio.get_running_loop()
+    relays = {}  # name -> (transport, relay)
+
+    async def start(name, listen, forward, seed):
+        relays[name] = await loop.create_datagram_endpoint(
+            lambda: LossyRelay(forward, args.loss, args.burst, args.delay, args.jitter, args.duplicate, seed),
+            local_addr=("0.0.0.0", listen),
+        )
+        return relays[name][1]
+
+    rtp = await start("rtp", args.listen, (host, port), args.seed)
+    if not args.no_rtcp:
+        seed = None if args.seed is None else args.seed + 1
+        await start("rtcp", args.listen + RTCP_OFFSET, (host, port + RTCP_OFFSET), seed)
+        # The receiver reports to port + RTCP_RETURN_OFFSET here; the sender listens on ours
+        returned = await start("rtcp return", port + RTCP_RETURN_OFFSET, None, seed)
+        rtp.reply = (returned, args.listen + RTCP_RETURN_OFFSET)
+    stopped = asyncio.Event()
+    loop.add_signal_handler(signal.SIGINT, stopped.set)
+    loop.add_signal_handler(signal.SIGTERM, stopped.set)
+    print(f"Relaying UDP {args.listen} -> {args.forward}: loss {args.loss:.1%} (bursts of {args.burst:g}), "
+          f"delay {args.delay:g} +/- {args.jitter:g} ms, duplicates {args.duplicate:.1%}"
+          + ("" if args.no_rtcp else ", RTCP both ways"))
+    try:
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), args.report_interval)
+            except asyncio.TimeoutError:
+                print("; ".join(f"{name}: {relay.summary()}" for name, (_, relay) in relays.items()))
+    finally:
+        for transport, _ in relays.values():
+            transport.close()
+        print("Relay stopped:", "; ".join(f"{name}: {relay.summary()}" for name, (_, relay) in relays.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lossy UDP relay for transport tests")
+    parser.add_argument("--listen", type=int, default=6000, help="UDP port to receive on")
+    parser.add_argument("--forward", default="127.0.0.1:5000", help="host:port to send to")
+    parser.add_argument("--loss", type=float, default=0.02, help="long-run packet loss rate, 0-1")
+    parser.add_argument("--burst", type=float, default=1.0, help="mean length of a loss burst, in packets")
+    parser.add_argument("--delay", type=float, default=0.0, help="ms added to every packet")
+    parser.add_argument("--jitter", type=float, default=0.0, help="ms of random delay either way (reorders)")
+    parser.add_argument("--duplicate", type=float, default=0.0, help="rate of duplicated packets, 0-1")
+    parser.add_argument("--no-rtcp", action="store_true", help="relay RTP only, not the RTCP ports beside it")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable runs")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between summaries")
+    args = parser.parse_args()
+    if not 0.0 <= args.loss < 1.0:
+        parser.error("--loss must be in [0, 1)")
+    asyncio.run(run(args))
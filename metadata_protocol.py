@@ -0,0 +1,160 @@
+"""Framing for the detection metadata socket (port 57344).
+
+Two kinds of frames may be interleaved on one connection:
+
+* JSON: one UTF-8 JSON document followed by a newline ("\\n"), i.e.
+  newline-delimited JSON. JSON encoders never emit raw newlines inside a
+  document, so the newline is an unambiguous frame boundary no matter how
+  TCP splits or coalesces the bytes.
+* Binary: an 8-byte header (BINARY_MAGIC, version byte, reserved byte,
+  little-endian uint32 payload size) followed by the payload. The magic
+  starts with a byte that can never begin a JSON document.
+
+Which binary versions a peer may send is agreed in the hello exchange
+(see metadata_server); JSON is always accepted.
+"""
+import json
+import struct
+import time
+
+METADATA_PORT = 57344
+RECV_BUFFER_SIZE = 64 * 1024
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+
+BINARY_MAGIC = b"\xd5\xec"
+BINARY_HEADER = struct.Struct("<2sBBI")
+
+
+def encode_message(obj):
+    """Serialize one message into a newline-terminated frame."""
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def encode_binary(version, payload):
+    """Wrap a binary payload into a frame."""
+    return BINARY_HEADER.pack(BINARY_MAGIC, version, 0, len(payload)) + payload
+
+
+class MessageDecoder:
+    """Incremental decoder for newline-delimited JSON and binary frames.
+
+    feed() accepts whatever a single recv() returned and gives back every
+    complete message in it; a trailing partial frame is kept until the rest
+    arrives. ``binary_decoders`` maps a binary version to a callable that
+    turns the payload (a bytearray) into a message; frames of any other
+    version are skipped and counted as parse errors.
+    """
+
+    def __init__(self, max_message_size=MAX_MESSAGE_SIZE, binary_decoders=None):
+        self.max_message_size = max_message_size
+        self.binary_decoders = binary_decoders or {}
+        self._buffer = bytearray()
+        self._discarding = False
+        self._skip = 0
+        self.bytes_received = 0
+        self.messages = 0
+        self.parse_errors = 0
+        self.oversized = 0
+
+    def feed(self, data):
+        """Append received bytes and return the list of decoded messages."""
+        self.bytes_received += len(data)
+        self._buffer += data
+
+        if self._skip:
+            # Still inside the payload of an oversized binary frame
+            skipped = min(self._skip, len(self._buffer))
+            del self._buffer[:skipped]
+            self._skip -= skipped
+
+        messages = []
+        start = 0
+        buffer_len = len(self._buffer)
+        while start < buffer_len:
+            if self._buffer[start] == BINARY_MAGIC[0] and not self._discarding:
+                if buffer_len - start < BINARY_HEADER.size:
+                    break
+                magic, version, _, size = BINARY_HEADER.unpack_from(self._buffer, start)
+                if magic != BINARY_MAGIC:
+                    # Not a frame we understand; resynchronise on the next newline
+                    self.parse_errors += 1
+                    self._discarding = True
+                    continue
+                if size > self.max_message_size:
+                    self.oversized += 1
+                    self._skip = size - min(size, buffer_len - start - BINARY_HEADER.size)
+                    start = min(buffer_len, start + BINARY_HEADER.size + size)
+                    continue
+                end = start + BINARY_HEADER.size + size
+                if end > buffer_len:
+                    break
+                payload = self._buffer[start + BINARY_HEADER.size:end]
+                start = end
+                decode = self.binary_decoders.get(version)
+                if decode is None:
+                    self.parse_errors += 1
+                    continue
+                try:
+                    messages.append(decode(payload))
+                except ValueError:
+                    self.parse_errors += 1
+                continue
+
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = self._buffer[start:end]
+            start = end + 1
+            if self._discarding:
+                # Tail of a frame that was already dropped
+                self._discarding = False
+                continue
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except ValueError:  # also covers UnicodeDecodeError
+                self.parse_errors += 1
+        del self._buffer[:start]
+
+        if len(self._buffer) > self.max_message_size:
+            self.oversized += 1
+            self._buffer.clear()
+            self._discarding = True
+
+        self.messages += len(messages)
+        return messages
+
+    def reset(self):
+        """Forget any partial frame, e.g. after the peer disconnects."""
+        self._buffer.clear()
+        self._discarding = False
+        self._skip = 0
+
+
+class ThroughputCounter:
+    """Turns a decoder's running totals into per-second rates."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._last_time = time.monotonic()
+        self._last_bytes = 0
+        self._last_messages = 0
+
+    def poll(self, decoder):
+        """Return a stats dict once per interval, otherwise None."""
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        if elapsed < self.interval:
+            return None
+        stats = {
+            "bytes_per_sec": (decoder.bytes_received - self._last_bytes) / elapsed,
+            "messages_per_sec": (decoder.messages - self._last_messages) / elapsed,
+            "messages": decoder.messages,
+            "parse_errors": decoder.parse_errors,
+            "oversized": decoder.oversized,
+        }
+        self._last_time = now
+        self._last_bytes = decoder.bytes_received
+        self._last_messages = decoder.messages
+        return stats
@@ -0,0 +1,220 @@
+"""asyncio ingestion server for detection metadata from many detector processes.
+
+Each detector (one per camera/model) connects to METADATA_PORT and sends
+frames as described in metadata_protocol. A connection may start with
+
+    {"hello": {"source": "cam0/yolov8", "formats": ["binary/1", "json"], "labels": [...]}}
+
+to name itself, list the record formats it can send and the label names its
+class ids refer to; the server answers {"format": <chosen>}. Connections
+without a hello are treated as legacy JSON senders named after their peer
+address. Every message is converted to detection_records.Detections. Messages
+are queued per source in a bounded deque that drops the oldest entry when
+full, so one chatty detector cannot starve the others or grow memory, and
+are handed to ``on_batch`` in coalesced batches every ``batch_interval``.
+A source's queue, and its stats entry, goes away once its last connection
+has closed and its messages have been handed on, so reconnects from new
+ephemeral ports do not accumulate.
+"""
+import asyncio
+import collections
+
+from detection_records import (
+    FORMAT_JSON, SUPPORTED_FORMATS, Detections, LabelTable, make_decoder, records_from_json,
+)
+from metadata_protocol import METADATA_PORT, RECV_BUFFER_SIZE, ThroughputCounter, encode_message
+
+
+class IngestTotals:
+    """Running totals across all connections, in the shape ThroughputCounter expects."""
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.messages = 0
+        self.parse_errors = 0
+        self.oversized = 0
+        self.dropped = 0
+        self.connections = 0
+
+
+class SourceQueue:
+    """Bounded per-source queue with a drop-oldest policy."""
+
+    def __init__(self, maxlen):
+        self.messages = collections.deque(maxlen=maxlen)
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, message):
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(message)
+        self.received += 1
+
+
+class MetadataProtocol(asyncio.BufferedProtocol):
+    """One detector connection; reads straight into a per-connection buffer."""
+
+    def __init__(self, server):
+        self.server = server
+        self.decoder = make_decoder()
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.source = None
+        self.labels = LabelTable()
+        self.format = FORMAT_JSON
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info("peername")
+        self.source = f"{peer[0]}:{peer[1]}" if peer else "unknown"
+        self.server.source_opened(self.source)
+        self.server.totals.connections += 1
+        print(f"Metadata source connected: {self.source}")
+
+    def get_buffer(self, sizehint):
+        return self.view
+
+    def buffer_updated(self, nbytes):
+        errors = self.decoder.parse_errors
+        oversized = self.decoder.oversized
+        messages = self.decoder.feed(self.view[:nbytes])
+
+        totals = self.server.totals
+        totals.bytes_received += nbytes
+        totals.parse_errors += self.decoder.parse_errors - errors
+        totals.oversized += self.decoder.oversized - oversized
+
+        for message in messages:
+            if isinstance(message, dict) and "hello" in message:
+                self.handle_hello(message["hello"])
+                continue
+            if isinstance(message, (dict, list)):
+                try:
+                    message = records_from_json(message, self.labels)
+                except (TypeError, ValueError):
+                    totals.parse_errors += 1
+                    continue
+            elif not hasattr(message, "dtype"):
+                totals.parse_errors += 1
+                continue
+            totals.messages += 1
+            self.server.enqueue(self.source, Detections.from_message(message, self.labels))
+
+    def handle_hello(self, hello):
+        if not isinstance(hello, dict):
+            return
+        if hello.get("source"):
+            self.server.source_closed(self.source)
+            self.source = str(hello["source"])
+            self.server.source_opened(self.source)
+        if hello.get("labels"):
+            self.labels = LabelTable(hello["labels"])
+        offered = hello.get("formats")
+        if offered:
+            # First of our formats the detector offers; JSON is always understood
+            self.format = next((f for f in SUPPORTED_FORMATS if f in offered), FORMAT_JSON)
+            self.transport.write(encode_message({"format": self.format}))
+
+    def connection_lost(self, exc):
+        self.server.source_closed(self.source)
+        self.server.totals.connections -= 1
+        print(f"Metadata source disconnected: {self.source}")
+
+
+class MetadataServer:
+    def __init__(self, on_batch, on_stats=None, host="0.0.0.0", port=METADATA_PORT,
+                 queue_size=64, batch_interval=0.05, retry_delay=0.5, max_retry_delay=10.0):
+        self.on_batch = on_batch
+        self.on_stats = on_stats
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.batch_interval = batch_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.queues = {}
+        self.open_sources = collections.Counter()  # source -> live connections
+        self.totals = IngestTotals()
+        self._loop = None
+        self._stopped = None
+
+    def enqueue(self, source, message):
+        queue = self.queues.get(source)
+        if queue is None:
+            queue = self.queues[source] = SourceQueue(self.queue_size)
+        dropped = queue.dropped
+        queue.put(message)
+        self.totals.dropped += queue.dropped - dropped
+
+    def source_opened(self, source):
+        self.open_sources[source] += 1
+
+    def source_closed(self, source):
+        """Forget ``source`` once no connection uses it; a queue still holding messages goes after the next drain."""
+        self.open_sources[source] -= 1
+        if self.open_sources[source] > 0:
+            return
+        del self.open_sources[source]
+        queue = self.queues.get(source)
+        if queue is not None and not queue.messages:
+            del self.queues[source]
+
+    def drain(self):
+        """Take everything queued, as a list of (source, message) in per-source order."""
+        batch = []
+        for source, queue in list(self.queues.items()):
+            while queue.messages:
+                batch.append((source, queue.messages.popleft()))
+            if source not in self.open_sources:
+                del self.queues[source]
+        return batch
+
+    def source_stats(self):
+        return {source: {"received": q.received, "dropped": q.dropped, "queued": len(q.messages)}
+                for source, q in self.queues.items()}
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        # Retry the bind with exponential backoff instead of spinning on errors
+        delay = self.retry_delay
+        while not self._stopped.is_set():
+            try:
+                server = await self._loop.create_server(
+                    lambda: MetadataProtocol(self), self.host, self.port, reuse_address=True
+                )
+                break
+            except OSError as e:
+                print(f"Metadata server could not bind {self.host}:{self.port}: {e}; retrying in {delay:.1f}s")
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.max_retry_delay)
+        else:
+            return
+
+        print(f"Metadata server listening on {self.host}:{self.port}")
+        throughput = ThroughputCounter()
+        async with server:
+            while not self._stopped.is_set():
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self.batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+                batch = self.drain()
+                if batch:
+                    self.on_batch(batch)
+                stats = throughput.poll(self.totals)
+                if stats and self.on_stats:
+                    stats["dropped"] = self.totals.dropped
+                    stats["connections"] = self.totals.connections
+                    stats["sources"] = self.source_stats()
+                    self.on_stats(stats)
+
+    def stop(self):
+        """Thread-safe: ask serve_forever() to return."""
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
@@ -0,0 +1,217 @@
+"""Indexed store of HEF models, one directory per inference task.
+
+The index (``.model_index.json`` in the models root) remembers size, mtime
+and SHA-256 of every model, so listing a task is a directory scan plus a
+dict lookup and files are only hashed when they are new or have changed.
+Hashing happens on a background thread after each rescan, which saves the
+index when it is done.
+Imports are copied in chunks into a temporary file next to the target,
+hashed on the way, and renamed into place with os.replace once complete,
+so a half-copied model never shows up in a task directory. A model whose
+content is already in the task is not copied a second time.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+
+MODELS_ROOT = os.environ.get(
+    "EDGE_AI_MODELS_ROOT", "/home/mantiswave/shashwat/hailo-rpi5-examples/basic_pipelines/Models"
+)
+TASK_DIRS = {
+    "detection": "Detection",
+    "Segmentation": "Segmentation",
+    "PoseEstimation": "PoseEstimation",
+}
+MODEL_SUFFIX = ".hef"
+INDEX_NAME = ".model_index.json"
+CHUNK_SIZE = 1 << 20
+PART_SUFFIX = ".part"
+
+
+class ModelEntry:
+    __slots__ = ("name", "size", "mtime", "sha256")
+
+    def __init__(self, name, size, mtime, sha256=None):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.sha256 = sha256
+
+    def to_dict(self):
+        return {"size": self.size, "mtime": self.mtime, "sha256": self.sha256}
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRepository:
+    def __init__(self, root=MODELS_ROOT, tasks=TASK_DIRS):
+        self.root = root
+        self.tasks = dict(tasks)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._entries = {task: {} for task in self.tasks}
+        self._lock = threading.Lock()
+        self._hash_lock = threading.Lock()  # one hashing pass at a time
+        self._hash_queue = queue.Queue()
+        threading.Thread(target=self._hash_pending, name="model-hasher", daemon=True).start()
+        self._load_index()
+        for task in self.tasks:
+            self.rescan(task)
+
+    def task_dir(self, task):
+        return os.path.join(self.root, self.tasks[task])
+
+    def path(self, task, name):
+        return os.path.join(self.task_dir(task), name)
+
+    def models(self, task):
+        """Cached model entries of ``task``, sorted by name."""
+        with self._lock:
+            return sorted(self._entries.get(task, {}).values(), key=lambda e: e.name)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for task, entries in data.items():
+            if task in self._entries and isinstance(entries, dict):
+                self._entries[task] = {
+                    name: ModelEntry(name, e.get("size"), e.get("mtime"), e.get("sha256"))
+                    for name, e in entries.items() if isinstance(e, dict)
+                }
+
+    def save_index(self):
+        with self._lock:
+            data = {task: {name: e.to_dict() for name, e in entries.items()}
+                    for task, entries in self._entries.items()}
+        tmp = self.index_path + PART_SUFFIX
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print("Could not save model index:", e)
+
+    def rescan(self, task):
+        """Refresh ``task`` from its directory; True if a model was added, removed or modified.
+
+        Only stat() calls: hashes of unchanged files are kept, and new or
+        changed files are hashed (and the index saved) on the background thread.
+        """
+        directory = self.task_dir(task)
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith(MODEL_SUFFIX)]
+        except OSError:
+            names = []
+        with self._lock:
+            old = self._entries.get(task, {})
+            fresh = {}
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                known = old.get(name)
+                sha256 = known.sha256 if known and (known.size, known.mtime) == (st.st_size, st.st_mtime) else None
+                fresh[name] = ModelEntry(name, st.st_size, st.st_mtime, sha256)
+            changed = fresh.keys() != old.keys() or any(
+                (e.size, e.mtime) != (old[name].size, old[name].mtime) for name, e in fresh.items())
+            unhashed = any(e.sha256 is None for e in fresh.values())
+            self._entries[task] = fresh
+        if changed or unhashed:
+            self._hash_queue.put(task)
+        return changed
+
+    def _hash_pending(self):
+        while True:
+            self.ensure_hashes(self._hash_queue.get())
+
+    def ensure_hashes(self, task):
+        """Hash entries that are new or changed since they were indexed, then save the index; slow, never on the GUI thread."""
+        with self._hash_lock:
+            for entry in self.models(task):
+                if entry.sha256 is None:
+                    try:
+                        sha256 = hash_file(self.path(task, entry.name))
+                    except OSError:
+                        continue
+                    with self._lock:
+                        if self._entries[task].get(entry.name) is entry:  # not replaced by a rescan meanwhile
+                            entry.sha256 = sha256
+            self.save_index()
+
+    def find_by_hash(self, task, sha256):
+        for entry in self.models(task):
+            if entry.sha256 == sha256:
+                return entry
+        return None
+
+    def import_model(self, source, task, progress=None, cancelled=None, chunk_size=CHUNK_SIZE):
+        """Copy ``source`` into ``task``; returns (entry, copied). ``copied`` is False for a duplicate, found before copying.
+
+        ``progress(done, total)`` is called after every chunk and ``cancelled()``
+        is polled between chunks; a cancelled import leaves nothing behind.
+        """
+        directory = self.task_dir(task)
+        os.makedirs(directory, exist_ok=True)
+        self.rescan(task)
+        self.ensure_hashes(task)
+
+        total = os.path.getsize(source)
+        # Reading is cheap next to writing and fsyncing to the SD card: when a model of the
+        # same size is already there, hash the source first and skip the copy on a match
+        if any(entry.size == total for entry in self.models(task)):
+            existing = self.find_by_hash(task, hash_file(source, chunk_size))
+            if existing:
+                return existing, False
+
+        name = os.path.basename(source)
+        tmp = os.path.join(directory, f".{name}{PART_SUFFIX}")
+        digest = hashlib.sha256()
+        done = 0
+        try:
+            with open(source, "rb") as src, open(tmp, "wb") as dst:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    if cancelled and cancelled():
+                        raise InterruptedError("import cancelled")
+                    dst.write(chunk)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+                dst.flush()
+                os.fsync(dst.fileno())
+            if done != total:
+                raise OSError(f"{source} changed while copying ({done} of {total} bytes)")
+
+            sha256 = digest.hexdigest()
+            existing = self.find_by_hash(task, sha256)
+            if existing:
+                os.remove(tmp)
+                return existing, False
+
+            if os.path.exists(os.path.join(directory, name)):
+                # Same name, different content: keep both
+                name = f"{name[:-len(MODEL_SUFFIX)]}-{sha256[:8]}{MODEL_SUFFIX}"
+            target = os.path.join(directory, name)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        st = os.stat(target)
+        entry = ModelEntry(name, st.st_size, st.st_mtime, sha256)
+        with self._lock:
+            self._entries[task][name] = entry
+        self.save_index()
+        return entry, True
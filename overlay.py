@@ -0,0 +1,134 @@
+"""Detection overlay for the launcher preview.
+
+FrameMatcher is a small jitter buffer: frames from the ingest ring wait up
+to ``max_wait`` seconds for the detections that belong to them, matched by
+capture timestamp (within ``tolerance``) or by frame id, and a frame whose
+detections do not show up in time is shown without boxes. Older frames are
+skipped in favour of the newest ready one, so the preview never falls
+further behind than ``max_wait``.
+
+draw_detections paints every box of a frame in one QPainter pass: box
+coordinates are scaled with NumPy, boxes are drawn with one drawRects call
+per class, and at most ``max_labels`` text labels (highest confidence
+first) are drawn, which keeps the cost bounded with hundreds of boxes.
+"""
+import collections
+import time
+
+import numpy as np
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen
+
+PALETTE = [
+    QColor(230, 25, 75), QColor(60, 180, 75), QColor(255, 225, 25), QColor(0, 130, 200),
+    QColor(245, 130, 48), QColor(145, 30, 180), QColor(70, 240, 240), QColor(240, 50, 230),
+]
+
+
+class FrameMatcher:
+    def __init__(self, match="timestamp", max_wait=0.1, tolerance=0.02, max_frames=6, history=120):
+        self.match = match
+        self.max_wait = max_wait
+        self.tolerance = tolerance
+        self.max_frames = max_frames
+        self.by_frame = collections.OrderedDict()        # frame id -> [Detections]
+        self.by_time = collections.deque(maxlen=history)  # (timestamp, Detections)
+        self.history = history
+        self.pending = collections.deque()               # (frame, arrived)
+        self.matched = 0
+        self.unmatched = 0
+        self.skipped = 0
+
+    def add_detections(self, detections):
+        """File one Detections message under each frame id / timestamp it covers.
+
+        A message without records is filed under its own frame id and
+        timestamp, so that frame is shown as soon as it is known to be empty.
+        """
+        records = detections.records
+        if not len(records):
+            if detections.frame_id is not None:
+                self.by_frame.setdefault(detections.frame_id, []).append(detections)
+                self.by_time.append((detections.timestamp, detections))
+            return
+        for frame_id in np.unique(records["frame_id"]):
+            subset = records[records["frame_id"] == frame_id]
+            part = type(detections)(subset, detections.labels)
+            self.by_frame.setdefault(int(frame_id), []).append(part)
+            self.by_time.append((float(subset["timestamp"][0]), part))
+        while len(self.by_frame) > self.history:
+            self.by_frame.popitem(last=False)
+
+    def lookup(self, frame):
+        """Detections for ``frame``, or None if none have arrived yet."""
+        if self.match == "frame_id":
+            return self.by_frame.get(frame.frame_id)
+        best, best_delta = None, self.tolerance
+        for timestamp, detections in self.by_time:
+            delta = abs(timestamp - frame.timestamp)
+            if delta <= best_delta:
+                best, best_delta = timestamp, delta
+        if best is None:
+            return None
+        return [detections for timestamp, detections in self.by_time if timestamp == best]
+
+    def push(self, frame, now=None):
+        self.pending.append((frame, time.monotonic() if now is None else now))
+        while len(self.pending) > self.max_frames:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        frame, _ = self.pending.popleft()
+        frame.release()
+        self.skipped += 1
+
+    def pop_ready(self, now=None):
+        """(frame, [Detections]) for the newest frame that is matched or has waited long enough."""
+        now = time.monotonic() if now is None else now
+        for i in range(len(self.pending) - 1, -1, -1):
+            frame, arrived = self.pending[i]
+            detections = self.lookup(frame)
+            if detections is None and now - arrived < self.max_wait:
+                continue
+            for _ in range(i):
+                self._drop_oldest()
+            self.pending.popleft()
+            if detections is None:
+                self.unmatched += 1
+            else:
+                self.matched += 1
+            return frame, detections or []
+        return None
+
+    def clear(self):
+        while self.pending:
+            self.pending.popleft()[0].release()
+
+
+def draw_detections(pixmap, detections, frame_width, frame_height, max_labels=64):
+    """Draw boxes given in frame pixels (or normalised 0-1 coordinates) onto ``pixmap`` in place."""
+    if not any(len(d.records) for d in detections):
+        return
+    painter = QPainter(pixmap)
+    painter.setFont(QFont("Arial", 9))
+    labels = []
+    for part in detections:
+        records = part.records
+        boxes = np.stack([records["x1"], records["y1"], records["x2"], records["y2"]], axis=1).astype(np.float64)
+        if boxes.max() <= 1.0:
+            scale = np.array([pixmap.width(), pixmap.height()] * 2)
+        else:
+            scale = np.array([pixmap.width() / frame_width, pixmap.height() / frame_height] * 2)
+        boxes *= scale
+        class_ids = records["class_id"]
+        for class_id in np.unique(class_ids):
+            painter.setPen(QPen(PALETTE[int(class_id) % len(PALETTE)], 2))
+            painter.drawRects([QRectF(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes[class_ids == class_id]])
+        for index in np.argsort(-records["confidence"])[:max_labels]:
+            labels.append((float(records["confidence"][index]), int(class_ids[index]), part.labels, boxes[index]))
+
+    labels.sort(key=lambda item: -item[0])
+    for confidence, class_id, table, box in labels[:max_labels]:
+        painter.setPen(PALETTE[class_id % len(PALETTE)])
+        painter.drawText(int(box[0]) + 2, max(int(box[1]) - 3, 10), f"{table.name_for(class_id)} {confidence:.2f}")
+    painter.end()
@@ -0,0 +1,210 @@
+"""Shared GStreamer pipeline descriptions for the sender, the receivers and the RTSP server.
+
+Every script builds its launch string from the same codec profiles so the
+sending and receiving ends always agree on encoder, payloader, RTP caps and
+depayloader. Element names are fixed (camera, encoder, pay, depay, decoder)
+because stream_metrics and the adaptive sender look them up by name.
+
+Each profile uses its own RTP payload type, so a receiver started with
+codec "auto" can tell from the first packet which profile the sender
+is using (see probe_codec).
+"""
+import socket
+import time
+
+DEFAULT_PORT = 5000
+RTCP_OFFSET = 1         # sender reports to the receiver on RTP port + 1
+RTCP_RETURN_OFFSET = 5  # receiver reports (and NACKs) back to the sender on RTP port + 5
+
+
+class EncoderSettings:
+    """Knobs that apply across codecs; each profile uses the ones it understands."""
+
+    def __init__(self, bitrate=2000, keyframe_interval=30, quality=85):
+        self.bitrate = bitrate                      # kbit/s, H.264/H.265
+        self.keyframe_interval = keyframe_interval  # frames, H.264/H.265
+        self.quality = quality                      # 0-100, MJPEG
+
+
+class TransportSettings:
+    """Loss protection for the rtpbin transport; see resilient_transport."""
+
+    def __init__(self, latency=50, drop_on_latency=True, fec_percentage=0, nack=False):
+        self.latency = latency                  # ms of jitter buffer at the receiver
+        self.drop_on_latency = drop_on_latency  # drop packets that arrive later than that
+        self.fec_percentage = fec_percentage    # ULPFEC overhead at the sender, 0 for none
+        self.nack = nack                        # request retransmission of lost packets
+
+
+class CodecProfile:
+    def __init__(self, name, encoding_name, payload, encoder, payloader, depayloader, decoder, parser=None):
+        self.name = name
+        self.encoding_name = encoding_name
+        self.payload = payload
+        self.encoder = encoder
+        self.payloader = payloader
+        self.depayloader = depayloader
+        self.decoder = decoder
+        self.parser = parser
+
+    def encoder_element(self, settings):
+        if self.name == "mjpeg":
+            return f"{self.encoder} name=encoder quality={settings.quality}"
+        return (
+            f"{self.encoder} name=encoder tune=zerolatency speed-preset=ultrafast "
+            f"bitrate={settings.bitrate} key-int-max={settings.keyframe_interval}"
+        )
+
+    def payloader_element(self, name="pay"):
+        options = " config-interval=-1" if self.parser else ""  # resend SPS/PPS for late joiners
+        return f"{self.payloader} name={name} pt={self.payload}{options}"
+
+    def encode_chain(self, settings, pay_name="pay", passthrough=False):
+        """raw I420 video -> RTP packets; with ``passthrough``, already encoded frames -> RTP packets."""
+        if passthrough:
+            return self.payloader_element(pay_name)
+        return f"{self.encoder_element(settings)} ! {self.payloader_element(pay_name)}"
+
+    def rtp_caps(self):
+        return (
+            f"application/x-rtp,media=video,clock-rate=90000,"
+            f"encoding-name={self.encoding_name},payload={self.payload}"
+        )
+
+    def decode_chain(self, suffix=""):
+        """RTP packets -> raw video; ``suffix`` keeps element names unique when one pipeline has several."""
+        parse = f" ! {self.parser}" if self.parser else ""
+        return f"{self.depayloader} name=depay{suffix}{parse} ! {self.decoder} name=decoder{suffix}"
+
+    def apply_quality(self, encoder, quality, settings):
+        """Runtime quality change (0-100) for the adaptive sender."""
+        if self.name == "mjpeg":
+            encoder.set_property("quality", quality)
+        else:
+            encoder.set_property("bitrate", max(100, settings.bitrate * quality // 100))
+
+
+CODECS = {
+    "mjpeg": CodecProfile("mjpeg", "JPEG", 26, "jpegenc", "rtpjpegpay", "rtpjpegdepay", "jpegdec"),
+    "h264": CodecProfile("h264", "H264", 96, "x264enc", "rtph264pay", "rtph264depay", "avdec_h264", "h264parse"),
+    "h265": CodecProfile("h265", "H265", 97, "x265enc", "rtph265pay", "rtph265depay", "avdec_h265", "h265parse"),
+}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown codec {name!r}, expected one of {', '.join(CODECS)}") from None
+
+
+def camera_source(device="/dev/video0", width=640, height=480, test_source=False):
+    """Capture stage ending in raw I420; videotestsrc stands in for a camera in tests/benchmarks."""
+    if test_source:
+        source = "videotestsrc is-live=true pattern=ball name=camera"
+    else:
+        source = f"v4l2src device={device} name=camera"
+    return f"{source} ! videoconvert ! video/x-raw,format=I420,width={width},height={height}"
+
+
+def mjpeg_camera_source(device="/dev/video0", width=640, height=480, test_source=False):
+    """Capture stage ending in the camera's own JPEG frames, for passthrough to rtpjpegpay.
+
+    With ``test_source`` videotestsrc ! jpegenc stands in for an MJPEG camera.
+    """
+    if test_source:
+        return (
+            "videotestsrc is-live=true pattern=ball name=camera ! "
+            f"video/x-raw,width={width},height={height} ! jpegenc ! jpegparse"
+        )
+    return f"v4l2src device={device} name=camera ! image/jpeg,width={width},height={height} ! jpegparse"
+
+
+def decoded_source(uri, name="camera"):
+    """Raw video from a camera node, an RTSP/HTTP URL, a file, or "test" (videotestsrc)."""
+    if uri == "test":
+        return f"videotestsrc is-live=true pattern=ball name={name}"
+    if uri.startswith("/dev/video"):
+        return f"v4l2src device={uri} name={name} ! decodebin"  # raw or MJPEG, whichever the camera offers
+    if uri.startswith("rtsp://"):
+        return f'rtspsrc location="{uri}" latency=100 name={name} ! decodebin'
+    if "://" in uri:
+        return f'uridecodebin uri="{uri}" name={name}'
+    return f'filesrc location="{uri}" name={name} ! decodebin'
+
+
+def udp_sender(codec, settings, host, port=DEFAULT_PORT, source=None, passthrough=False):
+    """``passthrough``: ``source`` already delivers frames in the codec (see mjpeg_camera_source)."""
+    source = source or camera_source()
+    return f"{source} ! {codec.encode_chain(settings, passthrough=passthrough)} ! udpsink host={host} port={port}"
+
+
+def udp_receiver(codec, port=DEFAULT_PORT, suffix=""):
+    """udpsrc with the profile's RTP caps followed by depayloader and decoder."""
+    return f"udpsrc port={port} ! {codec.rtp_caps()} ! {codec.decode_chain(suffix)}"
+
+
+def rtpbin_sender(codec, settings, host, port=DEFAULT_PORT, source=None, passthrough=False):
+    """Like udp_sender, through rtpbin with RTCP both ways, so FEC and retransmission can be attached.
+
+    RTCP uses ports derived from ``port`` (RTCP_OFFSET, RTCP_RETURN_OFFSET),
+    so streams on ports 10 apart do not collide and a relay on ``port``
+    can forward RTCP too.
+    """
+    source = source or camera_source()
+    return (
+        f"rtpbin name=rtpbin {source} ! {codec.encode_chain(settings, passthrough=passthrough)} ! rtpbin.send_rtp_sink_0 "
+        f"rtpbin.send_rtp_src_0 ! udpsink host={host} port={port} "
+        f"rtpbin.send_rtcp_src_0 ! udpsink host={host} port={port + RTCP_OFFSET} sync=false async=false "
+        f"udpsrc port={port + RTCP_RETURN_OFFSET} ! rtpbin.recv_rtcp_sink_0"
+    )
+
+
+def rtpbin_receiver(codec, rtcp_host=None, port=DEFAULT_PORT, latency=50):
+    """udp_receiver through rtpbin's jitter buffer; RTCP receiver reports go back to ``rtcp_host`` if given."""
+    launch = (
+        f"rtpbin name=rtpbin latency={latency} "
+        f"udpsrc port={port} caps=\"{codec.rtp_caps()}\" ! rtpbin.recv_rtp_sink_0 "
+        f"udpsrc port={port + RTCP_OFFSET} ! rtpbin.recv_rtcp_sink_0 "
+    )
+    if rtcp_host:
+        launch += f"rtpbin.send_rtcp_src_0 ! udpsink host={rtcp_host} port={port + RTCP_RETURN_OFFSET} sync=false async=false "
+    return launch + f"rtpbin. ! {codec.decode_chain()}"
+
+
+def rtsp_launch(codec, settings, source=None, passthrough=False):
+    """RTSPMediaFactory launch line; RTSP requires the payloader to be called pay0.
+
+    The leaky queue puts capture and encode on separate streaming threads, so
+    a slow encoder drops frames instead of stalling the camera.
+    """
+    source = source or camera_source()
+    return (
+        f"( {source} ! queue leaky=downstream max-size-buffers=2 max-size-bytes=0 max-size-time=0 ! "
+        f"{codec.encode_chain(settings, pay_name='pay0', passthrough=passthrough)} )"
+    )
+
+
+def probe_codec(port=DEFAULT_PORT, timeout=5.0):
+    """Listen briefly on ``port`` and return the profile matching the first RTP packet's payload type."""
+    by_payload = {codec.payload: codec for codec in CODECS.values()}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+            try:
+                packet = sock.recv(2048)
+            except socket.timeout:
+                return None
+            if len(packet) >= 12 and packet[0] >> 6 == 2:  # RTP version 2
+                codec = by_payload.get(packet[1] & 0x7F)
+                if codec:
+                    return codec
+    finally:
+        sock.close()
@@ -0,0 +1,99 @@
+"""Offline replay for the viewers: recorded video, and optionally recorded detections.
+
+The viewers swap their live receive pipeline for ``filesrc ! decodebin``
+and pull each frame from their render timer, so frames go through the
+same display and overlay code as live video. Detections from a
+detection_recorder log are matched to frames by their offset from the
+wall-clock time the video starts at (``--replay-start``, e.g. the
+"start" of a clip in events.jsonl), or from the first detection if that
+is not given.
+
+In real time the appsink syncs to the clock and drops late frames like
+the live path. With ``fast`` it does not sync and does not drop: every
+frame is rendered as fast as the render path can take it, and the report
+at the end is the render path's throughput.
+
+    python layout.py --replay incident.mkv --replay-detections recordings/ --replay-fast --replay-exit
+"""
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from detection_recorder import DetectionTimeline, parse_time
+from pipelines import decoded_source
+
+
+class Replay:
+    def __init__(self, video, detections=None, camera=None, fast=False, exit_at_end=False, start=None):
+        self.video = video
+        self.fast = fast
+        self.exit_at_end = exit_at_end
+        self.timeline = DetectionTimeline(detections, camera, start=start) if detections else None
+        self.frames = 0
+        self.started = None
+        self.ended = None
+
+    def source(self):
+        return decoded_source(self.video)
+
+    def appsink(self, name="sink"):
+        if self.fast:
+            return f"appsink name={name} max-buffers=2 drop=false sync=false"
+        return f"appsink name={name} max-buffers=1 drop=true sync=true"
+
+    def render_interval(self):
+        """Render timer period in ms: 0 keeps pulling as fast as frames are decoded."""
+        return 0 if self.fast else 16
+
+    def pull(self, sink):
+        """The next decoded sample, or None if there is none yet (or the file has ended)."""
+        sample = sink.emit("try-pull-sample", 0)
+        if sample is not None and self.started is None:
+            self.started = time.monotonic()
+        return sample
+
+    def detections_for(self, sample):
+        if self.timeline is None:
+            return []
+        pts = sample.get_buffer().pts
+        return self.timeline.at(pts / Gst.SECOND) if pts != Gst.CLOCK_TIME_NONE else []
+
+    def frame_rendered(self):
+        self.frames += 1
+
+    def finished(self, sink):
+        """True once, when the file has been fully rendered."""
+        if self.ended is None and sink.get_property("eos"):
+            self.ended = time.monotonic()
+            return True
+        return False
+
+    def fps(self):
+        end = self.ended or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = (self.ended or time.monotonic()) - (self.started or time.monotonic())
+        mode = "as fast as possible" if self.fast else "real time"
+        return f"Replay of {self.video}: {self.frames} frames in {elapsed:.2f} s, {self.fps():.1f} fps ({mode})"
+
+
+def add_replay_arguments(parser):
+    parser.add_argument("--replay", metavar="VIDEO", help="play a recorded video instead of the live stream")
+    parser.add_argument("--replay-detections", metavar="DIR", help="detection_recorder directory to overlay")
+    parser.add_argument("--replay-camera", help="camera to take from --replay-detections")
+    parser.add_argument("--replay-start", type=parse_time,
+                        help="wall-clock time of the video's first frame, epoch seconds or ISO "
+                             "(default: the first recorded detection)")
+    parser.add_argument("--replay-fast", action="store_true", help="no clock sync, render every frame")
+    parser.add_argument("--replay-exit", action="store_true", help="quit after the report (for CI)")
+
+
+def replay_from_args(args):
+    if not args.replay:
+        return None
+    return Replay(args.replay, args.replay_detections, args.replay_camera, args.replay_fast, args.replay_exit,
+                  args.replay_start)
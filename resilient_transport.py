@@ -0,0 +1,176 @@
+"""Loss protection for the rtpbin UDP transport: jitter buffer, FEC and NACK retransmission.
+
+Both ends run through rtpbin (pipelines.rtpbin_sender / rtpbin_receiver)
+and these classes hook into its request signals before the pipeline
+starts:
+
+* the receiver's jitter buffer holds packets for ``latency`` ms to put
+  reordered packets back in order, and with ``drop_on_latency`` it drops
+  packets that arrive too late instead of letting the display fall behind;
+* with ``fec_percentage`` > 0 the sender adds ULPFEC packets (that much
+  overhead) wrapped in RED with the media, as WebRTC does, and the receiver
+  rebuilds lost media packets from them without a round trip;
+* with ``nack`` the receiver asks for lost packets over RTCP (AVPF
+  feedback) and the sender resends them from a short history as RTX
+  packets. This costs a round trip, so it only helps when the jitter
+  buffer latency is larger than the RTT.
+
+Payload types: the codec's own, FEC_PAYLOAD for ULPFEC, RED_PAYLOAD for
+RED and one RTX payload per retransmitted payload type.
+"""
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from pipelines import TransportSettings
+
+FEC_PAYLOAD = 122
+RED_PAYLOAD = 123
+RTX_PAYLOADS = {26: 118, 96: 119, 97: 120, RED_PAYLOAD: 121}  # original payload type -> RTX payload type
+VIDEO_CLOCK_RATE = 90000
+AVPF = 3  # GstRTPProfile: AVP with immediate RTCP feedback, needed for timely NACKs
+
+
+def _pt_map(mapping):
+    fields = ", ".join(f"{original}=(uint){rtx}" for original, rtx in mapping.items())
+    return Gst.Structure.new_from_string(f"application/x-rtp-pt-map, {fields}")
+
+
+def _aux_bin(factory, session, pt_map, **properties):
+    """rtprtxsend/rtprtxreceive in a bin with the per-session pad names rtpbin expects."""
+    rtx = Gst.ElementFactory.make(factory, None)
+    rtx.set_property("payload-type-map", _pt_map(pt_map))
+    for name, value in properties.items():
+        rtx.set_property(name.replace("_", "-"), value)
+    aux = Gst.Bin.new(None)
+    aux.add(rtx)
+    aux.add_pad(Gst.GhostPad.new(f"src_{session}", rtx.get_static_pad("src")))
+    aux.add_pad(Gst.GhostPad.new(f"sink_{session}", rtx.get_static_pad("sink")))
+    return aux
+
+
+class ResilientSender:
+    def __init__(self, codec, transport=None):
+        self.codec = codec
+        self.transport = transport or TransportSettings()
+        self.sent_payloads = [RED_PAYLOAD if self.transport.fec_percentage else codec.payload]
+
+    def attach(self, rtpbin):
+        """Call before the pipeline leaves NULL."""
+        if self.transport.fec_percentage:
+            rtpbin.connect("request-fec-encoder", self.on_request_fec_encoder)
+        if self.transport.nack:
+            rtpbin.set_property("rtp-profile", AVPF)
+            rtpbin.connect("request-aux-sender", self.on_request_aux_sender)
+
+    def on_request_fec_encoder(self, rtpbin, session):
+        return Gst.parse_bin_from_description(
+            f"rtpulpfecenc pt={FEC_PAYLOAD} percentage={self.transport.fec_percentage} ! "
+            f"rtpredenc pt={RED_PAYLOAD} allow-no-red-blocks=true", True
+        )
+
+    def on_request_aux_sender(self, rtpbin, session):
+        # Keep a second of packets (max-size-time is in ms), longer than a NACK can usefully take
+        return _aux_bin("rtprtxsend", session, {pt: RTX_PAYLOADS[pt] for pt in self.sent_payloads},
+                        max_size_time=1000)
+
+
+class ResilientReceiver:
+    def __init__(self, codec, transport=None):
+        self.codec = codec
+        self.transport = transport or TransportSettings()
+        self.jitterbuffers = []
+        self.fec_decoders = []
+        self.last_update = 0.0
+
+    def attach(self, rtpbin):
+        """Call before the pipeline leaves NULL."""
+        transport = self.transport
+        rtpbin.set_property("latency", transport.latency)
+        rtpbin.set_property("drop-on-latency", transport.drop_on_latency)
+        rtpbin.set_property("do-lost", True)  # lost-packet events drive the FEC decoder
+        rtpbin.connect("request-pt-map", self.on_request_pt_map)
+        rtpbin.connect("new-jitterbuffer", self.on_new_jitterbuffer)
+        if transport.fec_percentage:
+            rtpbin.connect("new-storage", self.on_new_storage)
+            rtpbin.connect("request-fec-decoder", self.on_request_fec_decoder)
+        if transport.nack:
+            rtpbin.set_property("rtp-profile", AVPF)
+            rtpbin.set_property("do-retransmission", True)
+            rtpbin.connect("request-aux-receiver", self.on_request_aux_receiver)
+
+    def on_request_pt_map(self, rtpbin, session, pt):
+        if pt == self.codec.payload:
+            return Gst.Caps.from_string(self.codec.rtp_caps())
+        names = {FEC_PAYLOAD: "ULPFEC", RED_PAYLOAD: "RED"}
+        names.update({rtx: "RTX" for rtx in RTX_PAYLOADS.values()})
+        if pt not in names:
+            return None
+        return Gst.Caps.from_string(
+            f"application/x-rtp,media=video,clock-rate={VIDEO_CLOCK_RATE},encoding-name={names[pt]},payload={pt}"
+        )
+
+    def on_new_jitterbuffer(self, rtpbin, jitterbuffer, session, ssrc):
+        self.jitterbuffers.append(jitterbuffer)
+
+    def on_new_storage(self, rtpbin, storage, session):
+        # FEC can only rebuild packets that are still held, so keep as much as the jitter buffer
+        storage.set_property("size-time", self.transport.latency * Gst.MSECOND)
+
+    def on_request_fec_decoder(self, rtpbin, session):
+        decoder = Gst.parse_bin_from_description(
+            f"rtpreddec pt={RED_PAYLOAD} ! rtpulpfecdec name=fecdec pt={FEC_PAYLOAD}", True
+        )
+        fec = decoder.get_by_name("fecdec")
+        fec.set_property("storage", rtpbin.emit("get-storage", session))
+        self.fec_decoders.append(fec)
+        return decoder
+
+    def on_request_aux_receiver(self, rtpbin, session):
+        rtx_to_original = {RTX_PAYLOADS[self.codec.payload]: self.codec.payload}
+        if self.transport.fec_percentage:
+            rtx_to_original[RTX_PAYLOADS[RED_PAYLOAD]] = RED_PAYLOAD
+        return _aux_bin("rtprtxreceive", session, rtx_to_original)
+
+    def update_metrics(self, metrics, interval=1.0):
+        """Publish jitter buffer, FEC and retransmission counters, at most once per ``interval``."""
+        now = time.monotonic()
+        if now - self.last_update < interval:
+            return
+        self.last_update = now
+        totals = dict.fromkeys(("num-pushed", "num-lost", "num-late", "num-duplicates", "rtx-count",
+                                "rtx-success-count"), 0)
+        for jitterbuffer in self.jitterbuffers:
+            stats = jitterbuffer.get_property("stats")
+            for name in totals:
+                ok, value = stats.get_uint64(name)
+                if ok:
+                    totals[name] += value
+        for name, value in totals.items():
+            metrics.set_gauge("rtp_" + name.replace("-", "_"), value)
+        metrics.set_gauge("fec_recovered", sum(d.get_property("recovered") for d in self.fec_decoders))
+        metrics.set_gauge("fec_unrecovered", sum(d.get_property("unrecovered") for d in self.fec_decoders))
+
+
+def add_transport_arguments(parser, sender=False):
+    """--fec/--nack on both ends; the jitter buffer options only apply to receivers."""
+    parser.add_argument("--fec", type=int, default=0, metavar="PERCENT",
+                        help="ULPFEC/RED forward error correction: overhead at the sender; "
+                             "any value > 0 at the receiver to decode it")
+    parser.add_argument("--nack", action="store_true", help="retransmit lost packets on request (needs RTCP both ways)")
+    if not sender:
+        parser.add_argument("--jitter-latency", type=int, default=None, metavar="MS",
+                            help="jitter buffer latency (default 50, use more than the RTT with --nack)")
+        parser.add_argument("--no-drop-late", action="store_true",
+                            help="keep packets that miss the jitter buffer latency instead of dropping them")
+
+
+def transport_from_args(args):
+    """TransportSettings if any transport option was given, else None (plain RTP)."""
+    latency = getattr(args, "jitter_latency", None)
+    no_drop = getattr(args, "no_drop_late", False)
+    if not (args.fec or args.nack or latency is not None or no_drop):
+        return None
+    return TransportSettings(50 if latency is None else latency, not no_drop, args.fec, args.nack)
@@ -1,37 +1,154 @@
 import gi
+import sys
+import os
+import argparse
 gi.require_version('Gst', '1.0')
+gi.require_version('GstRtsp', '1.0')
 gi.require_version('GstRtspServer', '1.0')
 gi.require_version('GObject', '2.0')
-from gi.repository import Gst, GstRtspServer, GObject
+from gi.repository import Gst, GstRtsp, GstRtspServer, GObject
+
+# Shared helpers live at the repository root, next to layout.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stream_metrics import CaptureProbe, MetricsRegistry, StageProbe, start_metrics_server
+from pipelines import CODECS, EncoderSettings, get_codec, rtsp_launch
+from camera_devices import capture_source, list_camera_devices
 
 # Initialize GStreamer
 Gst.init(None)
 
 # Create RTSP server
 class RTSPServer:
-    def __init__(self):
+    """RTSP server whose mounts share one capture + encode pipeline between all their clients."""
+
+    def __init__(self, metrics_port=9103, latency=200, multicast=None, multicast_port=5000, client_threads=16):
         self.server = GstRtspServer.RTSPServer()
         self.server.set_service("8554")
-        
+
+        # Each RTSP client is served from a pool thread with its own main context, so a slow
+        # client does not hold up requests for the other mounts on the default loop.
+        pool = GstRtspServer.RTSPThreadPool()
+        pool.set_max_threads(client_threads)
+        self.server.set_thread_pool(pool)
+        self.metrics = MetricsRegistry("rtsp_streamer")
+        self.metrics_port = metrics_port
+        self.latency = latency
+        self.client_limits = {}   # mount path -> max concurrent clients (0 = unlimited)
+        self.playing = {}         # client -> set of mount paths it is playing
+
         # Create a mount point
         self.mounts = self.server.get_mount_points()
-        self.factory = GstRtspServer.RTSPMediaFactory()
-        
-        # Set up media pipeline for streaming
-        self.factory.set_launch("v4l2src device=/dev/video0 ! videoconvert ! "
-                                "video/x-raw,format=I420,width=640,height=480 ! "
-                                "jpegenc ! rtpjpegpay ! rtspclientsink")
-        
+
+        # Optional multicast: clients that ask for UDP multicast share one RTP stream per mount
+        self.address_pool = None
+        if multicast:
+            first, _, last = multicast.partition("-")
+            self.address_pool = GstRtspServer.RTSPAddressPool()
+            self.address_pool.add_range(first, last or first, multicast_port, multicast_port + 100, 16)
+
+        self.server.connect("client-connected", self.on_client_connected)
+
+    def add_mount(self, path, launch, max_clients=0):
+        """Serve ``launch`` at ``path``; the pipeline is built once and shared by all clients."""
+        factory = GstRtspServer.RTSPMediaFactory()
+        factory.set_launch(launch)
+        factory.set_shared(True)
+        factory.set_latency(self.latency)
+        if self.address_pool:
+            factory.set_address_pool(self.address_pool)
+            factory.set_protocols(
+                GstRtsp.RTSPLowerTrans.UDP | GstRtsp.RTSPLowerTrans.UDP_MCAST | GstRtsp.RTSPLowerTrans.TCP
+            )
+        factory.connect("media-configure", self.on_media_configure, path.strip("/") or "stream")
+
         # Attach the media to the server
-        self.mounts.add_factory("/stream", self.factory)
-        
+        self.mounts.add_factory(path, factory)
+        self.client_limits[path] = max_clients
+        return factory
+
+    def add_cameras(self, devices, codec, settings, max_clients=0, passthrough="auto"):
+        """One mount per capture device, named after its node: /dev/video2 -> /video2."""
+        for device in devices:
+            source, encoded = capture_source(codec, device, passthrough=passthrough)
+            self.add_mount("/" + os.path.basename(device), rtsp_launch(codec, settings, source, encoded), max_clients)
+
+    def on_media_configure(self, factory, media, name):
+        """Attach stage probes to each media pipeline the factory builds (once per mount when shared)."""
+        bin = media.get_element()
+        CaptureProbe(bin.get_by_name("camera"), self.metrics, f"{name}_capture")
+        if bin.get_by_name("encoder"):  # not there when passing camera MJPEG through
+            StageProbe(bin.get_by_name("encoder"), f"{name}_encode", self.metrics)
+        StageProbe(bin.get_by_name("pay0"), f"{name}_payload", self.metrics)
+
+    def on_client_connected(self, server, client):
+        client.connect("pre-describe-request", self.on_pre_describe)
+        client.connect("play-request", self.on_play)
+        client.connect("teardown-request", self.on_teardown)
+        client.connect("closed", self.on_closed)
+
+    def clients_on(self, path):
+        return sum(1 for paths in self.playing.values() if path in paths)
+
+    def on_pre_describe(self, client, ctx):
+        """Refuse new viewers once a mount has reached its client limit."""
+        path = ctx.uri.abspath
+        limit = self.client_limits.get(path, 0)
+        if limit and self.clients_on(path) >= limit:
+            print(f"Refusing client on {path}: limit of {limit} reached")
+            return GstRtsp.RTSPStatusCode.SERVICE_UNAVAILABLE
+        return GstRtsp.RTSPStatusCode.OK
+
+    def on_play(self, client, ctx):
+        self.playing.setdefault(client, set()).add(ctx.uri.abspath)
+        self.metrics.set_gauge("rtsp_clients", sum(len(paths) for paths in self.playing.values()))
+
+    def on_teardown(self, client, ctx):
+        self.playing.get(client, set()).discard(ctx.uri.abspath)
+        self.metrics.set_gauge("rtsp_clients", sum(len(paths) for paths in self.playing.values()))
+
+    def on_closed(self, client):
+        self.playing.pop(client, None)
+        self.metrics.set_gauge("rtsp_clients", sum(len(paths) for paths in self.playing.values()))
+
     def start(self):
         self.server.attach(None)
-        print("RTSP server is running at rtsp://<raspberry_pi_ip>:8554/stream")
+        if self.metrics_port:
+            start_metrics_server(self.metrics, self.metrics_port)
+        for path in self.client_limits:
+            print(f"RTSP server is running at rtsp://<raspberry_pi_ip>:8554{path}")
         loop = GObject.MainLoop()
         loop.run()
 
 # Start RTSP server
 if __name__ == "__main__":
-    server = RTSPServer()
-    server.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Serve the attached cameras over RTSP")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mjpeg")
+    parser.add_argument("--bitrate", type=int, default=2000, help="kbit/s (H.264/H.265)")
+    parser.add_argument("--keyframe-interval", type=int, default=30, help="frames (H.264/H.265)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality (MJPEG)")
+    parser.add_argument("--device", action="append",
+                        help="camera to serve (repeatable); by default every discovered camera gets a mount")
+    parser.add_argument("--test-source", nargs="?", const="raw", choices=["raw", "mjpeg"],
+                        help="serve videotestsrc at --mount instead of cameras; mjpeg fakes a camera that outputs JPEG")
+    parser.add_argument("--mount", default="/stream", help="mount for --test-source")
+    parser.add_argument("--passthrough", choices=["auto", "always", "never"], default="auto",
+                        help="serve the cameras' own MJPEG frames without re-encoding (auto: when they offer them)")
+    parser.add_argument("--max-clients", type=int, default=0, help="per mount, 0 = unlimited")
+    parser.add_argument("--latency", type=int, default=200, help="ms of jitter buffering offered to clients")
+    parser.add_argument("--multicast", help="address range for RTP multicast, e.g. 224.3.0.1-224.3.0.10")
+    parser.add_argument("--client-threads", type=int, default=16, help="threads serving RTSP clients")
+    parser.add_argument("--metrics-port", type=int, default=9103, help="local Prometheus endpoint, 0 to disable")
+    args = parser.parse_args()
+
+    codec = get_codec(args.codec)
+    settings = EncoderSettings(args.bitrate, args.keyframe_interval, args.quality)
+    server = RTSPServer(args.metrics_port, args.latency, args.multicast, client_threads=args.client_threads)
+    if args.test_source:
+        source, encoded = capture_source(codec, test_source=args.test_source, passthrough=args.passthrough)
+        server.add_mount(args.mount, rtsp_launch(codec, settings, source, encoded), args.max_clients)
+    else:
+        devices = args.device or list_camera_devices()
+        if not devices:
+            sys.exit("No camera found (use --test-source to serve a test pattern)")
+        server.add_cameras(devices, codec, settings, args.max_clients, args.passthrough)
+    server.start()
@@ -0,0 +1,422 @@
+"""Per-stage latency and throughput metrics for the streaming pipelines.
+
+Stages are timed with GStreamer pad probes and matched by buffer PTS:
+
+* capture  - buffer PTS vs. the pipeline clock when it leaves the camera source
+* encode / payload / depayload / decode - sink pad to src pad of that element
+* network  - sender wall clock (from a timestamp beacon, see below) to arrival
+* display  - appsink to the frame being shown by the GUI
+* end_to_end - capture wall clock to the frame being shown
+
+The sender reports, once per frame, the RTP timestamp together with the
+frame's capture and send wall-clock times in a tiny UDP datagram (the
+"timestamp beacon", BEACON_PORT). The receiver matches it against the RTP
+packets it sees, which gives network and glass-to-glass latency without
+touching the RTP stream itself. Both ends must share a clock (same host or
+NTP synced) for those two numbers to be meaningful.
+
+Samples live in sliding windows and are exported as Prometheus text on
+http://127.0.0.1:<port>/metrics, as CSV on /metrics.csv, or with write_csv().
+"""
+import collections
+import csv
+import io
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstRtp', '1.0')
+from gi.repository import Gst, GstRtp
+
+BEACON_PORT = 5002
+BEACON = struct.Struct("<Idd")  # RTP timestamp, capture wall time, send wall time
+QUANTILES = (50, 95, 99)
+
+
+class SlidingWindow:
+    """Thread-safe samples from the last ``window`` seconds."""
+
+    def __init__(self, window=10.0, max_samples=10000):
+        self.window = window
+        self.total = 0
+        self._samples = collections.deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._created = time.monotonic()
+
+    def add(self, value):
+        with self._lock:
+            self._samples.append((time.monotonic(), value))
+            self.total += 1
+
+    def _trim(self, now):
+        horizon = now - self.window
+        while self._samples and self._samples[0][0] < horizon:
+            self._samples.popleft()
+
+    def values(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return [value for _, value in self._samples]
+
+    def percentiles(self, quantiles=QUANTILES):
+        values = sorted(self.values())
+        if not values:
+            return {q: None for q in quantiles}
+        last = len(values) - 1
+        return {q: values[min(last, int(round(q / 100 * last)))] for q in quantiles}
+
+    def rate(self):
+        """Sum of the values in the window per second (events/s when every value is 1)."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            total = sum(value for _, value in self._samples)
+        span = min(self.window, now - self._created)
+        return total / span if span > 0 else 0.0
+
+
+class MetricsRegistry:
+    """Stage latencies, counters and gauges for one process."""
+
+    def __init__(self, process, window=10.0):
+        self.process = process
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.rates = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage):
+        window = self.stages.get(stage)
+        if window is None:
+            with self._lock:
+                window = self.stages.setdefault(stage, SlidingWindow(self.window))
+        return window
+
+    def observe(self, stage, seconds):
+        self._stage(stage).add(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            window = self.rates.get(name)
+            if window is None:
+                window = self.rates[name] = SlidingWindow(self.window)
+        window.add(n)
+
+    def rate(self, name):
+        window = self.rates.get(name)
+        return window.rate() if window else 0.0
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def reset(self):
+        """Forget every sample, e.g. at the end of a warm-up period."""
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.rates = {}
+            self.gauges = {}
+
+    def summary(self):
+        """Nested dict of the current rows, convenient for JSON reports."""
+        result = {}
+        for kind, name, field, value in self.rows():
+            result.setdefault(kind, {}).setdefault(name, {})[field] = value
+        return result
+
+    def rows(self):
+        """Flat (kind, name, field, value) rows; the common source for CSV and Prometheus."""
+        rows = []
+        for stage, window in list(self.stages.items()):
+            for q, value in window.percentiles().items():
+                rows.append(("latency", stage, f"p{q}", value))
+            rows.append(("latency", stage, "count", window.total))
+        for name, value in list(self.counters.items()):
+            rows.append(("counter", name, "total", value))
+            rows.append(("counter", name, "rate", self.rate(name)))
+        for name, value in list(self.gauges.items()):
+            rows.append(("gauge", name, "value", value))
+        return rows
+
+    def prometheus_text(self):
+        process = self.process
+        lines = [
+            "# TYPE edge_stage_latency_seconds summary",
+        ]
+        for kind, name, field, value in self.rows():
+            if value is None:
+                continue
+            if kind == "latency" and field == "count":
+                lines.append(f'edge_stage_latency_seconds_count{{process="{process}",stage="{name}"}} {value}')
+            elif kind == "latency":
+                quantile = int(field[1:]) / 100
+                lines.append(
+                    f'edge_stage_latency_seconds{{process="{process}",stage="{name}",quantile="{quantile}"}} {value:.6f}'
+                )
+            elif kind == "counter" and field == "total":
+                lines.append(f'edge_{name}_total{{process="{process}"}} {value}')
+            elif kind == "counter":
+                lines.append(f'edge_{name}_per_second{{process="{process}"}} {value:.3f}')
+            else:
+                lines.append(f'edge_{name}{{process="{process}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def csv_text(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["time", "process", "kind", "name", "field", "value"])
+        now = time.time()
+        for row in self.rows():
+            writer.writerow([f"{now:.3f}", self.process, *row])
+        return out.getvalue()
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            f.write(self.csv_text())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        registry = self.server.registry
+        if self.path == "/metrics":
+            body, content_type = registry.prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.csv":
+            body, content_type = registry.csv_text(), "text/csv"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds; keep stdout quiet
+
+
+def start_metrics_server(registry, port, host="127.0.0.1"):
+    """Serve /metrics and /metrics.csv from a daemon thread; returns the server or None."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint disabled, could not bind {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+def _running_time(element):
+    clock = element.get_clock()
+    if clock is None:
+        return None
+    return clock.get_time() - element.get_base_time()
+
+
+class StageProbe:
+    """Times buffers from an element's sink pad to its src pad, matched by PTS."""
+
+    def __init__(self, element, stage, registry, max_pending=256):
+        self.stage = stage
+        self.registry = registry
+        self.max_pending = max_pending
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        element.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_sink)
+        element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_src)
+
+    def _on_sink(self, pad, info):
+        pts = info.get_buffer().pts
+        if pts != Gst.CLOCK_TIME_NONE:
+            with self._lock:
+                if pts not in self._pending:
+                    self._pending[pts] = time.monotonic()
+                    if len(self._pending) > self.max_pending:
+                        self._pending.popitem(last=False)
+        return Gst.PadProbeReturn.OK
+
+    def _on_src(self, pad, info):
+        pts = info.get_buffer().pts
+        with self._lock:
+            start = self._pending.pop(pts, None)
+        if start is not None:
+            self.registry.observe(self.stage, time.monotonic() - start)
+        return Gst.PadProbeReturn.OK
+
+
+class CaptureProbe:
+    """Capture latency: how far behind the pipeline clock a source's buffers are when pushed."""
+
+    def __init__(self, element, registry, stage="capture"):
+        self.element = element
+        self.registry = registry
+        self.stage = stage
+        element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_src)
+
+    def _on_src(self, pad, info):
+        pts = info.get_buffer().pts
+        running = _running_time(self.element)
+        if running is not None and pts != Gst.CLOCK_TIME_NONE and running >= pts:
+            self.registry.observe(self.stage, (running - pts) / Gst.SECOND)
+        self.registry.count("frames_captured")
+        return Gst.PadProbeReturn.OK
+
+
+def _rtp_header(buf):
+    """(timestamp, seq) of an RTP buffer, or None if it does not parse."""
+    ok, rtp = GstRtp.RTPBuffer.map(buf, Gst.MapFlags.READ)
+    if not ok:
+        return None
+    try:
+        return rtp.get_timestamp(), rtp.get_seq()
+    finally:
+        rtp.unmap()
+
+
+class TimestampBeaconSender:
+    """Sends one beacon per RTP frame seen on a payloader's src pad."""
+
+    def __init__(self, payloader, host, port=BEACON_PORT):
+        self.payloader = payloader
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._last_timestamp = None
+        payloader.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_src)
+
+    def _on_src(self, pad, info):
+        buf = info.get_buffer()
+        header = _rtp_header(buf)
+        if header is None or header[0] == self._last_timestamp:
+            return Gst.PadProbeReturn.OK
+        self._last_timestamp = header[0]
+        now = time.time()
+        capture = now
+        running = _running_time(self.payloader)
+        if running is not None and buf.pts != Gst.CLOCK_TIME_NONE and running >= buf.pts:
+            capture = now - (running - buf.pts) / Gst.SECOND
+        try:
+            self.sock.sendto(BEACON.pack(header[0], capture, now), self.address)
+        except OSError:
+            pass  # the beacon is best effort, never stall the stream for it
+        return Gst.PadProbeReturn.OK
+
+
+class TimestampBeaconReceiver:
+    """Matches sender beacons with received RTP packets.
+
+    attach() probes a depayloader's sink pad: it records network latency,
+    counts lost packets from RTP sequence gaps, and remembers which capture
+    time belongs to which local PTS so capture_time() can answer for frames
+    that come out of the decoder. The tables hold one entry per frame, keyed
+    by the PTS of its first packet (the one the depayloader stamps on the
+    frame), so a large MJPEG frame spread over many packets takes one slot.
+    """
+
+    def __init__(self, registry, port=BEACON_PORT, max_frames=256):
+        self.registry = registry
+        self.max_frames = max_frames
+        self._beacons = collections.OrderedDict()   # rtp ts -> (capture, sent)
+        self._arrivals = collections.OrderedDict()  # rtp ts -> arrival wall time, awaiting a beacon
+        self._measured = collections.OrderedDict()  # rtp ts whose network latency is recorded
+        self._capture_by_pts = collections.OrderedDict()    # frame pts -> capture
+        self._pts_by_timestamp = collections.OrderedDict()  # rtp ts -> frame pts, awaiting a beacon
+        self._last_seq = None
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("0.0.0.0", port))
+        threading.Thread(target=self._receive_beacons, daemon=True).start()
+
+    def _remember(self, table, key, value):
+        table[key] = value
+        if len(table) > self.max_frames:
+            table.popitem(last=False)
+
+    def _receive_beacons(self):
+        while True:
+            try:
+                data = self.sock.recv(64)
+            except OSError:
+                return
+            if len(data) != BEACON.size:
+                continue
+            timestamp, capture, sent = BEACON.unpack(data)
+            with self._lock:
+                self._remember(self._beacons, timestamp, (capture, sent))
+                arrival = self._arrivals.pop(timestamp, None)
+                pts = self._pts_by_timestamp.pop(timestamp, None)
+                if pts is not None:
+                    self._remember(self._capture_by_pts, pts, capture)
+                if arrival is not None:
+                    self._remember(self._measured, timestamp, True)
+            if arrival is not None:
+                self.registry.observe("network", max(0.0, arrival - sent))
+
+    def attach(self, depayloader):
+        depayloader.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_packet)
+
+    def _on_packet(self, pad, info):
+        buf = info.get_buffer()
+        header = _rtp_header(buf)
+        if header is None:
+            return Gst.PadProbeReturn.OK
+        timestamp, seq = header
+        now = time.time()
+
+        if self._last_seq is not None:
+            gap = (seq - self._last_seq) & 0xFFFF
+            if 1 < gap < 0x8000:
+                self.registry.count("rtp_packets_lost", gap - 1)
+        self._last_seq = seq
+        if timestamp == self._last_timestamp:
+            return Gst.PadProbeReturn.OK  # rest of a frame already accounted for
+        self._last_timestamp = timestamp
+
+        network = None
+        with self._lock:
+            beacon = self._beacons.get(timestamp)
+            if beacon is not None:
+                if buf.pts != Gst.CLOCK_TIME_NONE:
+                    self._remember(self._capture_by_pts, buf.pts, beacon[0])
+                if timestamp not in self._measured:
+                    self._remember(self._measured, timestamp, True)
+                    network = max(0.0, now - beacon[1])
+            else:
+                # Beacon not here yet; resolved when it arrives
+                if timestamp not in self._arrivals:
+                    self._remember(self._arrivals, timestamp, now)
+                if buf.pts != Gst.CLOCK_TIME_NONE:
+                    self._remember(self._pts_by_timestamp, timestamp, buf.pts)
+        if network is not None:
+            self.registry.observe("network", network)
+        return Gst.PadProbeReturn.OK
+
+    def capture_time(self, pts):
+        """Sender capture wall time for a local PTS, if its beacon has been seen."""
+        with self._lock:
+            return self._capture_by_pts.get(pts)
+
+    def close(self):
+        self.sock.close()
+
+
+def record_display(registry, sample, arrived, beacons=None):
+    """Call from the GUI right after a sample is shown; ``arrived`` is its appsink monotonic time."""
+    registry.observe("display", time.monotonic() - arrived)
+    registry.count("frames_displayed")
+    if beacons is not None:
+        capture = beacons.capture_time(sample.get_buffer().pts)
+        if capture is not None:
+            registry.observe("end_to_end", max(0.0, time.time() - capture))
@@ -1,19 +1,36 @@
 import sys
+import os
+import argparse
 import gi
 import cv2
 import numpy as np
 from PyQt5.QtWidgets import QApplication, QLabel, QPushButton, QVBoxLayout, QWidget
 from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import QTimer, Qt
 
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
+# Shared helpers live at the repository root, next to layout.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from engine import Engine
+from engine_qt import EngineBridge
+from pipelines import CODECS, DEFAULT_PORT, get_codec, probe_codec
+from replay import add_replay_arguments, replay_from_args
+from resilient_transport import add_transport_arguments, transport_from_args
+from overlay import draw_detections
+
 class GstViewer(QWidget):
-    def __init__(self):
+    """Qt client of an Engine that only receives: the stream starts on the button (or at once for a replay)."""
+    def __init__(self, engine, rtcp_host=None, transport=None, port=DEFAULT_PORT):
         super().__init__()
+        self.engine = engine
+        self.replay = engine.replay
         self.initUI()
-        Gst.init(None)
-        self.initGstPipeline()
+        self.bridge = EngineBridge(engine, self)
+        self.bridge.event.connect(self.on_engine_event)
+        self.engine.start_receiver(pixel_format="BGR", rtcp_host=rtcp_host, transport=transport,
+                                   port=port, play=bool(self.replay))
 
     def initUI(self):
         self.setWindowTitle("USB Camera Stream Viewer")
@@ -30,42 +47,80 @@ class GstViewer(QWidget):
         layout.addWidget(self.stream_button)
         self.setLayout(layout)
 
-    def initGstPipeline(self):
-        self.pipeline = Gst.parse_launch(
-            "udpsrc port=5000 ! application/x-rtp,encoding-name=JPEG,payload=26 ! rtpjpegdepay ! jpegdec ! videoconvert ! video/x-raw,format=BGR ! appsink name=sink emit-signals=True"
-        )
-        self.appsink = self.pipeline.get_by_name("sink")
-        self.appsink.connect("new-sample", self.on_new_sample)
+        # Render from the GUI thread, at most once per tick
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_latest_frame)
+        self.render_timer.start(self.engine.render_interval())
 
     def start_stream(self):
-        self.pipeline.set_state(Gst.State.PLAYING)
+        self.engine.play()
+
+    def render_latest_frame(self):
+        item = self.engine.take_frame()
+        if item is not None:
+            self.render_sample(*item)
+
+    def on_engine_event(self, name, args):
+        if name == "replay_finished":
+            print(args[0])
+            if self.replay.exit_at_end:
+                self.close()
+
+    def render_sample(self, sample, arrived, detections=()):
+        buffer = sample.get_buffer()
+        caps = sample.get_caps()
+        width = caps.get_structure(0).get_int("width")[1]
+        height = caps.get_structure(0).get_int("height")[1]
 
-    def on_new_sample(self, sink):
-        sample = sink.emit("pull-sample")
-        if sample:
-            buffer = sample.get_buffer()
-            caps = sample.get_caps()
-            width = caps.get_structure(0).get_int("width")[1]
-            height = caps.get_structure(0).get_int("height")[1]
-            
-            success, map_info = buffer.map(Gst.MapFlags.READ)
-            if success:
+        success, map_info = buffer.map(Gst.MapFlags.READ)
+        if success:
+            try:
                 frame = np.frombuffer(map_info.data, dtype=np.uint8).reshape((height, width, 3))
+                self.display_frame(frame, detections)
+            finally:
                 buffer.unmap(map_info)
-                self.display_frame(frame)
-        return Gst.FlowReturn.OK
+            self.engine.frame_shown(sample, arrived)
 
-    def display_frame(self, frame):
-        image = QImage(frame.data, frame.shape[1], frame.shape[0], QImage.Format_BGR888)
+    def display_frame(self, frame, detections=()):
+        image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.shape[1] * 3, QImage.Format_BGR888)
+        if image.size() != self.video_label.size():
+            image = image.scaled(self.video_label.size(), Qt.KeepAspectRatio)
         pixmap = QPixmap.fromImage(image)
+        draw_detections(pixmap, detections, frame.shape[1], frame.shape[0])
         self.video_label.setPixmap(pixmap)
     
     def closeEvent(self, event):
-        self.pipeline.set_state(Gst.State.NULL)
+        self.render_timer.stop()
+        self.bridge.close()
+        self.engine.close()
         event.accept()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = GstViewer()
+    parser = argparse.ArgumentParser(description="View the RTP UDP stream sent by sender.py")
+    parser.add_argument("--codec", choices=sorted(CODECS) + ["auto"], default="mjpeg",
+                        help="must match sender.py --codec; auto detects it from the first packet")
+    parser.add_argument("--metrics-port", type=int, default=9102, help="local Prometheus endpoint, 0 to disable")
+    parser.add_argument("--metrics-csv", help="write a metrics CSV here on exit")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="RTP port; RTCP uses port + 1, and port + 5 on the sender")
+    parser.add_argument("--rtcp-host", help="send RTCP receiver reports to this sender (for sender.py --adaptive)")
+    add_replay_arguments(parser)
+    add_transport_arguments(parser)
+    args, qt_args = parser.parse_known_args()
+    if args.nack and not args.rtcp_host:
+        parser.error("--nack needs --rtcp-host to send the retransmission requests to")
+    replay = replay_from_args(args)
+    if replay:
+        codec = None
+    elif args.codec == "auto":
+        codec = probe_codec(args.port)
+        if codec is None:
+            sys.exit(f"No RTP stream on port {args.port} to detect the codec from; pass --codec explicitly.")
+        print(f"Detected {codec.name} stream")
+    else:
+        codec = get_codec(args.codec)
+    app = QApplication(sys.argv[:1] + qt_args)
+    engine = Engine("receiver", codec, args.metrics_port, args.metrics_csv, replay)
+    window = GstViewer(engine, args.rtcp_host, transport_from_args(args), args.port)
     window.show()
     sys.exit(app.exec_())
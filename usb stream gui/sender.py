@@ -1,28 +1,147 @@
 import gi
 import sys
+import os
+import argparse
 
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
-def launch_camera():
-    Gst.init(None)
-    pipeline = Gst.parse_launch(
-        "v4l2src device=/dev/video0 ! videoconvert ! video/x-raw,format=I420,width=640,height=480 ! jpegenc ! rtpjpegpay ! udpsink host=127.0.0.1 port=5000"
+# Shared helpers live at the repository root, next to layout.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stream_metrics import CaptureProbe, MetricsRegistry, StageProbe, TimestampBeaconSender, start_metrics_server
+from adaptive_rate import AdaptiveRateController, build_ladder
+from pipelines import CODECS, DEFAULT_PORT, EncoderSettings, get_codec, rtpbin_sender, udp_sender
+from camera_devices import capture_source
+from resilient_transport import ResilientSender, add_transport_arguments, transport_from_args
+
+def adaptive_source(level, source):
+    """``source`` followed by scale/rate caps (ratecaps) that apply_level() adjusts at runtime."""
+    return (
+        f"{source} ! videoscale ! videorate drop-only=true ! "
+        f"capsfilter name=ratecaps caps=video/x-raw,format=I420,width={level.width},height={level.height},framerate={level.fps}/1"
+    )
+
+def read_receiver_report(rtpbin):
+    """(report id, loss fraction, jitter seconds) from the latest RTCP RR about our stream, or None."""
+    session = rtpbin.emit("get-internal-session", 0)
+    if session is None:
+        return None
+    source_stats = session.get_property("stats").get_value("source-stats")
+    for stats in getattr(source_stats, "values", source_stats) or []:
+        if not (stats.get_value("internal") and stats.get_value("have-rb")):
+            continue
+        report_id = (stats.get_value("rb-lsr"), stats.get_value("rb-exthighestseq"))
+        loss = stats.get_value("rb-fractionlost") / 256.0
+        jitter = stats.get_value("rb-jitter") / 90000.0  # RTP video clock rate
+        return report_id, loss, jitter
+    return None
+
+def apply_level(pipeline, codec, settings, level):
+    codec.apply_quality(pipeline.get_by_name("encoder"), level.quality, settings)
+    caps = Gst.Caps.from_string(
+        f"video/x-raw,format=I420,width={level.width},height={level.height},framerate={level.fps}/1"
     )
+    pipeline.get_by_name("ratecaps").set_property("caps", caps)
+
+def launch_camera(host="127.0.0.1", metrics_port=9101, metrics_csv=None, controller=None,
+                  codec=None, settings=None, transport=None, port=DEFAULT_PORT, device="/dev/video0",
+                  test_source=None, passthrough="auto"):
+    Gst.init(None)
+    codec = codec or get_codec("mjpeg")
+    settings = settings or EncoderSettings()
+    if controller:
+        # Quality and scaling are adjusted on the encoder, so the adaptive sender always encodes
+        settings.quality = controller.level.quality
+        top = controller.ladder[0]
+        source, _ = capture_source(codec, device, top.width, top.height, test_source=test_source, passthrough="never")
+        pipeline = Gst.parse_launch(rtpbin_sender(codec, settings, host, port,
+                                                  source=adaptive_source(controller.level, source)))
+    else:
+        source, encoded = capture_source(codec, device, test_source=test_source, passthrough=passthrough)
+        sender = rtpbin_sender if transport else udp_sender
+        pipeline = Gst.parse_launch(sender(codec, settings, host, port, source=source, passthrough=encoded))
+    if transport:
+        # FEC and retransmission hook into rtpbin, so they combine with --adaptive
+        ResilientSender(codec, transport).attach(pipeline.get_by_name("rtpbin"))
+
+    metrics = MetricsRegistry("sender")
+    CaptureProbe(pipeline.get_by_name("camera"), metrics)
+    if pipeline.get_by_name("encoder"):  # not there when passing camera MJPEG through
+        StageProbe(pipeline.get_by_name("encoder"), "encode", metrics)
+    StageProbe(pipeline.get_by_name("pay"), "payload", metrics)
+    TimestampBeaconSender(pipeline.get_by_name("pay"), host)
+    if metrics_port:
+        start_metrics_server(metrics, metrics_port)
+
     pipeline.set_state(Gst.State.PLAYING)
-    
+
     try:
         bus = pipeline.get_bus()
         msg = None
+        last_report = None
         while True:
-            msg = bus.timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.ERROR | Gst.MessageType.EOS)
+            # Wake up once a second to look at RTCP when adapting
+            timeout = Gst.SECOND if controller else Gst.CLOCK_TIME_NONE
+            msg = bus.timed_pop_filtered(timeout, Gst.MessageType.ERROR | Gst.MessageType.EOS)
             if msg:
                 break
+            if controller:
+                report = read_receiver_report(pipeline.get_by_name("rtpbin"))
+                if report is None or report[0] == last_report:
+                    continue
+                last_report, loss, jitter = report
+                metrics.set_gauge("rtcp_fraction_lost", loss)
+                metrics.set_gauge("rtcp_jitter_seconds", jitter)
+                change = controller.update(loss, jitter)
+                if change:
+                    level, reason = change
+                    print(f"Adaptive rate: switching to {level} ({reason})")
+                    apply_level(pipeline, codec, settings, level)
+                    metrics.set_gauge("rate_level", controller.index)
     except KeyboardInterrupt:
         pass
     finally:
         pipeline.set_state(Gst.State.NULL)
+        if metrics_csv:
+            metrics.write_csv(metrics_csv)
         print("Camera stream stopped.")
 
+def parse_resolutions(text):
+    return [tuple(int(v) for v in item.split("x")) for item in text.split(",")]
+
 if __name__ == "__main__":
-    launch_camera()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Stream /dev/video0 as RTP over UDP")
+    parser.add_argument("--host", default="127.0.0.1", help="receiver address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="receiver RTP port (e.g. a lossy_relay.py in between); RTCP goes to port + 1 and comes back on port + 5")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="mjpeg")
+    parser.add_argument("--device", default="/dev/video0", help="camera to stream")
+    parser.add_argument("--test-source", nargs="?", const="raw", choices=["raw", "mjpeg"],
+                        help="stream videotestsrc instead of a camera; mjpeg fakes a camera that outputs JPEG")
+    parser.add_argument("--passthrough", choices=["auto", "always", "never"], default="auto",
+                        help="send the camera's own MJPEG frames without re-encoding (auto: when it offers them)")
+    parser.add_argument("--bitrate", type=int, default=2000, help="kbit/s (H.264/H.265)")
+    parser.add_argument("--keyframe-interval", type=int, default=30, help="frames (H.264/H.265)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality (MJPEG)")
+    parser.add_argument("--metrics-port", type=int, default=9101, help="local Prometheus endpoint, 0 to disable")
+    parser.add_argument("--metrics-csv", help="write a metrics CSV here on exit")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adapt quality/bitrate, fps and resolution to RTCP receiver reports "
+                             "(run receiver.py with --rtcp-host)")
+    parser.add_argument("--resolutions", default="640x480,480x360,320x240", help="largest first")
+    parser.add_argument("--min-fps", type=int, default=10)
+    parser.add_argument("--max-fps", type=int, default=30)
+    parser.add_argument("--min-quality", type=int, default=30, help="JPEG quality, or %% of --bitrate for H.264/H.265")
+    parser.add_argument("--max-quality", type=int, default=85)
+    add_transport_arguments(parser, sender=True)
+    args = parser.parse_args()
+    if args.adaptive and args.passthrough == "always":
+        parser.error("--adaptive re-encodes at each level; it cannot be combined with --passthrough always")
+
+    controller = None
+    if args.adaptive:
+        ladder = build_ladder(parse_resolutions(args.resolutions), args.min_fps, args.max_fps,
+                              args.min_quality, args.max_quality)
+        controller = AdaptiveRateController(ladder)
+    settings = EncoderSettings(args.bitrate, args.keyframe_interval, args.quality)
+    launch_camera(args.host, args.metrics_port, args.metrics_csv, controller, get_codec(args.codec), settings,
+                  transport_from_args(args), args.port, args.device, args.test_source, args.passthrough)